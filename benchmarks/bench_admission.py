@@ -0,0 +1,102 @@
+"""
+Latencia de las rutas críticas mientras varios clientes lanzan escaneos de analíticas.
+
+Con Firestore simulado con latencia de red, ``--heavy`` clientes piden sin parar
+``/cancellation-time-stats`` y ``/screen-analytics`` mientras ``--critical``
+clientes piden ``/restaurants`` y ``/products/{id}``. Se corre con y sin control
+de admisión y se reporta la latencia de las rutas críticas y cuántos escaneos se
+atendieron o se descartaron.
+
+    python benchmarks/bench_admission.py --docs 5000 --heavy 60 --critical 10 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Los clientes se distinguen por X-Forwarded-For: la conexión del cliente ASGI hace de proxy de confianza
+os.environ.setdefault("ADMISSION_TRUSTED_PROXIES", "127.0.0.1")
+
+from fake_firestore import FakeAuth, FakeFirestore  # noqa: E402
+from run_benchmark import load_app  # noqa: E402
+from seed import seed  # noqa: E402
+
+HEAVY_PATHS = ["/cancellation-time-stats", "/screen-analytics"]
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def run(app, args, product_id):
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://bench"
+    )
+    deadline = time.perf_counter() + args.seconds
+    critical_latencies = []
+    critical_statuses = Counter()
+    heavy_statuses = Counter()
+
+    async def heavy_client(i):
+        headers = {"X-Forwarded-For": f"10.0.0.{i}"}
+        while time.perf_counter() < deadline:
+            response = await client.get(HEAVY_PATHS[i % len(HEAVY_PATHS)], headers=headers)
+            heavy_statuses[response.status_code] += 1
+            if response.status_code in (429, 503):
+                await asyncio.sleep(0.05)
+
+    async def critical_client(i):
+        paths = ["/restaurants", f"/products/{product_id}"]
+        n = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(paths[n % 2])
+            critical_latencies.append((time.perf_counter() - start) * 1000)
+            critical_statuses[response.status_code] += 1
+            n += 1
+
+    await asyncio.gather(
+        *(heavy_client(i) for i in range(args.heavy)),
+        *(critical_client(i) for i in range(args.critical)),
+    )
+    await client.aclose()
+    return critical_latencies, critical_statuses, heavy_statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--heavy", type=int, default=60, help="Clientes pidiendo escaneos de analíticas")
+    parser.add_argument("--critical", type=int, default=10, help="Clientes pidiendo rutas críticas")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--latency", type=float, default=0.005, help="Segundos por RPC a Firestore")
+    parser.add_argument("--document-latency", type=float, default=0.00002, help="Segundos por documento leído")
+    args = parser.parse_args()
+
+    db = FakeFirestore(latency=args.latency, document_latency=args.document_latency)
+    info = seed(db, docs=args.docs)
+    product_id = info["restaurant"]["products"][0]["productId"]
+    load_app(db, FakeAuth())
+    from app.main import create_app
+
+    for label, enabled in (("sin control de admisión", "0"), ("con control de admisión", "1")):
+        os.environ["ADMISSION_CONTROL"] = enabled
+        latencies, critical, heavy = asyncio.run(run(create_app(), args, product_id))
+        print(f"{label}:")
+        print(f"  críticas: {len(latencies)} requests, p50 {statistics.median(latencies):.1f} ms, "
+              f"p99 {_percentile(latencies, 0.99):.1f} ms, estados {dict(critical)}")
+        print(f"  escaneos: estados {dict(heavy)}")
+
+
+if __name__ == "__main__":
+    main()
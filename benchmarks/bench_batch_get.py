@@ -0,0 +1,70 @@
+"""
+N requests de a un id frente a un solo request con ``?ids=`` para usuarios y productos.
+
+Firestore simulado con latencia de red (``--latency`` por RPC). Reporta tiempo
+total y RPCs a Firestore para resolver ``--ids`` usuarios y productos, como lo
+hace la app al mostrar un historial de pedidos.
+
+    python benchmarks/bench_batch_get.py --ids 50 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_firestore import FakeAuth, FakeFirestore  # noqa: E402
+from run_benchmark import load_app  # noqa: E402
+from seed import seed  # noqa: E402
+
+
+async def measure(client, db, requests):
+    before = db.stats.snapshot()["rpcs"]
+    started = time.perf_counter()
+    for path, params in requests:
+        # /users/{id} hace la lectura aunque luego falle al registrar el evento; el costo es comparable
+        await client.get(path, params=params)
+    return (time.perf_counter() - started) * 1000, db.stats.snapshot()["rpcs"] - before
+
+
+async def run(args):
+    db = FakeFirestore(latency=args.latency)
+    info = seed(db, docs=args.docs)
+    app = load_app(db, FakeAuth())
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://bench")
+    restaurants = info["counts"]["retaurants"]
+
+    for n in args.ids:
+        user_ids = [f"user{i}" for i in range(n)]
+        product_ids = [str(i % restaurants + 1) for i in range(n)]
+        cases = [
+            ("usuarios", [(f"/users/{uid}", None) for uid in user_ids], [("/users", {"ids": ",".join(user_ids)})]),
+            ("productos", [(f"/products/{pid}", None) for pid in product_ids],
+             [("/products", {"ids": ",".join(product_ids)})]),
+        ]
+        for label, single, batch in cases:
+            await client.get(batch[0][0], params=batch[0][1])  # calienta el caché del catálogo
+            single_ms, single_rpcs = await measure(client, db, single)
+            batch_ms, batch_rpcs = await measure(client, db, batch)
+            print(f"{n:>4} {label:<9} uno por uno: {single_ms:8.1f} ms, {single_rpcs:>4} RPCs | "
+                  f"?ids=: {batch_ms:7.1f} ms, {batch_rpcs:>3} RPCs")
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--ids", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--latency", type=float, default=0.005, help="Segundos por RPC a Firestore")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
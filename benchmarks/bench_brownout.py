@@ -0,0 +1,223 @@
+"""
+Latencia y respuestas durante una caída parcial de Firestore, con y sin deadlines/circuit breaker.
+
+Clientes concurrentes piden en bucle una mezcla de lecturas (catálogo,
+analíticas) y pedidos (``POST /order``) en tres fases: normal, caída (cada
+llamada a Firestore tarda ``--brownout-latency`` s de más y una fracción
+``--error-rate`` falla con ``Unavailable``) y recuperación. Cada modo corre en
+un proceso aparte porque la configuración se lee al importar:
+
+* ``sin protección``: ``FIRESTORE_GUARD=0``, como antes de este cambio.
+* ``con protección``: deadlines, circuit breaker y respaldo de los GET. Los
+  tiempos están escalados para que la corrida dure segundos (ver ``MODES``).
+
+Reporta por fase (la del inicio de cada request) p50/p99/máximo y cuántas
+respuestas fueron 200 frescas, 200 de respaldo (``X-Cache-Status: stale``), 503
+u otros errores. En la recuperación los circuitos siguen abiertos hasta
+``FIRESTORE_BREAKER_RESET`` y mientras tanto se sirve el respaldo.
+
+En el modo con protección verifica, y termina con error si no se cumple:
+
+* p99 de la caída menor o igual a ``FIRESTORE_REQUEST_DEADLINE`` más ``--slack``.
+* Ningún 5xx distinto de 503 en ninguna fase, y todos los 503 con ``Retry-After``.
+* Las respuestas de respaldo llevan la marca: cada respuesta marcada trae
+  también ``Age``, hubo respaldos durante la caída, ninguno en la fase normal, y
+  el cliente vio marcadas al menos tantas respuestas como respaldos entregó el
+  middleware (``backend_fallback_responses_total{kind="stale"}`` en ``/metrics``).
+
+    python benchmarks/bench_brownout.py --clients 32 --brownout 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+MODES = {
+    "sin protección": {"FIRESTORE_GUARD": "0"},
+    "con protección": {
+        "FIRESTORE_GUARD": "1",
+        "FIRESTORE_CALL_TIMEOUT": "0.5",
+        "FIRESTORE_STREAM_TIMEOUT": "1",
+        "FIRESTORE_REQUEST_DEADLINE": "2",
+        "FIRESTORE_BREAKER_FAILURES": "5",
+        "FIRESTORE_BREAKER_RESET": "2",
+    },
+}
+PHASES = ("normal", "caída", "recuperación")
+
+
+def requests_mix(info):
+    restaurant = info["restaurant"]
+    product = restaurant["products"][0]
+    return [
+        ("GET", "/restaurants", {}),
+        ("GET", f"/restaurants/type/{restaurant['type']}", {}),
+        ("GET", f"/products/{product['productId']}", {}),
+        ("GET", f"/orders/{info['user_id']}", {}),
+        ("GET", "/features-usage", {}),
+        ("GET", "/top-products", {}),
+        ("GET", "/analytics/most-liked-restaurants", {}),
+        ("POST", "/order", {"json": {"product_id": product["productId"], "quantity": 1}}),
+    ]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_mode(args):
+    import httpx
+
+    from fake_firestore import FakeAuth, FakeFirestore
+    from run_benchmark import load_app
+    from seed import seed
+
+    db = FakeFirestore(latency=args.latency)
+    info = seed(db, docs=args.docs)
+    app = load_app(db, FakeAuth())
+    from routes import user_routes
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    mix = requests_mix(info)
+    samples = []  # (fase, método, status, stale, ms, con Age o Retry-After)
+    phase = {"name": PHASES[0]}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Una pasada para llenar los cachés y el respaldo de cada GET
+        for method, path, kwargs in mix:
+            await client.request(method, path, **kwargs)
+
+        async def worker(offset):
+            i = offset
+            while phase["name"] is not None:
+                method, path, kwargs = mix[i % len(mix)]
+                i += 1
+                current = phase["name"]
+                started = time.perf_counter()
+                response = await client.request(method, path, **kwargs)
+                # Los que empezaron justo antes de la caída la sufren: cuentan en ella
+                if current == PHASES[0] and phase["name"] is not None:
+                    current = phase["name"]
+                stale = response.headers.get("x-cache-status") == "stale"
+                # Una respuesta marcada debe decir su antigüedad y un 503 cuándo reintentar
+                complete = (("age" in response.headers) if stale else
+                            ("retry-after" in response.headers) if response.status_code == 503 else True)
+                samples.append((current, method, response.status_code, stale,
+                                (time.perf_counter() - started) * 1000, complete))
+
+        workers = [asyncio.create_task(worker(i)) for i in range(args.clients)]
+        await asyncio.sleep(args.normal)
+        phase["name"] = PHASES[1]
+        db.inject(latency=args.brownout_latency, error_rate=args.error_rate)
+        # El catálogo vence en medio de la caída, como pasaría con su TTL
+        user_routes.catalog.invalidate()
+        await asyncio.sleep(args.brownout)
+        phase["name"] = PHASES[2]
+        db.clear_faults()
+        await asyncio.sleep(args.recovery)
+        phase["name"] = None
+        await asyncio.gather(*workers)
+        metrics = (await client.get("/metrics")).text
+
+    fallbacks = {}
+    for line in metrics.splitlines():
+        if line.startswith("backend_fallback_responses_total{"):
+            kind = line.split('kind="', 1)[1].split('"', 1)[0]
+            fallbacks[kind] = float(line.rsplit(" ", 1)[1])
+
+    result = {}
+    for name in PHASES:
+        rows = [s for s in samples if s[0] == name]
+        latencies = [s[4] for s in rows]
+        result[name] = {
+            "requests": len(rows),
+            "p50": percentile(latencies, 0.50),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=0.0),
+            "fresh": sum(1 for s in rows if s[2] == 200 and not s[3]),
+            "stale": sum(1 for s in rows if s[2] == 200 and s[3]),
+            "unavailable": sum(1 for s in rows if s[2] == 503),
+            "errors": sum(1 for s in rows if s[2] >= 500 and s[2] != 503),
+            "incomplete": sum(1 for s in rows if not s[5]),
+        }
+    result["fallbacks"] = fallbacks
+    return result
+
+
+def check(result, args):
+    """Fallas de las garantías del modo con protección (lista vacía si se cumplen)."""
+    failures = []
+    limit = float(MODES["con protección"]["FIRESTORE_REQUEST_DEADLINE"]) * 1000 + args.slack * 1000
+    brownout = result[PHASES[1]]
+    if brownout["p99"] > limit:
+        failures.append(f"p99 de la caída {brownout['p99']:.1f} ms > {limit:.0f} ms (deadline + holgura)")
+    for name in PHASES:
+        if result[name]["errors"]:
+            failures.append(f"{result[name]['errors']} respuestas 5xx distintas de 503 en la fase {name}")
+        if result[name]["incomplete"]:
+            failures.append(f"{result[name]['incomplete']} respuestas de respaldo sin Age o 503 sin Retry-After "
+                            f"en la fase {name}")
+    if result[PHASES[0]]["stale"]:
+        failures.append(f"{result[PHASES[0]]['stale']} respuestas marcadas como respaldo en la fase normal")
+    if not brownout["stale"]:
+        failures.append("ninguna respuesta de respaldo durante la caída: el escenario no ejercita el respaldo")
+    marked = sum(result[name]["stale"] for name in PHASES)
+    served = result["fallbacks"].get("stale", 0)
+    if marked < served:
+        failures.append(f"el middleware entregó {served:.0f} respaldos pero el cliente vio {marked} marcados")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.005, help="latencia normal por RPC (s)")
+    parser.add_argument("--brownout-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    parser.add_argument("--normal", type=float, default=3.0, help="duración de cada fase (s)")
+    parser.add_argument("--brownout", type=float, default=8.0)
+    parser.add_argument("--recovery", type=float, default=6.0)
+    parser.add_argument("--slack", type=float, default=0.5, help="holgura sobre el deadline para el p99 (s)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return
+
+    failures = []
+    for mode, env in MODES.items():
+        output = subprocess.run(
+            [sys.executable, __file__, "--child"] + sys.argv[1:],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(mode)
+        for name in PHASES:
+            r = result[name]
+            print(f"  {name:<13} {r['requests']:>6} req | p50 {r['p50']:8.1f} ms  p99 {r['p99']:8.1f} ms  "
+                  f"máx {r['max']:8.1f} ms | 200 {r['fresh']:>5}  respaldo {r['stale']:>5}  "
+                  f"503 {r['unavailable']:>5}  otros 5xx {r['errors']:>5}")
+        if mode == "con protección":
+            failures = check(result, args)
+
+    for failure in failures:
+        print(f"FALLA  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK  con protección: p99 acotado por el deadline, solo 503 como 5xx y respaldos marcados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Tiempo de entrenamiento del pronóstico de demanda para miles de productos.
+
+Genera demanda diaria sintética (nivel por producto, estacionalidad semanal y
+ruido de Poisson), entrena el modelo de ``services/forecast.py`` sobre todos los
+productos en una sola pasada y reporta el tiempo y el error frente a la última
+semana, que se deja fuera del entrenamiento.
+
+    python benchmarks/bench_forecast.py --products 1000 5000 --days 180
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from services.forecast import train_and_forecast  # noqa: E402
+
+HORIZON = 7
+
+
+def synthetic_demand(products, days, seed=43):
+    rng = np.random.default_rng(seed)
+    level = rng.gamma(2.0, 5.0, size=(products, 1))
+    weekly = 1 + 0.4 * np.sin(2 * np.pi * (np.arange(days) + rng.integers(0, 7, size=(products, 1))) / 7)
+    trend = 1 + rng.normal(0, 0.002, size=(products, 1)) * np.arange(days)
+    return rng.poisson(np.clip(level * weekly * trend, 0, None)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--days", type=int, default=180)
+    args = parser.parse_args()
+
+    for products in args.products:
+        matrix = synthetic_demand(products, args.days + HORIZON)
+        history, actual = matrix[:, :-HORIZON], matrix[:, -HORIZON:]
+        dates = [date.today() - timedelta(days=args.days - i) for i in range(args.days)]
+
+        started = time.perf_counter()
+        forecast, _ = train_and_forecast(history, dates, HORIZON)
+        elapsed = time.perf_counter() - started
+
+        mae = float(np.abs(forecast - actual).mean())
+        naive = float(np.abs(history[:, -7:] - actual).mean())
+        print(f"{products:>6} productos x {args.days} días: {elapsed:.2f} s, "
+              f"MAE {mae:.2f} (semana anterior: {naive:.2f})")
+
+
+if __name__ == "__main__":
+    main()
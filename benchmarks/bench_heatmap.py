@@ -0,0 +1,60 @@
+"""
+Histograma día x hora: conversión por fila frente al motor vectorizado.
+
+"por fila" reproduce lo que hacían las rutas (``fromisoformat``/``strftime`` por
+documento y ``defaultdict``); "vectorizado" es ``services/heatmap.py`` con
+conversión a America/Bogota incluida. Solo mide CPU: los timestamps ya están en
+memoria.
+
+    python benchmarks/bench_heatmap.py --rows 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from services.heatmap import histogram, local_datetimes  # noqa: E402
+
+
+def per_row(values):
+    counts = defaultdict(int)
+    for value in values:
+        moment = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+        counts[(moment.strftime("%A"), moment.hour)] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    rng = random.Random(43)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for rows in args.rows:
+        moments = [start + timedelta(seconds=rng.randint(0, 180 * 86400)) for _ in range(rows)]
+        cases = [
+            ("Timestamp de Firestore", moments),
+            ("texto ISO sin zona", [moment.replace(tzinfo=None).isoformat() for moment in moments]),
+        ]
+        for label, values in cases:
+            started = time.perf_counter()
+            per_row(values)
+            before = time.perf_counter() - started
+
+            started = time.perf_counter()
+            heat = histogram(local_datetimes(values))
+            after = time.perf_counter() - started
+            assert heat.total == rows
+            print(f"{rows:>8} filas, {label:<22} por fila: {before * 1000:8.1f} ms | "
+                  f"vectorizado: {after * 1000:7.1f} ms ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
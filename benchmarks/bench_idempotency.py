@@ -0,0 +1,301 @@
+"""
+Pedidos duplicados con y sin ``Idempotency-Key``.
+
+Simula un cliente móvil que reintenta: ``--duplicates`` requests concurrentes
+idénticos a ``POST /order`` y a ``GET /order/.../decrease-stock/...`` contra
+un Firestore con latencia. Sin clave cada reintento descuenta stock (y en
+decrease-stock agrega otra orden a ``orders/{uid}``); con la misma clave solo
+uno se ejecuta y los demás reciben su respuesta con ``Idempotent-Replayed``.
+Los descuentos concurrentes sin clave se pisan entre sí (leer y escribir el
+stock no es atómico), así que lo que muestra cuántas veces corrió el pedido son
+las escrituras, las respuestas distintas y las órdenes nuevas del usuario.
+También revisa que reusar la clave con otros parámetros responda 422.
+
+Con el almacén de Firestore además simula ``--duplicates`` workers (cada uno
+con su propio ``IdempotencyCache`` sobre la misma base) que reciben el mismo
+pedido a la vez, con la clave libre y con un registro vencido que todos
+intentan tomar.
+
+También hace fallar el guardado de la respuesta después de descontar el
+stock, unas veces y hasta que el almacén se recupera: los reintentos con la
+misma clave no deben volver a descontar.
+
+Termina con error si con la misma clave el pedido se ejecuta más de una vez
+(más de un descuento de stock o de una orden nueva), si los duplicados no
+llevan ``Idempotent-Replayed`` o si la clave reusada no responde 422.
+
+Cada almacén corre en un proceso aparte porque se elige al importar
+(``IDEMPOTENCY_BACKEND``):
+
+    python benchmarks/bench_idempotency.py --duplicates 20 --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+BACKENDS = ("memory", "firestore")
+
+
+def stock(db, restaurant_id):
+    return db._collections["retaurants"][restaurant_id]["products"][0]["amount"]
+
+
+def user_orders(db, uid):
+    return len(db._collections.get("orders", {}).get(uid, {}).get("orders", []))
+
+
+async def burst(client, n, method, path, key=None, **kwargs):
+    headers = {"Idempotency-Key": key} if key else {}
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.request(method, path, headers=headers, **kwargs) for _ in range(n)))
+    elapsed = (time.perf_counter() - started) * 1000
+    bodies = {json.dumps(r.json(), sort_keys=True) for r in responses if r.status_code == 200}
+    return {
+        "ok": sum(1 for r in responses if r.status_code == 200),
+        "replayed": sum(1 for r in responses if r.headers.get("idempotent-replayed") == "true"),
+        "distinct_bodies": len(bodies),
+        "statuses": sorted({r.status_code for r in responses}),
+        "ms": elapsed,
+    }
+
+
+def workers_burst(db, n, restaurant_id, product, key, expired=False):
+    """``n`` workers con su propio caché y el mismo almacén de Firestore piden a la vez con la misma clave."""
+    from fastapi import Response
+
+    from routes.user_routes import place_order
+    from services.idempotency import PENDING, FirestoreIdempotencyStore, IdempotencyCache, fingerprint
+
+    signature = fingerprint(product["productId"], 1)
+    if expired:
+        # Reserva de un worker que se cayó hace rato: la clave está libre para el primero que la tome
+        expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        FirestoreIdempotencyStore(db)._ref(f"order:{key}").set(
+            {"fingerprint": signature, "state": PENDING, "expires_at": expires_at})
+    caches = [IdempotencyCache(FirestoreIdempotencyStore(db)) for _ in range(n)]
+    barrier = threading.Barrier(n)
+    outcomes = [None] * n
+
+    def worker(i):
+        response = Response()
+        barrier.wait()
+        try:
+            body = caches[i].run("order", key, signature, lambda: place_order(product["productId"], 1), response)
+            outcomes[i] = (200, response.headers.get("idempotent-replayed") == "true", json.dumps(body, sort_keys=True))
+        except Exception as e:
+            outcomes[i] = (getattr(e, "status_code", 500), False, None)
+
+    before_stock, before_writes = stock(db, restaurant_id), db.stats.snapshot()["writes"]
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "ok": sum(1 for status, _, _ in outcomes if status == 200),
+        "replayed": sum(1 for _, replayed, _ in outcomes if replayed),
+        "distinct_bodies": len({body for status, _, body in outcomes if status == 200}),
+        "statuses": sorted({status for status, _, _ in outcomes}),
+        "executed": sum(cache.stats["executed"] for cache in caches),
+        "stock_decrements": before_stock - stock(db, restaurant_id),
+        "new_user_orders": 0,
+        "writes": db.stats.snapshot()["writes"] - before_writes,
+        "ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+class FailingStore:
+    """Almacén que falla al guardar las primeras ``failures`` respuestas (None: hasta ``heal()``)."""
+
+    def __init__(self, store, failures=None):
+        self._store = store
+        self.ttl = store.ttl
+        self.failures = failures
+        self.failed = 0
+
+    def heal(self):
+        self.failures = self.failed
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+    def complete(self, key, signature, status_code, body):
+        if self.failures is None or self.failed < self.failures:
+            self.failed += 1
+            raise RuntimeError("Firestore no disponible")
+        self._store.complete(key, signature, status_code, body)
+
+
+def failing_complete(db, restaurant_id, product, key, failures):
+    """Guardar la respuesta falla después de descontar el stock; los reintentos no deben ejecutar otra vez."""
+    from fastapi import Response
+
+    from routes.user_routes import place_order
+    from services.idempotency import DONE, IdempotencyCache, default_store, fingerprint
+
+    store = FailingStore(default_store(db), failures)
+    cache = IdempotencyCache(store)
+    signature = fingerprint(product["productId"], 1)
+    before_stock, before_writes = stock(db, restaurant_id), db.stats.snapshot()["writes"]
+    started = time.perf_counter()
+    outcomes = []
+    for attempt in range(3):
+        if attempt == 2:
+            store.heal()
+        response = Response()
+        try:
+            body = cache.run("order", key, signature, lambda: place_order(product["productId"], 1), response)
+            outcomes.append((200, response.headers.get("idempotent-replayed") == "true", json.dumps(body, sort_keys=True)))
+        except Exception as e:
+            outcomes.append((getattr(e, "status_code", 500), False, None))
+    saved = store.get(f"order:{key}")
+    return {
+        "ok": sum(1 for status, _, _ in outcomes if status == 200),
+        "replayed": sum(1 for _, replayed, _ in outcomes if replayed),
+        "distinct_bodies": len({body for status, _, body in outcomes if status == 200}),
+        "statuses": sorted({status for status, _, _ in outcomes}),
+        "executed": cache.stats["executed"],
+        "stock_decrements": before_stock - stock(db, restaurant_id),
+        "new_user_orders": 0,
+        "writes": db.stats.snapshot()["writes"] - before_writes,
+        "ms": (time.perf_counter() - started) * 1000,
+        "requests": len(outcomes),
+        "saved": saved is not None and saved["state"] == DONE,
+    }
+
+
+async def run_backend(args):
+    import httpx
+
+    from fake_firestore import FakeAuth, FakeFirestore
+    from run_benchmark import load_app
+    from seed import seed
+
+    db = FakeFirestore(latency=args.latency)
+    info = seed(db, docs=args.docs)
+    app = load_app(db, FakeAuth())
+
+    restaurant = info["restaurant"]
+    product = restaurant["products"][0]
+    restaurant_id = next(doc_id for doc_id, data in db._collections["retaurants"].items()
+                         if data["name"] == restaurant["name"])
+    # Stock de sobra para que ningún request falle por falta de unidades
+    db._collections["retaurants"][restaurant_id]["products"][0].update(amount=10 ** 6, available=True)
+    uid = info["user_id"]
+    order = ("POST", "/order", {"json": {"product_id": product["productId"], "quantity": 1}})
+    decrease = ("GET", f"/order/{restaurant['name']}/decrease-stock/{product['productName']}/"
+                       f"{product.get('price', 0)}/{uid}", {})
+
+    result = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, (method, path, kwargs) in (("order", order), ("decrease-stock", decrease)):
+            for label, key in (("sin clave", None), ("misma clave", f"{name}-retry-1")):
+                before_stock, before_orders, before_writes = stock(db, restaurant_id), user_orders(db, uid), \
+                    db.stats.snapshot()["writes"]
+                r = await burst(client, args.duplicates, method, path, key, **kwargs)
+                r["stock_decrements"] = before_stock - stock(db, restaurant_id)
+                r["new_user_orders"] = user_orders(db, uid) - before_orders
+                r["writes"] = db.stats.snapshot()["writes"] - before_writes
+                result[f"{name} {label}"] = r
+
+        # Un reintento tardío (después de terminar el primero) también se responde desde el almacén
+        before_stock = stock(db, restaurant_id)
+        late = await client.request(order[0], order[1], headers={"Idempotency-Key": "order-retry-1"}, **order[2])
+        result["reintento tardío"] = {"status": late.status_code,
+                                      "replayed": late.headers.get("idempotent-replayed") == "true",
+                                      "stock_decrements": before_stock - stock(db, restaurant_id)}
+        mismatch = await client.post("/order", headers={"Idempotency-Key": "order-retry-1"},
+                                     json={"product_id": product["productId"], "quantity": 2})
+        result["clave con otros parámetros"] = {"status": mismatch.status_code}
+
+    # Guardar la respuesta falla un par de veces (se reintenta) o hasta que el almacén se recupera
+    for label, failures in (("guardado falla 2 veces", 2), ("guardado sigue fallando", None)):
+        result[f"{label} misma clave"] = await asyncio.to_thread(
+            failing_complete, db, restaurant_id, product, label.replace(" ", "-"), failures)
+
+    if os.getenv("IDEMPOTENCY_BACKEND") == "firestore":
+        for label, expired in (("workers misma clave", False), ("workers clave vencida", True)):
+            result[label] = await asyncio.to_thread(
+                workers_burst, db, args.duplicates, restaurant_id, product, label.replace(" ", "-"), expired)
+    return result
+
+
+def check(result, n):
+    """Fallas de las garantías con la misma clave (lista vacía si se cumplen)."""
+    failures = []
+    for name, r in result.items():
+        if "misma clave" not in name and "vencida" not in name:
+            continue
+        requests = r.get("requests", n)
+        if r["ok"] != requests:
+            failures.append(f"{name}: {r['ok']} de {requests} respuestas 200 (estados {r['statuses']})")
+        if r["stock_decrements"] != 1:
+            failures.append(f"{name}: el stock bajó {r['stock_decrements']} veces, debía bajar una")
+        if name.startswith("decrease-stock") and r["new_user_orders"] != 1:
+            failures.append(f"{name}: {r['new_user_orders']} órdenes nuevas del usuario, debía ser una")
+        if r.get("executed", 1) != 1:
+            failures.append(f"{name}: el pedido se ejecutó {r['executed']} veces")
+        if r["replayed"] != requests - 1:
+            failures.append(f"{name}: {r['replayed']} duplicados con Idempotent-Replayed, debían ser {requests - 1}")
+        if r["distinct_bodies"] > 1:
+            failures.append(f"{name}: {r['distinct_bodies']} respuestas distintas para la misma clave")
+        if r.get("saved") is False:
+            failures.append(f"{name}: la respuesta no quedó guardada cuando el almacén se recuperó")
+    late = result["reintento tardío"]
+    if late["status"] != 200 or not late["replayed"] or late["stock_decrements"]:
+        failures.append(f"reintento tardío: {late}")
+    if result["clave con otros parámetros"]["status"] != 422:
+        failures.append(f"clave con otros parámetros: {result['clave con otros parámetros']['status']}, debía ser 422")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--duplicates", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="latencia por RPC (s)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_backend(args))))
+        return
+
+    failures = []
+    for backend in BACKENDS:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child"] + sys.argv[1:],
+            env={**os.environ, "IDEMPOTENCY_BACKEND": backend}, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"almacén {backend}")
+        for name, r in result.items():
+            if "ok" in r:
+                print(f"  {name:<28} 200 {r['ok']:>3}  repetidos {r['replayed']:>3}  "
+                      f"respuestas distintas {r['distinct_bodies']:>3}  stock -{r['stock_decrements']:<3} "
+                      f"órdenes +{r['new_user_orders']:<3} escrituras {r['writes']:>3}  {r['ms']:7.1f} ms")
+            else:
+                print(f"  {name:<28} {r}")
+        failures += [f"almacén {backend}, {failure}" for failure in check(result, args.duplicates)]
+
+    for failure in failures:
+        print(f"FALLA  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK  con la misma clave cada pedido se ejecutó una vez y los duplicados se respondieron como repetidos")
+
+
+if __name__ == "__main__":
+    main()
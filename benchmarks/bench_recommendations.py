@@ -0,0 +1,94 @@
+"""
+Tiempo de reconstrucción y memoria del índice de recomendaciones.
+
+Genera un historial sintético de pedidos (popularidad tipo Zipf) y mide
+``build_index`` completo, el pico de memoria durante la construcción, la
+memoria que queda retenida con el índice (``tracemalloc``, no solo el tamaño de
+los arreglos) y la latencia de ``recommend`` por usuario. Como referencia, mide
+también lo que retiene el historial guardado como ``{uid: np.ndarray}``.
+
+    python benchmarks/bench_recommendations.py --users 100000 --products 3000
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from services.recommendations import RecommendationIndex, build_index  # noqa: E402
+
+
+def synthetic_orders(users, products, orders_per_user, seed=43):
+    rng = np.random.default_rng(seed)
+    names = [f"Product {i}" for i in range(products)]
+    weights = 1.0 / np.arange(1, products + 1)
+    weights /= weights.sum()
+    sizes = rng.poisson(orders_per_user, users)
+    picks = rng.choice(products, size=int(sizes.sum()), p=weights)
+    user_orders = {}
+    offset = 0
+    for uid, size in enumerate(sizes):
+        user_orders[f"user{uid}"] = [names[i] for i in picks[offset:offset + size]]
+        offset += size
+    popularity = {names[i]: int(count) for i, count in enumerate(np.bincount(picks, minlength=products))}
+    return user_orders, popularity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=3000)
+    parser.add_argument("--orders-per-user", type=float, default=5)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    user_orders, popularity = synthetic_orders(args.users, args.products, args.orders_per_user)
+    total = sum(len(names) for names in user_orders.values())
+    print(f"{args.users} usuarios, {args.products} productos, {total} pedidos")
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    index = RecommendationIndex(build_index(user_orders, popularity, args.top_k))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+
+    # Referencia: el mismo historial como un arreglo chico por usuario
+    before, _ = tracemalloc.get_traced_memory()
+    per_user = {uid.decode(): index.indices[index.indptr[row]:index.indptr[row + 1]].copy()
+                for row, uid in enumerate(index.user_ids.tolist())}
+    gc.collect()
+    per_user_retained = tracemalloc.get_traced_memory()[0] - before
+    per_user_nbytes = sum(items.nbytes for items in per_user.values())
+    del per_user
+    tracemalloc.stop()
+
+    print(f"reconstrucción:  {elapsed:.2f} s")
+    print(f"índice:          {index.nbytes / 1e6:.1f} MB de buffer, {retained / 1e6:.1f} MB retenidos")
+    print(f"pico de memoria: {peak / 1e6:.1f} MB durante build_index")
+    print(f"historial como {{uid: np.ndarray}}: {per_user_nbytes / 1e6:.1f} MB en arreglos, "
+          f"{per_user_retained / 1e6:.1f} MB retenidos")
+
+    rng = np.random.default_rng(0)
+    latencies = []
+    for uid in rng.integers(0, args.users, args.queries):
+        started = time.perf_counter()
+        index.recommend(f"user{uid}", 10)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"recommend:       p50 {statistics.median(latencies):.3f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
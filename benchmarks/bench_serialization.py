@@ -0,0 +1,94 @@
+"""
+CPU por request de ``GET /restaurants`` con y sin el camino rápido de serialización.
+
+"antes": el handler devuelve dicts y FastAPI revalida cada restaurante y cada
+producto contra ``response_model=List[Restaurant]`` y los serializa con ``json``.
+"después": la ruta real, que sirve los bytes pre-codificados del caché del catálogo.
+
+En ambos casos los documentos ya están en memoria, así que la diferencia es solo
+validación + serialización.
+
+    python benchmarks/bench_serialization.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_firestore import FakeAuth, FakeFirestore  # noqa: E402
+from run_benchmark import load_app  # noqa: E402
+from seed import _restaurant  # noqa: E402
+
+
+def baseline_app(documents, model):
+    app = FastAPI()
+
+    @app.get("/restaurants", response_model=List[model])
+    def get_restaurants():
+        restaurants = []
+        for doc_id, data in documents:
+            restaurant_data = dict(data)
+            restaurant_data["id"] = doc_id
+            restaurants.append(restaurant_data)
+        return restaurants
+
+    return app
+
+
+async def measure(app, requests):
+    cpu = []
+    wall = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/restaurants")  # calentar caché
+        for _ in range(requests):
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            response = await client.get("/restaurants")
+            wall.append((time.perf_counter() - wall_start) * 1000)
+            cpu.append((time.process_time() - cpu_start) * 1000)
+            response.raise_for_status()
+    return statistics.median(cpu), statistics.median(wall), len(response.content)
+
+
+async def run(args):
+    db = FakeFirestore()
+    app = load_app(db, FakeAuth())
+    from routes import user_routes
+
+    rng = random.Random(43)
+    for size in args.sizes:
+        db._collections.pop("retaurants", None)
+        documents = [(f"r{i}", _restaurant(i, rng)) for i in range(1, size + 1)]
+        for doc_id, data in documents:
+            db.load("retaurants", doc_id, data)
+        user_routes.catalog.invalidate()
+
+        before_cpu, before_wall, size_bytes = await measure(baseline_app(documents, user_routes.Restaurant), args.requests)
+        after_cpu, after_wall, _ = await measure(app, args.requests)
+        print(f"{size:>7} restaurantes ({size_bytes / 1024:,.0f} KiB): "
+              f"CPU/request antes {before_cpu:9.2f} ms, después {after_cpu:7.2f} ms "
+              f"(x{before_cpu / after_cpu if after_cpu else float('inf'):,.1f}); "
+              f"latencia p50 antes {before_wall:9.2f} ms, después {after_wall:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requests", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
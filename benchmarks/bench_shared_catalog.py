@@ -0,0 +1,141 @@
+"""
+Memoria por worker del catálogo: copia propia en cada proceso frente a un archivo compartido.
+
+Levanta ``--workers`` procesos independientes (``spawn``, como los workers de
+uvicorn/gunicorn) que cargan un catálogo de ``--restaurants`` restaurantes de
+tres formas:
+
+* ``dicts``: como antes de este cambio, lista de dicts validados + JSON codificado.
+* ``local``: un ``CatalogSnapshot`` en memoria por worker (sin ``CATALOG_SHARED_PATH``).
+* ``shared``: todos mapean el mismo archivo publicado (``SharedCatalogReader``).
+
+En los dos primeros casos el worker lee el snapshot del archivo para no medir
+Firestore ni la validación; solo cuenta lo que queda en memoria.
+
+Con todos los workers vivos a la vez se lee ``/proc/self/smaps_rollup`` y se
+reporta cuánto creció cada proceso al cargar el catálogo: RSS, PSS (las páginas
+compartidas se reparten entre los procesos que las usan) y memoria privada.
+Solo Linux.
+
+    python benchmarks/bench_shared_catalog.py --restaurants 20000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from seed import _restaurant  # noqa: E402
+
+MODES = ("dicts", "local", "shared")
+
+
+def catalog_entries(restaurants, products):
+    rng = random.Random(41)
+    entries = []
+    for i in range(1, restaurants + 1):
+        data = _restaurant(i, rng)
+        base = data["products"][0]
+        data["products"] = [
+            {**base, "productId": i * products + j, "productName": f"{base['productName']} {j}"}
+            for j in range(products)
+        ]
+        entries.append((f"r{i}", data))
+    return entries
+
+
+def memory_kib():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def worker(mode, path, barrier, results):
+    import orjson
+    from services.catalog_cache import SharedCatalogReader
+    from services.catalog_snapshot import CatalogSnapshot
+
+    before = memory_kib()
+    if mode == "dicts":
+        with open(path, "rb") as file:
+            restaurants = orjson.loads(CatalogSnapshot(file.read()).all_json())
+        catalog = (restaurants, orjson.dumps(restaurants))
+        payload = catalog[1]
+    elif mode == "local":
+        with open(path, "rb") as file:
+            catalog = CatalogSnapshot(file.read())
+        payload = catalog.all_json()
+    else:
+        catalog = SharedCatalogReader(path, check_interval=0).get()
+        payload = catalog.all_json()
+    # Recorrer el catálogo completo, como lo haría un worker que ya atendió búsquedas
+    if mode != "dicts":
+        catalog.search_json(["pizza"])
+
+    barrier.wait()
+    after = memory_kib()
+    results.put({key: after[key] - before[key] for key in after} | {"bytes": len(payload)})
+    barrier.wait()
+
+
+def run_mode(context, mode, path, workers):
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mode, path, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--restaurants", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=8, help="productos por restaurante")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from services.catalog_snapshot import build_snapshot
+
+    entries = catalog_entries(args.restaurants, args.products)
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    path = os.path.join(directory, f"bench-catalog-{os.getpid()}.bin")
+    started = time.perf_counter()
+    with open(path, "wb") as file:
+        file.write(build_snapshot(1, entries))
+    print(f"{args.restaurants} restaurantes x {args.products} productos, {args.workers} workers; "
+          f"snapshot de {os.path.getsize(path) / 2**20:,.1f} MiB "
+          f"construido en {(time.perf_counter() - started) * 1000:,.0f} ms ({path})")
+
+    context = multiprocessing.get_context("spawn")
+    try:
+        for mode in MODES:
+            samples = run_mode(context, mode, path, args.workers)
+            average = {key: sum(s[key] for s in samples) / len(samples) / 1024 for key in ("rss", "pss", "private")}
+            print(f"{mode:<7} por worker: RSS +{average['rss']:7.1f} MiB, PSS +{average['pss']:7.1f} MiB, "
+                  f"privada +{average['private']:7.1f} MiB | total PSS {average['pss'] * args.workers:7.1f} MiB")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Costo de difundir cambios de stock a miles de clientes SSE en un proceso.
+
+Conecta ``--clients`` suscriptores al ``StockBroadcaster`` y publica desde otro
+hilo ``--updates`` cambios sobre ``--products`` productos (ráfagas sobre los
+mismos productos, como cuando se agota una bolsa sorpresa). Reporta cuántos
+cambios quedaron tras combinar por producto, el tiempo de cada difusión y el
+CPU total del proceso.
+
+    python benchmarks/bench_stream.py --clients 5000 --updates 20000 --products 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from services.stock_stream import StockBroadcaster  # noqa: E402
+
+
+async def run(args):
+    broadcaster = StockBroadcaster(interval=args.interval)
+    broadcast_ms = []
+    original = broadcaster._broadcast
+
+    def timed_broadcast(frame):
+        start = time.perf_counter()
+        original(frame)
+        broadcast_ms.append((time.perf_counter() - start) * 1000)
+
+    broadcaster._broadcast = timed_broadcast
+    received = [0] * args.clients
+    received_bytes = [0] * args.clients
+
+    async def client(i):
+        async for frame in broadcaster.stream():
+            received[i] += 1
+            received_bytes[i] += len(frame)
+
+    tasks = [asyncio.create_task(client(i)) for i in range(args.clients)]
+    await asyncio.sleep(0.1)
+
+    def publisher():
+        rng = random.Random(43)
+        pause = args.seconds / args.updates
+        for n in range(args.updates):
+            product_id = int(rng.paretovariate(1.2)) % args.products
+            broadcaster.publish(f"r{product_id}", {"productId": product_id, "amount": n, "available": True})
+            time.sleep(pause)
+
+    cpu = time.process_time()
+    started = time.perf_counter()
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    while thread.is_alive():
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(args.interval * 3)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats = broadcaster.stats
+    print(f"{args.clients} clientes, {stats['published']} cambios publicados en {elapsed:.1f} s")
+    print(f"  frames: {stats['frames']}, cambios enviados tras combinar: {stats['deltas_sent']} "
+          f"({stats['published'] / max(stats['deltas_sent'], 1):.1f}x menos)")
+    print(f"  difusión por frame: p50 {statistics.median(broadcast_ms):.2f} ms, max {max(broadcast_ms):.2f} ms")
+    print(f"  por cliente: {statistics.mean(received):.0f} frames, {statistics.mean(received_bytes) / 1024:.1f} KB; "
+          f"resyncs: {stats['resyncs']}")
+    print(f"  CPU del proceso: {cpu:.2f} s ({cpu / elapsed * 100:.0f} % de un núcleo)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.25, help="STOCK_STREAM_INTERVAL")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Verifica las garantías de ``services/counters.py`` contra el Firestore en memoria.
+
+    python benchmarks/counter_semantics.py
+
+Escenarios: combinación de escrituras bajo concurrencia, reintento tras un
+commit fallido, pérdida acotada ante una caída sin flush (un worker en otro
+proceso que termina con ``os._exit`` y deja en Firestore solo lo que alcanzó a
+escribir el flush periódico), lectura transparente
+de los shards y flush periódico en un worker con ``ENABLE_SCHEDULED_JOBS=0``.
+Termina con error si alguna garantía no se cumple.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_firestore import FakeAuth, FakeFirestore, FakeWriteBatch  # noqa: E402
+from run_benchmark import load_app  # noqa: E402
+from services.counters import WriteCombiningCounters  # noqa: E402
+from services.date_ranges import day_bucket  # noqa: E402
+from services.scheduler import lifespan_for  # noqa: E402
+
+DAY = "2025-04-26"
+CRASH_EXIT_CODE = 70
+
+
+def _read_day(db, collection, field):
+    """Suma el campo en todos los documentos del día, como lo hacen los lectores de analíticas."""
+    total = 0
+    for doc in db.collection(collection).stream():
+        bucket = day_bucket(doc.id)
+        if bucket and bucket[0] == DAY:
+            total += doc.to_dict().get(field, 0)
+    return total
+
+
+def combined_writes():
+    db = FakeFirestore()
+    counters = WriteCombiningCounters(db, shards=1)
+
+    def client():
+        for _ in range(1000):
+            counters.increment("feature_usage", "search", day=DAY)
+
+    threads = [threading.Thread(target=client) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters.flush()
+    stats = db.stats.snapshot()
+    assert _read_day(db, "feature_usage", "search") == 20000
+    assert stats["writes"] == 1 and stats["rpcs"] == 1, stats
+    print(f"OK  20000 incrementos concurrentes -> {stats['writes']} escritura en {stats['rpcs']} RPC")
+
+
+def failed_commit_is_retried():
+    db = FakeFirestore()
+    counters = WriteCombiningCounters(db, shards=1)
+    for _ in range(5):
+        counters.increment("restaurant_visits", "Restaurant 1", day=DAY)
+
+    original = FakeWriteBatch.commit
+
+    def failing_commit(self):
+        raise RuntimeError("Firestore no disponible")
+
+    FakeWriteBatch.commit = failing_commit
+    try:
+        counters.flush()
+        raise AssertionError("El flush debía fallar")
+    except RuntimeError:
+        pass
+    finally:
+        FakeWriteBatch.commit = original
+
+    assert counters.pending() == 5, counters.pending()
+    counters.increment("restaurant_visits", "Restaurant 1", day=DAY)
+    counters.flush()
+    assert _read_day(db, "restaurant_visits", "Restaurant 1") == 6
+    assert counters.pending() == 0
+    print("OK  commit fallido: los incrementos vuelven al buffer y se escriben una sola vez en el reintento")
+
+
+def _crashing_worker(path):
+    """Worker que escribe contadores con el flush periódico y se cae sin flush final."""
+    db = FakeFirestore()
+    load_app(db, FakeAuth())
+    from routes import analytics_routes
+
+    # Lo que Firestore tiene guardado vive fuera del proceso: cada commit aplicado se copia al archivo
+    original = FakeWriteBatch.commit
+
+    def persisted_commit(self, retry=None, timeout=None):
+        original(self, retry=retry, timeout=timeout)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(db._collections.get("feature_usage", {}), f)
+        os.replace(f"{path}.tmp", path)
+
+    FakeWriteBatch.commit = persisted_commit
+
+    async def worker():
+        async with lifespan_for(analytics_routes.jobs)(None):
+            for _ in range(10):
+                analytics_routes.counters.increment("feature_usage", "map", day=DAY)
+            while analytics_routes.counters.pending():
+                await asyncio.sleep(0.05)
+            for _ in range(3):
+                analytics_routes.counters.increment("feature_usage", "map", day=DAY)
+            # Caída del proceso antes del siguiente flush: no corre el apagado del lifespan ni atexit
+            os._exit(CRASH_EXIT_CODE)
+
+    asyncio.run(worker())
+
+
+def crash_loses_only_unflushed():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "feature_usage.json")
+        child = subprocess.run([sys.executable, __file__, "--crash-worker", path],
+                               env={**os.environ, "ENABLE_SCHEDULED_JOBS": "0"}, timeout=60)
+        assert child.returncode == CRASH_EXIT_CODE, child.returncode
+        with open(path) as f:
+            documents = json.load(f)
+
+    saved = sum(doc.get("map", 0) for doc_id, doc in documents.items()
+                if (day_bucket(doc_id) or ("",))[0] == DAY)
+    assert saved == 10, saved
+    print("OK  caída sin flush: Firestore tiene los 10 incrementos del flush; se pierden los 3 posteriores")
+
+
+def shards_are_merged_by_readers():
+    db = FakeFirestore()
+    counters = WriteCombiningCounters(db, shards=4)
+    for _ in range(50):
+        for _ in range(10):
+            counters.increment("feature_usage", "favorites", day=DAY)
+        counters.flush()
+
+    documents = defaultdict(int)
+    for doc in db.collection("feature_usage").stream():
+        documents[doc.id] += doc.to_dict().get("favorites", 0)
+    assert len(documents) > 1, documents
+    assert _read_day(db, "feature_usage", "favorites") == 500
+    print(f"OK  4 shards: {len(documents)} documentos para el día, los lectores suman 500")
+
+
+def flushes_without_scheduled_jobs():
+    db = FakeFirestore()
+    load_app(db, FakeAuth())
+    from routes import analytics_routes
+
+    async def worker():
+        # Un worker que no es el dueño de los jobs sigue vaciando sus contadores
+        os.environ["ENABLE_SCHEDULED_JOBS"] = "0"
+        try:
+            async with lifespan_for(analytics_routes.jobs)(None):
+                for _ in range(50):
+                    analytics_routes.counters.increment("feature_usage", "search", day=DAY)
+                deadline = time.monotonic() + 2
+                while analytics_routes.counters.pending() and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                return analytics_routes.counters.pending(), _read_day(db, "feature_usage", "search")
+        finally:
+            del os.environ["ENABLE_SCHEDULED_JOBS"]
+
+    pending, written = asyncio.run(worker())
+    assert pending == 0 and written == 50, (pending, written)
+    print("OK  ENABLE_SCHEDULED_JOBS=0: los 50 incrementos se escriben en el flush periódico, no al apagarse")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--crash-worker"]:
+        _crashing_worker(sys.argv[2])
+    combined_writes()
+    failed_commit_is_retried()
+    crash_loses_only_unflushed()
+    shards_are_merged_by_readers()
+    flushes_without_scheduled_jobs()
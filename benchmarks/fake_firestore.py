@@ -0,0 +1,550 @@
+"""
+Cliente Firestore en memoria para los benchmarks.
+
+Implementa el subconjunto de la API de ``google.cloud.firestore`` que usa el
+backend (colecciones, subcolecciones, ``where``/``order_by``/``limit``,
+cursores, ``get_all``, batches, transacciones y transforms
+``Increment``/``ArrayUnion``) y
+lleva la cuenta de lecturas, escrituras y RPCs igual que las factura Firestore:
+una lectura por documento devuelto (mínimo una por consulta).
+
+Como Firestore, un filtro de rango (``<``, ``>=``...) solo encuentra valores del
+mismo tipo que el límite: un Timestamp nunca cumple ``>= "2025-04-26"``.
+
+Como el cliente real, respeta ``timeout=`` en cada llamada (lanza
+``DeadlineExceeded`` al vencer) y ``inject`` simula caídas parciales: latencia
+extra y una fracción de llamadas que fallan con ``ServiceUnavailable``.
+"""
+import copy
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1 import transforms
+
+
+DOCUMENT_ID = "__name__"
+
+
+class FakeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+
+    def add(self, reads=0, writes=0, rpcs=0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.rpcs += rpcs
+
+    def snapshot(self):
+        with self._lock:
+            return {"reads": self.reads, "writes": self.writes, "rpcs": self.rpcs}
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.create_time = None
+        self.update_time = None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        value = self._data
+        for part in field.split("."):
+            value = value[part]
+        return copy.deepcopy(value)
+
+
+def _apply_value(current, value):
+    if isinstance(value, transforms.Increment):
+        return (current or 0) + value.value
+    if isinstance(value, transforms.ArrayUnion):
+        merged = list(current or [])
+        for item in value.values:
+            if item not in merged:
+                merged.append(item)
+        return merged
+    if isinstance(value, transforms.ArrayRemove):
+        return [item for item in (current or []) if item not in value.values]
+    if value is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    return copy.deepcopy(value)
+
+
+def _set_path(data, field_path, value):
+    parts = field_path.split(".")
+    target = data
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    if value is transforms.DELETE_FIELD:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = _apply_value(target.get(parts[-1]), value)
+
+
+def _merge(data, values):
+    for key, value in values.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            _merge(data[key], value)
+        else:
+            _set_path(data, key, value)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, *args, transaction=None, timeout=None, **kwargs):
+        self._client._rpc(reads=1, path=self.path, timeout=timeout)
+        if transaction is not None:
+            return transaction._read(self)
+        return self._client._snapshot(self)
+
+    def set(self, data, merge=False, retry=None, timeout=None):
+        self._client._rpc(writes=1, path=self.path, timeout=timeout)
+        self._client._write(self, data, merge=merge)
+
+    def update(self, data, retry=None, timeout=None):
+        self._client._rpc(writes=1, path=self.path, timeout=timeout)
+        self._client._update(self, data)
+
+    def create(self, data, retry=None, timeout=None):
+        self._client._rpc(writes=1, path=self.path, timeout=timeout)
+        self._client._create(self, data)
+
+    def delete(self, retry=None, timeout=None):
+        self._client._rpc(writes=1, path=self.path, timeout=timeout)
+        self._client._delete(self)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+def _field_value(snapshot, field):
+    if field == DOCUMENT_ID:
+        return snapshot.id
+    value = snapshot._data
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _value_type(value):
+    # Firestore ordena primero por tipo: un filtro de rango solo encuentra valores del tipo de su límite
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, datetime):
+        return "timestamp"
+    return type(value).__name__
+
+
+def _comparable(a, b):
+    return a is not None and _value_type(a) == _value_type(b)
+
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a is not None and a != b,
+    "<": lambda a, b: _comparable(a, b) and a < b,
+    "<=": lambda a, b: _comparable(a, b) and a <= b,
+    ">": lambda a, b: _comparable(a, b) and a > b,
+    ">=": lambda a, b: _comparable(a, b) and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a is not None and a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+
+def _field_name(field):
+    # firestore.FieldPath.document_id() devuelve "__name__"
+    return field if isinstance(field, str) else field.to_api_repr()
+
+
+class FakeQuery:
+    def __init__(self, client, path, filters=(), orders=(), limit=None,
+                 start=None, end=None, all_descendants=False):
+        self._client = client
+        self._path = path
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start = start
+        self._end = end
+
+    def _copy(self, **changes):
+        params = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "start": self._start,
+            "end": self._end,
+            "all_descendants": self._all_descendants,
+        }
+        params.update(changes)
+        return FakeQuery(self._client, self._path, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((_field_name(field_path), op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((_field_name(field_path), direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def _cursor(self, values, inclusive):
+        if isinstance(values, FakeDocumentSnapshot):
+            fields = [field for field, _ in self._orders] or [DOCUMENT_ID]
+            values = [_field_value(values, field) for field in fields]
+        elif isinstance(values, dict):
+            values = [values.get(field) for field, _ in self._orders]
+        return (tuple(values), inclusive)
+
+    def start_at(self, values):
+        return self._copy(start=self._cursor(values, True))
+
+    def start_after(self, values):
+        return self._copy(start=self._cursor(values, False))
+
+    def end_at(self, values):
+        return self._copy(end=self._cursor(values, True))
+
+    def end_before(self, values):
+        return self._copy(end=self._cursor(values, False))
+
+    def _run(self, timeout=None):
+        snapshots = []
+        if self._all_descendants:
+            documents = self._client._documents_in_group(self._path)
+        else:
+            documents = self._client._documents_in(self._path)
+        for ref, data in documents:
+            snapshot = FakeDocumentSnapshot(ref, data)
+            if all(_OPERATORS[op](_field_value(snapshot, field), value)
+                   for field, op, value in self._filters):
+                snapshots.append(snapshot)
+
+        orders = self._orders or ((DOCUMENT_ID, "ASCENDING"),)
+        for field, direction in reversed(orders):
+            snapshots.sort(
+                key=lambda s: (_field_value(s, field) is None, _field_value(s, field)),
+                reverse=(direction == "DESCENDING"),
+            )
+
+        if self._start is not None or self._end is not None:
+            fields = [field for field, _ in orders]
+            keys = lambda s: tuple(_field_value(s, f) for f in fields)
+            if self._start is not None:
+                values, inclusive = self._start
+                n = len(values)
+                snapshots = [s for s in snapshots
+                             if keys(s)[:n] > values or (inclusive and keys(s)[:n] == values)]
+            if self._end is not None:
+                values, inclusive = self._end
+                n = len(values)
+                snapshots = [s for s in snapshots
+                             if keys(s)[:n] < values or (inclusive and keys(s)[:n] == values)]
+
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+
+        # Firestore cobra al menos una lectura por consulta aunque venga vacía
+        self._client._rpc(reads=max(1, len(snapshots)), path=self._path, timeout=timeout)
+        return snapshots
+
+    def stream(self, *args, timeout=None, **kwargs):
+        return iter(self._run(timeout))
+
+    def get(self, *args, timeout=None, **kwargs):
+        return self._run(timeout)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        document_id = document_id or uuid.uuid4().hex[:20]
+        return FakeDocumentReference(self._client, f"{self._path}/{document_id}")
+
+    def add(self, data, document_id=None, retry=None, timeout=None):
+        ref = self.document(document_id)
+        ref.set(data, timeout=timeout)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self):
+        return [ref for ref, _ in self._client._documents_in(self._path)]
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(lambda: self._client._write(reference, data, merge=merge))
+
+    def update(self, reference, data):
+        self._ops.append(lambda: self._client._update(reference, data))
+
+    def delete(self, reference):
+        self._ops.append(lambda: self._client._delete(reference))
+
+    def commit(self, retry=None, timeout=None):
+        self._client._rpc(writes=len(self._ops), timeout=timeout)
+        with self._client._lock:
+            for op in self._ops:
+                op()
+        self._ops = []
+
+
+class FakeTransaction:
+    """
+    Transacción optimista, como la del cliente real con ``@firestore.transactional``:
+    guarda la versión de cada documento leído y al hacer commit, si alguno cambió,
+    lanza ``Aborted`` para que el decorador vuelva a ejecutar la función.
+    """
+
+    def __init__(self, client, max_attempts=5):
+        self._client = client
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._reads = {}  # {ruta: datos leídos (la identidad del dict es la versión)}
+        self._ops = []
+
+    def _clean_up(self):
+        self._reads = {}
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _read(self, reference):
+        collection_path, doc_id = self._client._split(reference)
+        with self._client._lock:
+            data = self._client._collections.get(collection_path, {}).get(doc_id)
+        self._reads[reference.path] = data
+        return FakeDocumentSnapshot(reference, data)
+
+    def set(self, reference, data, merge=False):
+        reference = getattr(reference, "_wrapped", reference)
+        self._ops.append(lambda: self._client._write(reference, data, merge=merge))
+
+    def update(self, reference, data):
+        reference = getattr(reference, "_wrapped", reference)
+        self._ops.append(lambda: self._client._update(reference, data))
+
+    def delete(self, reference):
+        reference = getattr(reference, "_wrapped", reference)
+        self._ops.append(lambda: self._client._delete(reference))
+
+    def _commit(self):
+        self._client._rpc(writes=len(self._ops))
+        with self._client._lock:
+            for path, data in self._reads.items():
+                collection_path, doc_id = path.rsplit("/", 1)
+                if self._client._collections.get(collection_path, {}).get(doc_id) is not data:
+                    self._clean_up()
+                    raise gexc.Aborted("Transaction lock timeout or contention")
+            for op in self._ops:
+                op()
+        self._clean_up()
+
+    def _rollback(self):
+        self._clean_up()
+
+
+class FakeFirestore:
+    """
+    Cliente Firestore en memoria; ``stats`` acumula el costo de cada llamada.
+    ``latency`` (segundos por RPC) y ``document_latency`` (segundos por documento leído)
+    simulan la espera de red, sin ocupar el GIL.
+    """
+
+    def __init__(self, latency=0.0, document_latency=0.0):
+        self._lock = threading.RLock()
+        # {ruta de la colección: {id del documento: datos}}
+        self._collections = {}
+        self.stats = FakeStats()
+        self.latency = latency
+        self.document_latency = document_latency
+        self._faults = {}  # {colección o None (todas): (latencia extra, fracción de errores)}
+        self._random = random.Random(42)
+
+    def inject(self, latency=0.0, error_rate=0.0, collection=None):
+        """Simula una caída parcial de Firestore en ``collection`` (o en todas)."""
+        self._faults[collection] = (latency, error_rate)
+
+    def clear_faults(self):
+        self._faults = {}
+
+    def _rpc(self, reads=0, writes=0, path=None, timeout=None):
+        self.stats.add(reads=reads, writes=writes, rpcs=1)
+        delay = self.latency + reads * self.document_latency
+        fault = None
+        if self._faults:
+            collection = path.split("/", 1)[0] if path else None
+            fault = self._faults.get(collection) or self._faults.get(None)
+        if fault is not None:
+            delay += fault[0]
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise gexc.DeadlineExceeded("Deadline Exceeded")
+        if delay > 0:
+            time.sleep(delay)
+        if fault is not None and self._random.random() < fault[1]:
+            raise gexc.ServiceUnavailable("The service is currently unavailable.")
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def document(self, path):
+        return FakeDocumentReference(self, path)
+
+    def collection_group(self, collection_id):
+        return FakeQuery(self, collection_id, all_descendants=True)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts=5):
+        return FakeTransaction(self, max_attempts=max_attempts)
+
+    def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        references = list(references)
+        self._rpc(reads=len(references), path=references[0].path if references else None, timeout=timeout)
+        for ref in references:
+            yield self._snapshot(ref)
+
+    def close(self):
+        pass
+
+    # -- carga directa (sin contar costo), usada por el seed -----------------
+
+    def load(self, collection_path, document_id, data):
+        self._collections.setdefault(collection_path, {})[document_id] = data
+
+    # -- almacenamiento -------------------------------------------------------
+
+    def _documents_in(self, path):
+        with self._lock:
+            docs = list(self._collections.get(path, {}).items())
+        return [(FakeDocumentReference(self, f"{path}/{doc_id}"), data) for doc_id, data in docs]
+
+    def _documents_in_group(self, collection_id):
+        with self._lock:
+            paths = [path for path in self._collections
+                     if path == collection_id or path.endswith(f"/{collection_id}")]
+        documents = []
+        for path in paths:
+            documents.extend(self._documents_in(path))
+        return documents
+
+    def _split(self, reference):
+        collection_path, doc_id = reference.path.rsplit("/", 1)
+        return collection_path, doc_id
+
+    def _snapshot(self, reference):
+        collection_path, doc_id = self._split(reference)
+        with self._lock:
+            data = self._collections.get(collection_path, {}).get(doc_id)
+        return FakeDocumentSnapshot(reference, data)
+
+    def _write(self, reference, data, merge=False):
+        collection_path, doc_id = self._split(reference)
+        with self._lock:
+            docs = self._collections.setdefault(collection_path, {})
+            current = docs.get(doc_id) if merge else None
+            current = copy.deepcopy(current) if current is not None else {}
+            _merge(current, data)
+            docs[doc_id] = current
+
+    def _create(self, reference, data):
+        collection_path, doc_id = self._split(reference)
+        with self._lock:
+            docs = self._collections.setdefault(collection_path, {})
+            if doc_id in docs:
+                raise gexc.AlreadyExists(f"Document already exists: {reference.path}")
+            current = {}
+            _merge(current, data)
+            docs[doc_id] = current
+
+    def _update(self, reference, data):
+        collection_path, doc_id = self._split(reference)
+        with self._lock:
+            docs = self._collections.setdefault(collection_path, {})
+            if doc_id not in docs:
+                raise KeyError(f"No document to update: {reference.path}")
+            current = copy.deepcopy(docs[doc_id])
+            for field, value in data.items():
+                _set_path(current, field, value)
+            docs[doc_id] = current
+
+    def _delete(self, reference):
+        collection_path, doc_id = self._split(reference)
+        with self._lock:
+            self._collections.get(collection_path, {}).pop(doc_id, None)
+
+
+class FakeAuth:
+    """Sustituto en memoria de ``firebase_admin.auth`` para las rutas de registro."""
+
+    class UserNotFoundError(Exception):
+        pass
+
+    class _User:
+        def __init__(self, uid, email):
+            self.uid = uid
+            self.email = email
+
+    def __init__(self):
+        self._users = {}
+
+    def get_user_by_email(self, email, app=None):
+        if email not in self._users:
+            raise FakeAuth.UserNotFoundError(email)
+        return self._users[email]
+
+    def create_user(self, email, password, app=None, **kwargs):
+        user = FakeAuth._User(uuid.uuid4().hex[:28], email)
+        self._users[email] = user
+        return user
+
+    def verify_id_token(self, token, app=None, **kwargs):
+        return {"uid": token}
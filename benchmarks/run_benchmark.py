@@ -0,0 +1,285 @@
+"""
+Benchmark de todas las rutas del backend contra un Firestore en memoria.
+
+Uso (desde la raíz del repo):
+
+    python benchmarks/run_benchmark.py --docs 10000 --requests 50 --out baseline.json
+    python benchmarks/run_benchmark.py --docs 10000 --compare baseline.json
+
+Para cada endpoint reporta latencia p50/p95/p99, throughput y lecturas,
+escrituras y RPCs de Firestore por request. El resultado es un JSON que se
+puede comparar contra una corrida anterior con ``--compare``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from unittest import mock
+from urllib.parse import urlencode
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fake_firestore import FakeAuth, FakeFirestore  # noqa: E402
+from seed import seed  # noqa: E402
+
+
+def load_app(db, fake_auth):
+    """Importa la app de FastAPI con Firebase apuntando al cliente en memoria."""
+    # Los patches quedan activos: Firebase se inicializa perezosamente en el primer request
+    mock.patch("firebase_admin.credentials.Certificate", lambda path: None).start()
+    mock.patch("firebase_admin.initialize_app", lambda *args, **kwargs: object()).start()
+    mock.patch("firebase_admin.firestore.client", lambda *args, **kwargs: db).start()
+    # Se mide el costo de cada endpoint sin descarte de carga (ver bench_admission.py)
+    os.environ.setdefault("ADMISSION_CONTROL", "0")
+
+    from app.main import create_app
+    from routes import analytics_routes, user_routes
+
+    user_routes.auth = fake_auth
+    # El cliente ASGI no ejecuta el lifespan: los jobs periódicos se corren una vez antes de medir
+    for job in user_routes.jobs + analytics_routes.jobs:
+        job.run_once()
+    return create_app()
+
+
+def scenarios(info):
+    """Requests representativos por endpoint: (router, método, ruta, kwargs de httpx)."""
+    restaurant = info["restaurant"]
+    product = restaurant["products"][0]
+    uid = info["user_id"]
+    user_body = {
+        "name": "Bench", "email": "bench@example.com", "password": "secret123",
+        "address": "Bogotá", "birthday": "2000-01-01",
+    }
+    restaurant_body = {**restaurant, "products": [product]}
+    auth_header = {"Authorization": f"Bearer {uid}"}
+    # Última semana de datos, para comparar el costo de una ventana frente a toda la historia
+    week = {
+        "from": (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d"),
+        "to": datetime.now().strftime("%Y-%m-%d"),
+    }
+
+    return [
+        ("core", "POST", "/signup", {"json": user_body}),
+        ("core", "GET", "/users/me", {"headers": auth_header}),
+        ("core", "POST", "/users/bench-user", {"json": user_body}),
+        ("core", "GET", "/users/bench-user", {}),
+        ("core", "PUT", "/users/bench-user", {"json": user_body}),
+        ("core", "DELETE", "/users/bench-user", {}),
+        ("core", "GET", "/restaurants", {}),
+        ("core", "GET", f"/restaurants/type/{restaurant['type']}", {}),
+        ("core", "GET", "/restaurants/search/surprise", {}),
+        ("core", "GET", f"/products/{product['productId']}", {}),
+        ("core", "GET", "/products", {"params": {"ids": ",".join(str(i) for i in range(1, 51))}}),
+        ("core", "GET", "/users", {"params": {"ids": ",".join(f"user{i}" for i in range(50))}}),
+        ("core", "POST", "/restaurants", {"json": restaurant_body, "headers": auth_header}),
+        ("core", "PUT", "/restaurants/r1", {"json": restaurant_body, "headers": auth_header}),
+        ("core", "POST", "/order", {"json": {"product_id": product["productId"], "quantity": 1}}),
+        ("core", "GET",
+         f"/order/{restaurant['name']}/decrease-stock/{product['productName']}/{product['discountPrice']}/{uid}",
+         {}),
+        ("core", "GET", f"/orders/{uid}", {}),
+        ("core", "GET", f"/orders/{uid}/cancel/{info['order_id']}", {}),
+        ("core", "GET", f"/recommendations/{uid}", {}),
+        ("analytics", "GET", "/features-usage", {}),
+        ("analytics", "GET", "/features-increasing-rate", {}),
+        ("analytics", "GET", "/features-increasing-rate-daily", {}),
+        ("analytics", "POST", "/analyticspages",
+         {"json": {"screen_name": "HomePage", "duration": 12, "timestamp": datetime.now().isoformat()}}),
+        ("analytics", "GET", "/screen-analytics", {}),
+        ("analytics", "GET", "/average-time-spent", {}),
+        ("analytics", "GET", "/devices-summary", {}),
+        ("analytics", "GET", "/top-products", {}),
+        ("analytics", "GET", "/analytics/detail-feature-usage", {}),
+        ("analytics", "GET", "/analytics/most-liked-restaurants", {}),
+        ("analytics", "GET", "/analytics/orders-by-weekday", {}),
+        ("analytics", "GET", "/android-version-summary", {}),
+        ("analytics", "GET", "/analytics/most-products-ordered", {}),
+        ("analytics", "GET", "/cancellation-time-stats", {}),
+        ("analytics", "GET", f"/analytics/restaurants/{restaurant['name']}", {}),
+        ("analytics", "POST", "/analytics/feature-usage", {"json": {"feature": "search", "user_id": uid}}),
+        ("analytics", "POST", "/analytics/restaurant-visits",
+         {"json": {"restaurant": restaurant["name"], "user_id": uid}}),
+        ("analytics", "GET", f"/forecast/{restaurant['name']}", {}),
+        ("analytics", "GET", "/analytics/features/distinct-users", {"params": week}),
+        ("analytics", "GET", "/analytics/restaurants-distinct-visitors", {"params": {"granularity": "day"}}),
+        ("analytics", "GET", "/features-usage", {"params": week}),
+        ("analytics", "GET", "/screen-analytics", {"params": week}),
+        ("analytics", "GET", "/analytics/orders-by-weekday", {"params": week}),
+        ("analytics", "GET", "/analytics/heatmap",
+         {"params": {"collection": "detail_events", "filter": "event_type:order", **week}}),
+        ("export", "GET", "/export/screen_times", {"params": {"format": "ndjson", "gzip": "false"}}),
+        ("export", "GET", "/export/detail_events", {"params": {"format": "csv", "gzip": "true"}}),
+        ("core", "GET", "/metrics", {}),
+    ]
+
+
+def _flatten(routes):
+    for route in routes:
+        # Versiones recientes de FastAPI envuelven los routers incluidos en lugar de copiar sus rutas
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from _flatten(included.routes)
+        else:
+            yield route
+
+
+# Conexiones de larga duración, medidas con su propio benchmark (bench_stream.py)
+NOT_BENCHMARKED = {"/restaurants/stream"}
+
+
+def uncovered_routes(app, plan):
+    """Rutas declaradas en la app que no tienen escenario en el plan."""
+    missing = []
+    for route in _flatten(app.routes):
+        methods = getattr(route, "methods", None) or set()
+        path = getattr(route, "path", "")
+        if path.startswith(("/docs", "/redoc", "/openapi")) or path in NOT_BENCHMARKED:
+            continue
+        for method in methods - {"HEAD"}:
+            if not _matches(route, method, plan):
+                missing.append(f"{method} {path}")
+    return missing
+
+
+def _matches(route, method, plan):
+    for _, plan_method, path, _ in plan:
+        if plan_method == method:
+            match, _ = route.matches({"type": "http", "path": path, "method": method})
+            if match.name == "FULL":
+                return True
+    return False
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client, method, path, kwargs, requests, concurrency):
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+async def run(args):
+    db = FakeFirestore()
+    fake_auth = FakeAuth()
+    info = seed(db, docs=args.docs, days=args.days)
+    app = load_app(db, fake_auth)
+    plan = scenarios(info)
+
+    for route in uncovered_routes(app, plan):
+        print(f"⚠ Ruta sin escenario de benchmark: {route}")
+
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://bench"
+    )
+
+    results = {}
+    try:
+        for router_name, method, path, kwargs in plan:
+            if args.only and args.only not in path:
+                continue
+            before = db.stats.snapshot()
+            latencies, statuses, elapsed = await run_scenario(
+                client, method, path, kwargs, args.requests, args.concurrency
+            )
+            after = db.stats.snapshot()
+            key = f"{method} {path}"
+            if kwargs.get("params"):
+                key += "?" + urlencode(kwargs["params"])
+            results[key] = {
+                "router": router_name,
+                "requests": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p95_ms": round(percentile(latencies, 95), 3),
+                "p99_ms": round(percentile(latencies, 99), 3),
+                "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                "reads_per_request": round((after["reads"] - before["reads"]) / len(latencies), 2),
+                "writes_per_request": round((after["writes"] - before["writes"]) / len(latencies), 2),
+                "rpcs_per_request": round((after["rpcs"] - before["rpcs"]) / len(latencies), 2),
+                "status_codes": {str(code): n for code, n in sorted(statuses.items())},
+            }
+            print(f"{key:<90} p50={results[key]['p50_ms']:>9.2f}ms "
+                  f"p95={results[key]['p95_ms']:>9.2f}ms reads/req={results[key]['reads_per_request']:>10}")
+    finally:
+        await client.aclose()
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "docs": args.docs,
+            "days": args.days,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "collections": info["counts"],
+            "python": platform.python_version(),
+        },
+        "endpoints": results,
+    }
+
+
+def compare(current, baseline):
+    """Imprime la diferencia de p95 y lecturas por request contra un baseline."""
+    print(f"\n{'endpoint':<90} {'p95 antes':>10} {'p95 ahora':>10} {'Δ%':>8} {'reads antes':>12} {'reads ahora':>12}")
+    for key, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(key)
+        if not before:
+            print(f"{key:<90} {'-':>10} {now['p95_ms']:>10.2f} {'nuevo':>8}")
+            continue
+        delta = ((now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100) if before["p95_ms"] else 0.0
+        print(f"{key:<90} {before['p95_ms']:>10.2f} {now['p95_ms']:>10.2f} {delta:>+7.1f}% "
+              f"{before['reads_per_request']:>12} {now['reads_per_request']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del backend contra un Firestore en memoria")
+    parser.add_argument("--docs", type=int, default=1000, help="Documentos sintéticos a generar (1k a 1M)")
+    parser.add_argument("--days", type=int, default=180, help="Días de historia en las colecciones diarias")
+    parser.add_argument("--requests", type=int, default=20, help="Requests por endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests simultáneos por endpoint")
+    parser.add_argument("--only", help="Solo endpoints cuya ruta contenga este texto")
+    parser.add_argument("--out", help="Archivo JSON donde guardar el resultado")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"\nResultado guardado en {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Generador de datos sintéticos para el FakeFirestore.
+
+``seed(db, docs)`` reparte aproximadamente ``docs`` documentos entre todas las
+colecciones que lee el backend, con la misma forma que escribe la app móvil.
+Es determinista para una misma semilla, de modo que dos corridas con la misma
+escala son comparables.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+
+SCREENS = ["HomePage", "SearchPage", "DetailPage", "OrdersPage", "ProfilePage"]
+FEATURES = ["search", "filter_by_type", "map", "favorites", "order", "directions"]
+DEVICE_MODELS = ["Pixel 7", "Galaxy S23", "Redmi Note 12", "Moto G84", "iPhone 14"]
+OS_VERSIONS = ["11", "12", "13", "14"]
+PRODUCT_NAMES = ["Surprise Bag", "Bakery Box", "Veggie Pack", "Sushi Box", "Pizza Slices"]
+
+# Proporción de documentos por colección sobre el total solicitado
+SHARES = {
+    "retaurants": 0.02,
+    "users": 0.04,
+    "users_orders": 0.08,
+    "orders": 0.04,
+    "screen_times": 0.35,
+    "detail_events": 0.30,
+    "userDevices": 0.04,
+    "product_orders": 0.13,
+}
+
+
+def _restaurant(i, rng):
+    return {
+        "name": f"Restaurant {i}",
+        "imageUrl": f"https://example.com/{i}.jpg",
+        "description": "Synthetic restaurant",
+        "latitude": 4.6 + rng.random() / 10,
+        "longitude": -74.1 + rng.random() / 10,
+        "address": f"Calle {i} # {rng.randint(1, 99)}-{rng.randint(1, 99)}",
+        "products": [{
+            "productId": i,
+            "productName": f"{rng.choice(PRODUCT_NAMES)} {i}",
+            "amount": 1_000_000,
+            "available": True,
+            "discountPrice": 9900.0,
+            "originalPrice": 19900.0,
+        }],
+        "rating": round(rng.uniform(3, 5), 1),
+        "type": rng.randint(1, 4),
+    }
+
+
+def seed(db, docs=1000, days=180, seed=43):
+    """Carga ``docs`` documentos sintéticos en ``db`` y devuelve un resumen con ids útiles."""
+    rng = random.Random(seed)
+    counts = {name: max(1, int(docs * share)) for name, share in SHARES.items()}
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    start = now - timedelta(days=days)
+
+    def moment():
+        return start + timedelta(seconds=rng.randint(0, days * 86400))
+
+    restaurants = []
+    for i in range(1, counts["retaurants"] + 1):
+        data = _restaurant(i, rng)
+        db.load("retaurants", f"r{i}", data)
+        restaurants.append(data)
+
+    user_ids = [f"user{i}" for i in range(counts["users"])]
+    for uid in user_ids:
+        db.load("users", uid, {
+            "name": uid,
+            "email": f"{uid}@example.com",
+            "address": "Bogotá",
+            "birthday": "2000-01-01",
+            "created_at": moment(),
+        })
+
+    for i in range(counts["users_orders"]):
+        uid = rng.choice(user_ids)
+        cancelled = rng.random() < 0.3
+        db.load(f"users/{uid}/orders", f"o{i}", {
+            "status": "cancelled" if cancelled else "completed",
+            "cancelledAt": moment().isoformat() if cancelled else None,
+            "productName": rng.choice(restaurants)["products"][0]["productName"],
+        })
+
+    for i in range(counts["orders"]):
+        uid = user_ids[i % len(user_ids)]
+        product = rng.choice(restaurants)["products"][0]
+        db.load("orders", uid, {"orders": [{
+            "order_id": f"ORD{i:05d}",
+            "product_name": product["productName"],
+            "price": product["discountPrice"],
+            "state": "pending",
+            "date": moment().strftime("%d/%m/%Y/%H:%M"),
+        }]})
+
+    for i in range(counts["screen_times"]):
+        db.load("screen_times", f"s{i}", {
+            "screen_name": rng.choice(SCREENS),
+            "duration": rng.randint(1, 600),
+            "timestamp": moment().replace(tzinfo=None).isoformat(),
+        })
+
+    for i in range(counts["detail_events"]):
+        restaurant = rng.choice(restaurants)
+        db.load("detail_events", f"e{i}", {
+            "event_type": rng.choice(["order", "directions"]),
+            "restaurant_name": restaurant["name"],
+            "product_name": restaurant["products"][0]["productName"],
+            "timestamp": moment(),
+        })
+
+    for i in range(counts["userDevices"]):
+        db.load("userDevices", f"d{i}", {
+            "model": rng.choice(DEVICE_MODELS),
+            "osVersion": rng.choice(OS_VERSIONS),
+        })
+
+    for i in range(counts["product_orders"]):
+        db.load("product_orders", f"p{i}", {
+            "nameProduct": rng.choice(restaurants)["products"][0]["productName"],
+            "quantity": rng.randint(1, 5),
+        })
+
+    # Documentos diarios con id YYYY-MM-DD
+    sample = restaurants[:50]
+    for offset in range(days):
+        day = (start + timedelta(days=offset)).strftime("%Y-%m-%d")
+        usage = {feature: rng.randint(0, 200) for feature in FEATURES}
+        usage["last_used_by"] = rng.choice(user_ids)
+        db.load("feature_usage", day, usage)
+
+        visits = {r["name"]: rng.randint(0, 50) for r in sample}
+        visits["last_visited_by"] = rng.choice(user_ids)
+        db.load("restaurant_visits", day, visits)
+
+        db.load("orders_product", day, {
+            r["products"][0]["productName"]: rng.randint(0, 20) for r in sample
+        })
+
+    return {
+        "restaurant": restaurants[0],
+        "user_id": user_ids[0],
+        "order_id": "ORD00000",
+        "counts": counts,
+        "days": days,
+    }
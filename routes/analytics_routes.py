@@ -0,0 +1,779 @@
+from collections import defaultdict
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from services.date_ranges import DateRange, date_range, day_bucket
+from services.counters import WriteCombiningCounters
+from services.distinct_users import FEATURE, RESTAURANT, DistinctUserSketches
+from services.firebase_service import db
+from services.forecast import DemandForecaster
+from services.heatmap import DEFAULT_TIMEZONE, WEEKDAYS, histogram, local_datetimes, weekday_hour
+from services.restaurant_snapshots import SNAPSHOTS_COLLECTION, refresh_snapshots, snapshot_id
+from services.scheduler import PeriodicJob, lifespan_for
+
+# Usuarios distintos por funcionalidad y por restaurante (HyperLogLog)
+sketches = DistinctUserSketches(db)
+
+# Contadores diarios de feature_usage y restaurant_visits con escritura combinada
+counters = WriteCombiningCounters(db)
+
+# Pronóstico de demanda por producto, reentrenado periódicamente; compartido entre workers con FORECAST_SHARED_PATH
+forecaster = DemandForecaster(db, history_days=int(os.getenv("FORECAST_HISTORY_DAYS", "180")))
+
+# Jobs periódicos de las analíticas; corren mientras este router esté montado
+jobs = [
+    PeriodicJob(
+        "restaurant_snapshots",
+        int(os.getenv("RESTAURANT_SNAPSHOT_INTERVAL", "3600")),
+        lambda: refresh_snapshots(db),
+    ),
+    PeriodicJob(
+        "distinct_user_sketches",
+        int(os.getenv("SKETCH_FLUSH_INTERVAL", "60")),
+        sketches.flush,
+        on_shutdown=sketches.flush,
+        # Los sketches viven en memoria de cada worker: se guardan aunque tenga ENABLE_SCHEDULED_JOBS=0
+        every_worker=True,
+    ),
+    PeriodicJob(
+        "distinct_user_compaction",
+        int(os.getenv("SKETCH_COMPACTION_INTERVAL", "3600")),
+        sketches.compact,
+    ),
+    PeriodicJob(
+        "daily_counters",
+        float(os.getenv("COUNTER_FLUSH_INTERVAL", "1")),
+        counters.flush,
+        on_shutdown=counters.flush,
+        every_worker=True,
+    ),
+    PeriodicJob(
+        "demand_forecast",
+        int(os.getenv("FORECAST_INTERVAL", "3600")),
+        forecaster.rebuild,
+        # Cada worker necesita el pronóstico; con archivo compartido solo lo calcula el que tiene el lock
+        every_worker=True,
+    ),
+]
+
+router = APIRouter(lifespan=lifespan_for(jobs))
+
+# Fuentes de /analytics/heatmap: consulta base, campo de fecha ("iso" = texto ISO, "timestamp" = Timestamp),
+# campos por los que se puede filtrar y campo numérico que se suma, si lo hay
+HEATMAP_SOURCES = {
+    "screen_times": {
+        "query": lambda: db.collection("screen_times"),
+        "field": "timestamp", "kind": "iso", "filters": {"screen_name"}, "weight": "duration",
+    },
+    "detail_events": {
+        "query": lambda: db.collection("detail_events"),
+        "field": "timestamp", "kind": "timestamp",
+        "filters": {"event_type", "restaurant_name", "product_name"}, "weight": None,
+    },
+    "cancellations": {
+        "query": lambda: db.collection_group("orders").where("status", "==", "cancelled"),
+        "field": "cancelledAt", "kind": "iso", "filters": {"productName"}, "weight": None,
+    },
+}
+
+
+class ScreenTimeData(BaseModel):
+    screen_name: str
+    duration: int
+    timestamp: str
+
+class FeatureUsageEvent(BaseModel):
+    feature: str
+    user_id: str
+    timestamp: Optional[str] = None
+    count: int = Field(1, ge=1)
+
+class RestaurantVisitEvent(BaseModel):
+    restaurant: str
+    user_id: str
+    timestamp: Optional[str] = None
+    count: int = Field(1, ge=1)
+
+class CancellationTimeStats(BaseModel):
+    hour: int
+    total_cancellations: int
+    percentage: float
+    most_canceled_product: str
+    example_cancellation_time: str
+
+
+@router.get("/features-usage")
+def get_features_usage(period: DateRange = Depends(date_range)):
+    try:
+        features_ref = period.daily_documents(db.collection("feature_usage")).stream()
+        usage_by_month = {}
+
+        for feature in features_ref:
+            data = feature.to_dict()
+            doc_id = feature.id  # El nombre del documento es la fecha (YYYY-MM-DD)
+            
+            # Extraer el mes del ID del documento
+            bucket = day_bucket(doc_id)
+            if bucket is None:
+                continue  # Ignorar si el ID no tiene el formato esperado
+            month = bucket[1]
+
+            # Inicializar el mes en el diccionario si no existe
+            if month not in usage_by_month:
+                usage_by_month[month] = {}
+
+            # Sumar los accesos por cada funcionalidad
+            for feature_name, count in data.items():
+                if feature_name == "last_used_by":
+                    continue  # Ignorar el campo de usuario
+                if feature_name not in usage_by_month[month]:
+                    usage_by_month[month][feature_name] = 0
+                usage_by_month[month][feature_name] += count
+
+        return {"features_usage_by_month": usage_by_month}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener el uso de funcionalidades: {str(e)}")
+
+
+@router.get("/features-increasing-rate")
+def get_features_increasing_rate(period: DateRange = Depends(date_range)):
+    try:
+        features_ref = period.daily_documents(db.collection("feature_usage")).stream()
+        usage_by_month = {}
+
+        # Paso 1: Agrupar los datos por mes
+        for feature in features_ref:
+            data = feature.to_dict()
+            doc_id = feature.id  # El nombre del documento es la fecha (YYYY-MM-DD)
+
+            # Extraer el mes del ID del documento
+            bucket = day_bucket(doc_id)
+            if bucket is None:
+                continue  # Ignorar si el ID no tiene el formato esperado
+            month = bucket[1]
+
+            # Inicializar el mes en el diccionario si no existe
+            if month not in usage_by_month:
+                usage_by_month[month] = {}
+
+            # Sumar los accesos por cada funcionalidad
+            for feature_name, count in data.items():
+                if feature_name == "last_used_by":
+                    continue  # Ignorar el campo de usuario
+                if feature_name not in usage_by_month[month]:
+                    usage_by_month[month][feature_name] = 0
+                usage_by_month[month][feature_name] += count
+
+        # Paso 2: Calcular el rate de aumento mensual para cada pantalla
+        increasing_rate = {}
+
+        # Obtener los meses en orden cronológico
+        sorted_months = sorted(usage_by_month.keys())
+
+        # Calcular la tasa de aumento para cada vista
+        for month in sorted_months:
+            for feature_name, count in usage_by_month[month].items():
+                if feature_name == "last_used_by":
+                    continue  # Ignorar el campo de usuario
+                if feature_name not in increasing_rate:
+                    increasing_rate[feature_name] = []
+
+                # Obtenemos el count del mes anterior si existe
+                previous_count = 0
+                if sorted_months.index(month) > 0:
+                    previous_month = sorted_months[sorted_months.index(month) - 1]
+                    previous_count = usage_by_month[previous_month].get(feature_name, 0)
+
+                # Calculamos el rate
+                if previous_count != 0:
+                    rate = round((count - previous_count) / previous_count * 100, 2)
+                else:
+                    rate = 0
+
+                # Añadimos al resultado el rate y la fecha
+                increasing_rate[feature_name].append({month: rate})
+
+        # Reorganizar el JSON como se pide, con la fecha como clave y rate de cada view
+        result = {}
+        for feature_name, rates in increasing_rate.items():
+            for rate in rates:
+                for month, value in rate.items():
+                    if month not in result:
+                        result[month] = {}
+                    result[month][feature_name] = value
+
+        return {"features_increasing_rate": result}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener el aumento de uso de funcionalidades: {str(e)}")
+
+@router.get("/features-increasing-rate-daily")
+def get_features_increasing_rate(period: DateRange = Depends(date_range)):
+    try:
+        features_ref = period.daily_documents(db.collection("feature_usage")).stream()
+        usage_by_day = {}
+
+        # Paso 1: Agrupar los datos por día
+        for feature in features_ref:
+            data = feature.to_dict()
+            doc_id = feature.id  # El nombre del documento es la fecha (YYYY-MM-DD)
+
+            # Extraer el día del ID del documento
+            bucket = day_bucket(doc_id)
+            if bucket is None:
+                continue  # Ignorar si el ID no tiene el formato esperado
+            day = bucket[0]
+
+            # Inicializar el día en el diccionario si no existe
+            if day not in usage_by_day:
+                usage_by_day[day] = {}
+
+            # Sumar los accesos por cada funcionalidad
+            for feature_name, count in data.items():
+                if feature_name == "last_used_by":
+                    continue  # Ignorar el campo de usuario
+                if feature_name not in usage_by_day[day]:
+                    usage_by_day[day][feature_name] = 0
+                usage_by_day[day][feature_name] += count
+
+        # Paso 2: Calcular el rate de aumento diario para cada vista
+        increasing_rate = {}
+
+        # Obtener los días en orden cronológico
+        sorted_days = sorted(usage_by_day.keys())
+
+        # Calcular la tasa de aumento para cada vista
+        for day in sorted_days:
+            for feature_name, count in usage_by_day[day].items():
+                if feature_name == "last_used_by":
+                    continue  # Ignorar el campo de usuario
+                if feature_name not in increasing_rate:
+                    increasing_rate[feature_name] = []
+
+                # Obtenemos el count del día anterior si existe
+                previous_count = 0
+                if sorted_days.index(day) > 0:
+                    previous_day = sorted_days[sorted_days.index(day) - 1]
+                    previous_count = usage_by_day[previous_day].get(feature_name, 0)
+
+                # Calculamos el rate de aumento
+                if previous_count != 0:
+                    rate = round((count - previous_count) / previous_count * 100, 2)
+                else:
+                    rate = 0
+
+                # Añadimos al resultado el rate y la fecha
+                increasing_rate[feature_name].append({day: rate})
+
+        # Reorganizar el JSON como se pide, con la fecha como clave y rate de cada view
+        result = {}
+        for feature_name, rates in increasing_rate.items():
+            for rate in rates:
+                for day, value in rate.items():
+                    if day not in result:
+                        result[day] = {}
+                    result[day][feature_name] = value
+
+        return {"features_increasing_rate": result}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener el aumento de uso de funcionalidades: {str(e)}")
+
+
+@router.post("/analyticspages")
+def track_screen_time(data: ScreenTimeData):
+    try:
+        # Guarda los datos en Firestore
+        doc_ref = db.collection("screen_times").document()
+        doc_ref.set({
+            "screen_name": data.screen_name,
+            "duration": data.duration,
+            "timestamp": data.timestamp,
+        })
+        return {"message": "Datos guardados exitosamente"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/screen-analytics")
+def get_screen_analytics(period: DateRange = Depends(date_range)):
+    try:
+        screen_times_ref = db.collection("screen_times")
+        docs = period.filter_local_iso_field(screen_times_ref, "timestamp").stream()
+        rows = [doc.to_dict() for doc in docs]
+        local = local_datetimes([row.get("timestamp") for row in rows])
+        # Solo los días locales pedidos: la consulta trae un día de margen por las zonas
+        inside = period.local_mask(local)
+        rows = [row for row, keep in zip(rows, inside) if keep]
+
+        # Sesiones y duración por pantalla y hora local, en una sola pasada
+        heat = histogram(
+            local[inside],
+            weights=[row.get("duration") for row in rows],
+            keys=[row.get("screen_name") for row in rows],
+        )
+        sessions = heat.by_hour()
+        durations = heat.sums.sum(axis=1)
+
+        # Calcular el tiempo promedio por pantalla y por hora
+        analytics = []
+        for i, screen_name in enumerate(heat.keys):
+            hourly = [
+                {
+                    "hour": int(hour),
+                    "total_duration": int(durations[i, hour]),
+                    "session_count": int(sessions[i, hour]),
+                    "avg_duration": durations[i, hour] / sessions[i, hour],
+                }
+                for hour in np.nonzero(sessions[i])[0]
+            ]
+            if hourly:
+                analytics.append({"screen_name": screen_name, "hourly_analytics": hourly})
+
+        # Ordenar por tiempo total descendente
+        analytics.sort(key=lambda x: sum(h["total_duration"] for h in x["hourly_analytics"]), reverse=True)
+
+        return {"analytics": analytics}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/average-time-spent")
+def get_average_time_spent(period: DateRange = Depends(date_range)):
+    try:
+        # Obtén los datos de la colección de tiempos de pantalla
+        screen_times_ref = db.collection("screen_times")
+        docs = list(period.filter_local_iso_field(screen_times_ref, "timestamp").stream())
+        inside = period.local_mask(local_datetimes([doc.to_dict().get("timestamp") for doc in docs]))
+
+        # Inicializa un diccionario para almacenar la duración total y la cantidad de sesiones por pantalla
+        screen_data = defaultdict(lambda: {"total_duration": 0, "session_count": 0})
+
+        # Procesa los documentos para sumar la duración por pantalla
+        for doc, keep in zip(docs, inside):
+            if not keep:
+                continue
+            data = doc.to_dict()
+            screen_name = data["screen_name"]
+            duration = data["duration"]
+
+            # Suma la duración total y aumenta el contador de sesiones para cada pantalla
+            if screen_name == "HomePage" or screen_name == "SearchPage":
+                screen_data[screen_name]["total_duration"] += duration
+                screen_data[screen_name]["session_count"] += 1
+
+        # Calcula el tiempo promedio por pantalla
+        average_time_spent = []
+        for screen_name, data in screen_data.items():
+            if data["session_count"] > 0:
+                avg_duration = data["total_duration"] / data["session_count"]
+                average_time_spent.append({
+                    "screen_name": screen_name,
+                    "average_duration": avg_duration,
+                    "session_count": data["session_count"],
+                })
+
+        return {"average_time_spent": average_time_spent}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/devices-summary")
+def get_devices_summary():
+    try:
+        devices_ref = db.collection("userDevices").stream()
+        model_counts = defaultdict(int)
+
+        for doc in devices_ref:
+            data = doc.to_dict()
+            model = data.get("model", "Unknown")
+            model_counts[model] += 1
+
+        result = [{"model": model, "count": count} for model, count in model_counts.items()]
+        result.sort(key=lambda x: x["count"], reverse=True)
+
+        return {"device_model_distribution": result}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving device summary: {str(e)}")
+    
+
+@router.get("/top-products")
+def obtener_top_productos():
+    ordenes_ref = db.collection('product_orders')
+    ordenes = ordenes_ref.stream()
+
+    productos = defaultdict(int)
+
+    for orden in ordenes:
+        data = orden.to_dict()
+        nombre = data.get("nameProduct", "Desconocido")
+        cantidad = data.get("quantity", 0)
+
+        # Asegurarse que cantidad sea numérico
+        try:
+            cantidad = int(cantidad)
+        except:
+            cantidad = 0
+
+        productos[nombre] += cantidad
+
+    # Convertir a lista y ordenar
+    productos_ordenados = sorted(
+        [{"nameProduct": k, "totalQuantity": v} for k, v in productos.items()],
+        key=lambda x: x["totalQuantity"],
+        reverse=True
+    )
+
+    return {"topProductos": productos_ordenados}
+    
+
+
+#Endpoint para devolver conteos totales de cada tipo de evento
+@router.get("/analytics/detail-feature-usage")
+def get_detail_feature_usage(period: DateRange = Depends(date_range)):
+    try:
+        counts = {"order": 0, "directions": 0}
+        for doc in period.filter_timestamp_field(db.collection("detail_events"), "timestamp").stream():
+            et = doc.to_dict().get("event_type")
+            if et in counts:
+                counts[et] += 1
+        return counts
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching analytics: {e}")
+    
+@router.get("/analytics/most-liked-restaurants")
+def get_most_liked_restaurants(period: DateRange = Depends(date_range)):
+    # Obtener las visitas a los restaurantes desde Firestore
+    visitas_ref = db.collection('restaurant_visits')
+    visitas = period.daily_documents(visitas_ref).stream()
+
+    restaurantes_por_mes = defaultdict(lambda: defaultdict(int))  # {mes: {restaurante: visitas}}
+
+    # Contar las visitas por mes y restaurante
+    for visita in visitas:
+        data = visita.to_dict()
+        document_date = visita.id  # Usamos el ID del documento como la fecha (por ejemplo, "2025-04-26")
+        
+        # Extraer solo el mes y año (formato YYYY-MM)
+        bucket = day_bucket(document_date)
+        if bucket is None:
+            continue  # Ignorar si el ID no tiene el formato esperado
+        mes_anio = bucket[1]  # "2025-04"
+
+        for restaurant_name, visits in data.items():
+            if restaurant_name != "last_visited_by":  # Ignorar el campo 'last_visited_by'
+                try:
+                    visitas_restaurante = int(visits)
+                except ValueError:
+                    visitas_restaurante = 0
+
+                # Agregar al contador total de visitas por mes y restaurante
+                restaurantes_por_mes[mes_anio][restaurant_name] += visitas_restaurante
+
+    # Preparar la lista de resultados por mes
+    resultados = []
+    for mes_anio, restaurantes in restaurantes_por_mes.items():
+        restaurantes_ordenados = sorted(
+            [{"restaurantName": k, "totalVisits": v} for k, v in restaurantes.items()],
+            key=lambda x: x["totalVisits"],
+            reverse=True
+        )
+        resultados.append({"mes": mes_anio, "topRestaurantes": restaurantes_ordenados})
+
+    return {"analytics": resultados}
+
+
+
+@router.get("/analytics/orders-by-weekday")
+def get_orders_by_weekday(period: DateRange = Depends(date_range)):
+    try:
+        orders_query = db.collection("detail_events").where("event_type", "==", "order")
+        orders_ref = period.filter_timestamp_field(orders_query, "timestamp").stream()
+        timestamps = [doc.to_dict().get("timestamp") for doc in orders_ref]
+
+        # Día de la semana en hora local (America/Bogota), no en UTC
+        counts = histogram(local_datetimes(timestamps)).by_weekday()
+
+        # Opcional: ordenado por mayor cantidad
+        sorted_counts = {
+            WEEKDAYS[day]: int(counts[day]) for day in np.argsort(-counts, kind="stable") if counts[day]
+        }
+
+        return {
+            "orders_by_weekday": sorted_counts
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/android-version-summary")
+def get_android_version_summary():
+    try:
+        devices_ref = db.collection("userDevices").stream()
+        version_counts = defaultdict(int)
+
+        for doc in devices_ref:
+            data = doc.to_dict()
+            os_version = data.get("osVersion", "Unknown")
+            version_counts[os_version] += 1
+
+        result = [{"android_version": version, "count": count} for version, count in version_counts.items()]
+        result.sort(key=lambda x: x["count"], reverse=True)
+
+        return {"android_version_distribution": result}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving Android version summary: {str(e)}")
+    
+
+@router.get("/analytics/most-products-ordered")
+def get_most_products_ordered(period: DateRange = Depends(date_range)):
+    # Obtener las visitas a los restaurantes desde Firestore
+    visitas_ref = db.collection('orders_product')
+    visitas = period.daily_documents(visitas_ref).stream()
+
+    restaurantes_por_mes = defaultdict(lambda: defaultdict(int))  # {mes: {restaurante: visitas}}
+
+    # Contar las visitas por mes y restaurante
+    for visita in visitas:
+        data = visita.to_dict()
+        document_date = visita.id  # Usamos el ID del documento como la fecha (por ejemplo, "2025-04-26")
+        
+        # Extraer solo el mes y año (formato YYYY-MM)
+        bucket = day_bucket(document_date)
+        if bucket is None:
+            continue  # Ignorar si el ID no tiene el formato esperado
+        mes_anio = bucket[1]  # "2025-04"
+
+        for restaurant_name, visits in data.items():
+            if restaurant_name != "last_visited_by":  # Ignorar el campo 'last_visited_by'
+                try:
+                    visitas_restaurante = int(visits)
+                except ValueError:
+                    visitas_restaurante = 0
+
+                # Agregar al contador total de visitas por mes y restaurante
+                restaurantes_por_mes[mes_anio][restaurant_name] += visitas_restaurante
+
+    # Preparar la lista de resultados por mes
+    resultados = []
+    for mes_anio, restaurantes in restaurantes_por_mes.items():
+        restaurantes_ordenados = sorted(
+            [{"productName": k, "totalOrdered": v} for k, v in restaurantes.items()],
+            key=lambda x: x["totalOrdered"],
+            reverse=True
+        )
+        resultados.append({"mes": mes_anio, "topProductos": restaurantes_ordenados[:5]})
+
+    return resultados
+
+
+def _iso_example(value):
+    # Como antes del histograma vectorizado: la cancelación tal como se guardó, con su zona si la tiene
+    if isinstance(value, datetime):
+        return value.isoformat()
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).isoformat()
+    except ValueError:
+        return value
+
+
+@router.get("/cancellation-time-stats", response_model=List[CancellationTimeStats])
+def get_cancellation_time_stats(period: DateRange = Depends(date_range)):
+    """
+    Analyzes at what time of day most order cancellations occur.
+    Returns statistics grouped by local hour of day (ANALYTICS_TIMEZONE), for the given range or the last 30 days.
+    """
+    # Calculate date range (last 30 days unless `from`/`to` are given)
+    if period.is_open:
+        period = DateRange(start=(datetime.now() - timedelta(days=30)).date())
+    
+    cancel_times = []
+    product_names = []
+    
+    # Get all users
+    users_ref = db.collection('users')
+    users = users_ref.stream()
+    
+    for user in users:
+        # Get user's orders from the last month
+        orders_ref = users_ref.document(user.id).collection('orders')
+        orders_query = period.filter_local_iso_field(orders_ref.where('status', '==', 'cancelled'), 'cancelledAt')
+        
+        for order in orders_query.stream():
+            order_data = order.to_dict()
+            if order_data.get('cancelledAt'):
+                cancel_times.append(order_data['cancelledAt'])
+                product_names.append(order_data.get('productName', 'Unknown'))
+
+    # Cancelaciones por producto y hora local en una sola pasada, solo en los días locales pedidos
+    local = local_datetimes(cancel_times)
+    inside = period.local_mask(local)
+    cancel_times = [value for value, keep in zip(cancel_times, inside) if keep]
+    product_names = [name for name, keep in zip(product_names, inside) if keep]
+    local = local[inside]
+    product_by_hour = histogram(local, keys=product_names)
+    per_product = product_by_hour.by_hour()
+    hourly_stats = per_product.sum(axis=0)
+    _, hours, valid = weekday_hour(local)
+    total_cancellations = int(hourly_stats.sum())
+    
+    # Prepare response
+    results = []
+    for hour in np.nonzero(hourly_stats)[0]:
+        cancellations = int(hourly_stats[hour])
+        # Primera cancelación registrada en esa hora, como ejemplo, en el formato ISO original
+        example = cancel_times[int(np.argmax(valid & (hours == hour)))]
+        
+        results.append({
+            "hour": int(hour),
+            "total_cancellations": cancellations,
+            "percentage": (cancellations / total_cancellations * 100) if total_cancellations > 0 else 0,
+            "most_canceled_product": product_by_hour.keys[int(np.argmax(per_product[:, hour]))],
+            "example_cancellation_time": _iso_example(example),
+        })
+    
+    return results
+
+
+@router.get("/analytics/restaurants/{name}")
+def get_restaurant_analytics(name: str, month: Optional[str] = None):
+    """
+    Visitas, pedidos y cancelaciones de un restaurante en un mes (YYYY-MM, por defecto el actual),
+    leídos del snapshot que mantiene el job ``restaurant_snapshots``.
+    """
+    month = month or datetime.now().strftime("%Y-%m")
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El mes debe tener formato YYYY-MM")
+
+    try:
+        doc = db.collection(SNAPSHOTS_COLLECTION).document(snapshot_id(name, month)).get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="No hay analíticas para ese restaurante y mes")
+    return doc.to_dict()
+
+
+def _event_day(timestamp):
+    if not timestamp:
+        return None
+    bucket = day_bucket(timestamp[:10])
+    if bucket is None:
+        raise HTTPException(status_code=400, detail="El timestamp debe empezar con una fecha YYYY-MM-DD")
+    return bucket[0]
+
+
+@router.post("/analytics/feature-usage")
+def track_feature_usage(event: FeatureUsageEvent):
+    day = _event_day(event.timestamp)
+    # Acumular el contador diario (se escribe en el próximo flush) y registrar el usuario en el sketch
+    counters.increment("feature_usage", event.feature, event.count, day)
+    sketches.record(FEATURE, event.feature, event.user_id, day)
+    return {"message": "Uso registrado"}
+
+
+@router.post("/analytics/restaurant-visits")
+def track_restaurant_visit(event: RestaurantVisitEvent):
+    day = _event_day(event.timestamp)
+    # Acumular el contador diario (se escribe en el próximo flush) y registrar el usuario en el sketch
+    counters.increment("restaurant_visits", event.restaurant, event.count, day)
+    sketches.record(RESTAURANT, event.restaurant, event.user_id, day)
+    return {"message": "Visita registrada"}
+
+
+@router.get("/analytics/features/distinct-users")
+def get_features_distinct_users(
+    granularity: str = Query("month", pattern="^(day|month)$"),
+    period: DateRange = Depends(date_range),
+):
+    """Usuarios distintos aproximados por funcionalidad, por día o por mes."""
+    try:
+        return {"distinct_users": sketches.distinct_users(FEATURE, period, granularity)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/restaurants-distinct-visitors")
+def get_restaurants_distinct_visitors(
+    granularity: str = Query("month", pattern="^(day|month)$"),
+    period: DateRange = Depends(date_range),
+):
+    """Visitantes distintos aproximados por restaurante, por día o por mes."""
+    try:
+        return {"distinct_visitors": sketches.distinct_users(RESTAURANT, period, granularity)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/forecast/{restaurant}")
+def get_demand_forecast(restaurant: str):
+    """Demanda pronosticada y stock sugerido por producto, desde el caché del job ``demand_forecast``."""
+    forecast = forecaster.get(restaurant)
+    if forecast is None:
+        raise HTTPException(status_code=503, detail="El pronóstico todavía no está disponible")
+    if not forecast:
+        raise HTTPException(status_code=404, detail="Restaurante no encontrado")
+    return forecast
+
+
+@router.get("/analytics/heatmap")
+def get_heatmap(
+    collection: str = Query(..., description=f"Una de: {', '.join(HEATMAP_SOURCES)}"),
+    filters: List[str] = Query([], alias="filter", description="campo:valor, se puede repetir"),
+    period: DateRange = Depends(date_range),
+):
+    """Eventos por día de la semana x hora local (ANALYTICS_TIMEZONE) para una colección."""
+    source = HEATMAP_SOURCES.get(collection)
+    if source is None:
+        raise HTTPException(status_code=400, detail=f"Colección no soportada: {collection}")
+
+    query = source["query"]()
+    for expression in filters:
+        field, separator, value = expression.partition(":")
+        if not separator or field not in source["filters"]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Filtro inválido '{expression}'; campos permitidos: {', '.join(sorted(source['filters']))}",
+            )
+        query = query.where(field, "==", value)
+    if source["kind"] == "iso":
+        query = period.filter_local_iso_field(query, source["field"])
+    else:
+        query = period.filter_timestamp_field(query, source["field"])
+
+    try:
+        rows = [doc.to_dict() for doc in query.stream()]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    local = local_datetimes([row.get(source["field"]) for row in rows])
+    if source["kind"] == "iso":
+        inside = period.local_mask(local)
+        rows = [row for row, keep in zip(rows, inside) if keep]
+        local = local[inside]
+    weight = source["weight"]
+    heat = histogram(
+        local,
+        weights=[row.get(weight) for row in rows] if weight else None,
+    )
+    response = {
+        "collection": collection,
+        "timezone": DEFAULT_TIMEZONE,
+        "total": heat.total,
+        "weekdays": WEEKDAYS,
+        "counts": heat.counts.tolist(),
+        "by_weekday": dict(zip(WEEKDAYS, heat.by_weekday().tolist())),
+        "by_hour": heat.by_hour().tolist(),
+    }
+    if weight:
+        response[f"{weight}_sums"] = heat.sums.tolist()
+    return response
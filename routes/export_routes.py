@@ -0,0 +1,172 @@
+import csv
+import io
+import itertools
+import zlib
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from services.firebase_service import db
+
+router = APIRouter()
+
+# Colecciones de datos crudos que se pueden exportar
+EXPORTABLE_COLLECTIONS = {"screen_times", "detail_events", "userDevices"}
+MAX_PAGE_SIZE = 5000
+# Tamaño mínimo de cada chunk enviado: una fila por chunk cuesta un salto al threadpool y un send por fila
+CHUNK_SIZE = 64 * 1024
+
+
+def _default(value):
+    # Timestamps de Firestore y cualquier otro tipo no nativo de JSON
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _accepts_gzip(accept_encoding):
+    """True si ``Accept-Encoding`` acepta gzip con q > 0 (explícito, como x-gzip o por "*")."""
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def _pages(collection, page_size):
+    """Recorre la colección por páginas usando el id del documento como cursor."""
+    query = db.collection(collection).order_by(FieldPath.document_id()).limit(page_size)
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        docs = list(page.stream())
+        if docs:
+            yield docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def _chunked(pages, encode):
+    """Junta las filas en chunks de ``CHUNK_SIZE``; al final de cada página se envía lo acumulado."""
+    buffer = bytearray()
+    for docs in pages:
+        for doc in docs:
+            buffer += encode(doc)
+            if len(buffer) >= CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+            buffer.clear()
+
+
+def _ndjson_lines(pages):
+    return _chunked(pages, lambda doc: orjson.dumps({"id": doc.id, **doc.to_dict()}, default=_default) + b"\n")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value, default=_default).decode()
+    return _default(value) if not isinstance(value, (str, int, float, bool)) else value
+
+
+def _csv_lines(pages, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pages = iter(pages)
+
+    first = next(pages, None)
+    if fields is None:
+        # Sin `fields`, las columnas salen del primer documento
+        fields = ["id"] + sorted(first[0].to_dict().keys()) if first is not None else ["id"]
+    writer.writerow(fields)
+    header = buffer.getvalue().encode()
+
+    def row(doc):
+        buffer.seek(0)
+        buffer.truncate()
+        data = doc.to_dict()
+        data["id"] = doc.id
+        writer.writerow([_csv_value(data.get(field)) for field in fields])
+        return buffer.getvalue().encode()
+
+    if first is None:
+        yield header
+        return
+    chunks = _chunked(itertools.chain([first], pages), row)
+    yield header + next(chunks)
+    yield from chunks
+
+
+def _gzip(chunks, flush_every=64 * 1024):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if data:
+            yield data
+        if pending >= flush_every:
+            # Vaciar el compresor periódicamente para que el cliente reciba datos continuamente
+            flushed = compressor.flush(zlib.Z_SYNC_FLUSH)
+            if flushed:
+                yield flushed
+            pending = 0
+    yield compressor.flush()
+
+
+@router.get("/export/{collection}")
+def export_collection(
+    collection: str,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    fields: Optional[str] = Query(None, description="Columnas del CSV separadas por coma"),
+    page_size: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    gzip: Optional[bool] = Query(None, description="Comprimir la respuesta (por defecto según Accept-Encoding)"),
+):
+    """
+    Exporta una colección completa como NDJSON o CSV en streaming: se lee de Firestore
+    página por página con cursor, así que la memoria no depende del tamaño de la colección.
+    """
+    if collection not in EXPORTABLE_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"La colección {collection} no se puede exportar")
+
+    pages = _pages(collection, page_size)
+    if format == "csv":
+        columns = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        chunks = _csv_lines(pages, columns)
+        media_type = "text/csv"
+    else:
+        chunks = _ndjson_lines(pages)
+        media_type = "application/x-ndjson"
+
+    # La respuesta cambia según Accept-Encoding aunque esta vez no vaya comprimida
+    headers = {"Content-Disposition": f'attachment; filename="{collection}.{format}"',
+               "Vary": "Accept-Encoding"}
+    if gzip is None:
+        gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    if gzip:
+        chunks = _gzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
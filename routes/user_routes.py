@@ -0,0 +1,573 @@
+from datetime import datetime
+import os
+import uuid
+from uuid import uuid4
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi import security, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from firebase_admin import firestore, auth
+from pydantic import BaseModel
+from streamlit import _event
+from typing import List, Optional
+
+from services.batch_get import get_many, parse_ids
+from services.catalog_cache import CatalogCache, CatalogPublisher, encode, json_bytes_response
+from services.firebase_service import db, get_firebase_app
+from services.firestore_metrics import register_metrics
+from services.idempotency import IdempotencyCache, default_store, fingerprint
+from services.recommendations import Recommender
+from services.scheduler import PeriodicJob, lifespan_for
+from services.stock_stream import StockBroadcaster
+
+# Índice de recomendaciones, reconstruido periódicamente a partir de los pedidos;
+# compartido entre workers con RECOMMENDATIONS_SHARED_PATH
+recommender = Recommender(db)
+
+# Jobs periódicos de la API principal; corren mientras este router esté montado
+jobs = [
+    PeriodicJob(
+        "recommendations",
+        int(os.getenv("RECOMMENDATIONS_INTERVAL", "3600")),
+        recommender.rebuild,
+        # Cada worker necesita el índice; con archivo compartido solo lo construye el que tiene el lock
+        every_worker=True,
+    ),
+]
+
+router = APIRouter(lifespan=lifespan_for(jobs))
+security =  HTTPBearer()
+
+# Modelo Pydantic para un usuario
+class User(BaseModel):
+    name: str
+    email: str
+    password: str
+    address: str
+    birthday: str
+    
+class Product(BaseModel):
+    productId: int
+    productName: str
+    amount: int
+    available: bool
+    discountPrice: float
+    originalPrice: float
+    
+
+class Restaurant(BaseModel):
+    name: str
+    imageUrl: str
+    description: str
+    latitude: float
+    longitude: float
+    address: str
+    products: List[Product]
+    rating: float
+    type: int
+
+
+class OrderRequest(BaseModel):
+    product_id: int
+    quantity: int
+
+
+# Catálogo de restaurantes validado y pre-serializado; compartido entre workers con CATALOG_SHARED_PATH
+catalog = CatalogCache(db, Restaurant)
+if catalog.shared_path:
+    # Solo publica el worker que obtiene el lock del archivo; en los demás el job no hace nada
+    jobs.append(PeriodicJob(
+        "catalog_publisher",
+        float(os.getenv("CATALOG_PUBLISH_INTERVAL", "0.25")),
+        CatalogPublisher(catalog).run_once,
+    ))
+
+# Cambios de stock para los clientes conectados a /restaurants/stream, detectados entre generaciones del catálogo
+stock_stream = StockBroadcaster(catalog.get)
+register_metrics("stock_stream", stock_stream.render_metrics)
+
+# Respuestas de los pedidos por Idempotency-Key, para que los reintentos no descuenten stock dos veces
+idempotency = IdempotencyCache(default_store(db))
+register_metrics("idempotency", idempotency.render_metrics)
+
+    
+# Verificar el token de autenticación
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        decoded_token = auth.verify_id_token(credentials.credentials, app=get_firebase_app())
+        return decoded_token
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid authentication token")
+
+
+
+# Ruta para registro (Sign Up)
+@router.post("/signup")
+def signup(user: User):
+    try:
+        # Verificar si el usuario YA EXISTE en Firebase Auth
+        try:
+            firebase_user = auth.get_user_by_email(user.email, app=get_firebase_app())
+            user_id = firebase_user.uid
+            print(f"Usuario {user.email} ya existe en Firebase Auth con UID: {user_id}")
+            
+            # Lanzar error explícito
+            raise HTTPException(status_code=409, detail="Este correo ya está registrado.")
+        
+        except auth.UserNotFoundError:
+            print(f"Usuario {user.email} NO encontrado en Firebase Auth. Creándolo...")
+            firebase_user = auth.create_user(
+                email=user.email,
+                password=user.password,
+                app=get_firebase_app(),
+            )
+            user_id = firebase_user.uid  # Nuevo UID
+
+        # Guardar datos del usuario en Firestore
+        user_data = {
+            "name": user.name,
+            "email": user.email,
+            "address": user.address,
+            "birthday": user.birthday,
+            "created_at": datetime.now(),
+        }
+        db.collection('users').document(user_id).set(user_data)
+
+        return {"message": "User created successfully", "uid": user_id}
+
+    except Exception as e:
+        print(f"⚠ Error en el registro: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Ruta para obtener datos del usuario (Log In)
+@router.get("/users/me")
+def get_user_data(user: dict = Depends(get_current_user)):
+    user_id = user["uid"]
+    print(f"Buscando usuario en Firestore con UID: {user_id}")
+    
+    doc_ref = db.collection('users').document(user_id)
+    doc = doc_ref.get()
+    
+    if not doc.exists:
+        print(f"Usuario con UID {user_id} no encontrado en Firestore")
+        raise HTTPException(status_code=404, detail="User not found") 
+
+    return doc.to_dict()
+
+
+# Crear un nuevo usuario
+@router.post("/users/{user_id}")
+def create_user(user_id: str, user: User):
+    doc_ref = db.collection('users').document(user_id)
+    doc_ref.set(user.dict())
+    _event("user_created", {"user_id": user_id})
+    return {"message": "User created successfully"}
+
+# Obtener datos de un usuario
+# Varios usuarios en una sola llamada: /users?ids=uid1,uid2
+@router.get("/users")
+def get_users(ids: List[str] = Query(..., description="Ids de usuario separados por coma")):
+    user_ids = parse_ids(ids)
+    try:
+        users, missing = get_many(db, "users", user_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"users": users, "missing": missing}
+
+@router.get("/users/{user_id}")
+def get_user(user_id: str):
+    doc = db.collection('users').document(user_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="User not found")
+    _event("user_fetched", {"user_id": user_id})
+    return doc.to_dict()
+
+# Actualizar un usuario
+@router.put("/users/{user_id}")
+def update_user(user_id: str, user: User):
+    doc_ref = db.collection('users').document(user_id)
+    doc_ref.update(user.dict())
+    _event("user_updated", {"user_id": user_id})
+    return {"message": "User updated successfully"}
+
+# Eliminar un usuario
+@router.delete("/users/{user_id}")
+def delete_user(user_id: str):
+    doc_ref = db.collection('users').document(user_id)
+    doc_ref.delete()
+    _event("user_deleted", {"user_id": user_id})
+    return {"message": "User deleted successfully"}
+
+
+# Ruta para obtener todos los restaurantes
+@router.get("/restaurants", response_model=List[Restaurant])
+def get_restaurants():
+    try:
+        # El catálogo ya está validado y codificado en el snapshot; la lista completa se sirve tal cual
+        return json_bytes_response(catalog.get().all_json())
+
+    except Exception as e:
+        print(f"Error al obtener restaurantes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Cambios de stock y disponibilidad en tiempo real (Server-Sent Events)
+@router.get("/restaurants/stream")
+async def stream_stock_changes():
+    return StreamingResponse(
+        stock_stream.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Ruta para obtener un restaurante por tipo
+@router.get("/restaurants/type/{type}", response_model=List[Restaurant])
+def get_restaurants_by_type(type: int):
+    try:
+        return json_bytes_response(catalog.get().by_type_json(type))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Ruta para buscar restaurantes por nombre o productos
+@router.get("/restaurants/search/{query}", response_model=List[Restaurant])
+def search_restaurants(query: str):
+    try:
+        # Normalizar el query eliminando espacios y convirtiendo a minúsculas, luego separar en palabras
+        query_normalized = query.strip().lower().replace(" ", "")
+        query_words = query_normalized.split()
+
+        # Coincide si alguna palabra está en el nombre normalizado o en el nombre de algún producto
+        return json_bytes_response(catalog.get().search_json(query_words))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+        
+# Varios productos en una sola llamada: /products?ids=1,2,3 (misma forma que /products/{product_id})
+@router.get("/products")
+def get_products(ids: List[str] = Query(..., description="Ids de producto separados por coma")):
+    try:
+        product_ids = list(dict.fromkeys(int(product_id) for product_id in parse_ids(ids)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Los ids de producto deben ser enteros")
+
+    try:
+        snapshot = catalog.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    products, missing = {}, []
+    for product_id in product_ids:
+        match = snapshot.product(product_id)
+        if match is None:
+            missing.append(product_id)
+            continue
+        doc_id, restaurant = match
+        products[str(product_id)] = {
+            **restaurant,
+            "products": [
+                {**product, "restaurantId": doc_id} if product["productId"] == product_id else product
+                for product in restaurant["products"]
+            ],
+        }
+    return json_bytes_response(encode({"products": products, "missing": missing}))
+
+
+@router.get("/products/{product_id}")
+def get_product_by_id(product_id: int):
+    try:
+        # Obtener todos los documentos de la colección restaurants
+        restaurants_ref = db.collection("retaurants").stream()
+        
+
+        # Recorrer los documentos y buscar el producto por ID
+        for doc in restaurants_ref:
+            restaurant_data = doc.to_dict()
+            if 'products' in restaurant_data:
+                for product in restaurant_data['products']:
+                    if product['productId'] == product_id:
+                        product['restaurantId'] = doc.id  # Agregar el id del restaurante al producto
+                        products = restaurant_data
+
+        if not products:
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        return products
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Ruta para agregar un nuevo restaurante
+@router.post("/restaurants", response_model=dict)
+def create_restaurant(restaurant: Restaurant, user: dict = Depends(get_current_user)):
+    try:
+        # Verificar si el producto está disponible (si la cantidad > 0)
+        if restaurant.products[0].amount <= 0:
+            raise HTTPException(status_code=400, detail="Product is out of stock")
+
+        new_restaurant_ref = db.collection("restaurants").add(restaurant.dict())
+        return {"message": "Restaurant added successfully", "id": new_restaurant_ref[1].id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Ruta para actualizar la disponibilidad del restaurante
+@router.put("/restaurants/{restaurant_id}", response_model=dict)
+def update_restaurant(restaurant_id: str, restaurant: Restaurant, user: dict = Depends(get_current_user)):
+    try:
+        restaurant_ref = db.collection("restaurants").document(restaurant_id)
+        restaurant_ref.update(restaurant.dict())
+        
+        # Actualizar el estado de disponibilidad basado en la cantidad
+        if restaurant.products[0].amount == 0:
+            restaurant_ref.update({"available": False})
+        
+        return {"message": "Restaurant updated successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.post("/order")
+def order_product(
+        request: OrderRequest,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # Un reintento con la misma clave recibe la respuesta original sin volver a descontar stock
+    return idempotency.run(
+        "order", idempotency_key, fingerprint(request.product_id, request.quantity),
+        lambda: place_order(request.product_id, request.quantity), response,
+    )
+
+
+def place_order(product_id: int, quantity: int):
+    restaurants_ref = db.collection('retaurants')
+
+
+    # Buscar restaurante con ese productId (dado que solo hay 1 producto por restaurante)
+    query = (doc for doc in restaurants_ref.stream() if doc.to_dict()['products'][0]['productId'] == product_id)
+    doc = next(query, None)
+    
+
+    if not doc:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    restaurant_data = doc.to_dict()
+    product = restaurant_data['products'][0]
+
+    if not product.get("available", False):
+        raise HTTPException(status_code=400, detail="Product not available")
+
+    if product.get("amount", 0) < quantity:
+        raise HTTPException(status_code=400, detail="Not enough quantity available")
+
+    # Actualizar la cantidad
+    new_amount = product["amount"] - quantity
+    doc_ref = restaurants_ref.document(doc.id)
+    doc_ref.update({
+        "products": [{
+            **product,
+            "amount": new_amount
+        }]
+    })
+    catalog.invalidate()
+
+
+    # Generar código de reclamo
+    claim_code = str(uuid.uuid4())[:8].upper()
+
+    return {
+        "message": "Order placed successfully",
+        "code": claim_code,
+        "product_name": product.get("productName"),
+        "quantity_ordered": quantity,
+        "restaurant": restaurant_data.get("name"),
+    }
+
+    
+# @router.get("/order/{restaurant_name}/decrease-stock")
+# def decrease_product_stock_by_name(restaurant_name: str, product_name: str, price: float):
+#     try:
+#         # FastAPI ya convierte %20 a espacio, por lo tanto:
+#         # restaurant_name podría ser "La Trattoria"
+#         cleaned_input_name = restaurant_name.replace(" ", "").lower()
+
+#         # Obtener todos los restaurantes
+#         docs = db.collection("retaurants").get()
+
+#         # Buscar el documento cuyo nombre (sin espacios) coincida
+#         matching_doc = next(
+#             (doc for doc in docs if doc.to_dict().get("name", "").replace(" ", "").lower() == cleaned_input_name),
+#             None
+#         )
+
+#         if not matching_doc:
+#             raise HTTPException(status_code=404, detail="Restaurante no encontrado")
+
+#         restaurant_ref = matching_doc.reference
+#         restaurant_data = matching_doc.to_dict()
+#         products = restaurant_data.get("products", [])
+
+#         if not products:
+#             raise HTTPException(status_code=400, detail="El restaurante no tiene productos")
+
+#         product = products[0]
+
+#         if product["amount"] <= 0:
+#             raise HTTPException(status_code=400, detail="El producto ya no tiene stock")
+
+#         # Disminuir el stock
+#         product["amount"] -= 1
+
+#         if product["amount"] == 0:
+#             product["available"] = False
+
+#         # Guardar los cambios
+#         restaurant_ref.update({"products": [product]})
+
+#         order_id = str(uuid4())[:9].upper()
+
+#         return {
+#             "order_id": order_id
+#         }
+
+#     except Exception as e:
+#         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/order/{restaurant_name}/decrease-stock/{product_name}/{price}/{u_id}")
+def decrease_product_stock_by_name(
+        restaurant_name: str,
+        product_name: str,
+        price: float,
+        u_id: str,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # Las claves son por usuario; un reintento no agrega otra orden a orders/{uid}
+    return idempotency.run(
+        f"decrease-stock:{u_id}", idempotency_key, fingerprint(restaurant_name, product_name, price),
+        lambda: decrease_stock(restaurant_name, product_name, price, u_id), response,
+    )
+
+
+def decrease_stock(restaurant_name: str, product_name: str, price: float, u_id: str):
+    try:
+        cleaned_input_name = restaurant_name.replace(" ", "").lower()
+
+        # ➊ Encontrar el restaurante
+        docs = db.collection("retaurants").get()
+        matching_doc = next(
+            (doc for doc in docs
+             if doc.to_dict().get("name", "").replace(" ", "").lower() == cleaned_input_name),
+            None
+        )
+        if not matching_doc:
+            raise HTTPException(status_code=404, detail="Restaurante no encontrado")
+
+        restaurant_ref = matching_doc.reference
+        restaurant_data = matching_doc.to_dict()
+        products = restaurant_data.get("products", [])
+        if not products:
+            raise HTTPException(status_code=400, detail="El restaurante no tiene productos")
+
+        product = products[0]
+        if product["amount"] <= 0:
+            raise HTTPException(status_code=400, detail="El producto ya no tiene stock")
+
+        # ➋ Disminuir stock (SIN CAMBIOS)
+        product["amount"] -= 1
+        if product["amount"] == 0:
+            product["available"] = False
+        restaurant_ref.update({"products": [product]})
+        catalog.invalidate()
+
+        # ➌ Crear el ID de la orden
+        order_id = str(uuid4())[:8].upper()
+
+        # ➍ Registrar la orden bajo el usuario ---------------------------------
+        uid = u_id
+        order_data = {
+            "order_id": order_id,
+            "product_name": product_name,
+            "price": price,
+            "state": "pending",
+            "date": datetime.now().strftime("%d/%m/%Y/%H:%M")
+        }
+
+        user_orders_ref = db.collection("orders").document(uid)
+        doc = user_orders_ref.get()
+        if doc.exists:
+            # Añadir sin duplicar con ArrayUnion
+            user_orders_ref.update({
+                "orders": firestore.ArrayUnion([order_data])
+            })
+        else:
+            # Crear el documento con la primera orden
+            user_orders_ref.set({
+                "orders": [order_data]
+            })
+        # ---------------------------------------------------------------------
+
+        # ➎ Respuesta (SIN CAMBIOS)
+        return {"order_id": order_id}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.get("/orders/{user_id}")
+def get_orders_by_user(user_id: str):
+    try:
+        user_orders_ref = db.collection("orders").document(user_id)
+        doc = user_orders_ref.get()
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Usuario no tiene órdenes o no existe")
+
+        data = doc.to_dict()
+        orders = data.get("orders", [])
+        return orders
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+
+@router.get("/orders/{user_id}/cancel/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_order(user_id: str, order_id: str):
+    try:
+        user_orders_ref = db.collection("orders").document(user_id)
+        doc = user_orders_ref.get()
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Usuario no tiene órdenes o no existe")
+
+        data = doc.to_dict()
+        orders = data.get("orders", [])
+
+        # Buscar la orden por order_id
+        order_found = False
+        for order in orders:
+            if order.get("order_id") == order_id:
+                if order.get("state") == "cancelled":
+                    raise HTTPException(status_code=400, detail="La orden ya está cancelada")
+                order["state"] = "cancelled"
+                order_found = True
+                break
+
+        if not order_found:
+            raise HTTPException(status_code=404, detail="Orden no encontrada")
+
+        # Actualizar la lista completa con el cambio
+        user_orders_ref.update({"orders": orders})
+
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/recommendations/{user_id}")
+def get_recommendations(user_id: str, limit: int = Query(10, ge=1, le=50)):
+    # El índice se construye fuera del request (job "recommendations"); aquí solo se consulta
+    index = recommender.index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Las recomendaciones todavía no están disponibles")
+
+    recommendations, source = index.recommend(user_id, limit)
+    return {
+        "user_id": user_id,
+        "source": source,
+        "recommendations": [{"productName": name, "score": score} for name, score in recommendations],
+    }
@@ -0,0 +1,389 @@
+"""
+Control de admisión y descarte de carga por prioridad.
+
+Cada endpoint tiene su clase de tráfico en ``ROUTE_CLASSES`` (método y
+plantilla de la ruta, como en el router):
+
+* ``critical``: pedidos y catálogo (``/order``, ``/restaurants``, ``/products``).
+* ``heavy``: lecturas de analíticas y exportaciones que recorren colecciones enteras.
+* ``default``: lecturas por clave o de agregados ya calculados, ingesta y el resto.
+
+El costo de algunas rutas depende del request: ``/analytics/heatmap`` con una
+ventana ``from``/``to`` corta es una consulta acotada, sin ventana recorre la
+colección. Las rutas que no están en la tabla son ``default``.
+
+Cada clase tiene un máximo de requests en curso, una cola con tiempo máximo de
+espera y una reserva del límite global (el pool de hilos donde corren los
+handlers síncronos): ``heavy`` solo entra si quedan libres al menos
+``reserve`` lugares, así que nunca puede ocupar los hilos que necesitan
+``/order`` y ``/restaurants``. Al liberarse un lugar se atiende primero la cola
+de mayor prioridad. Los requests ``heavy`` tienen además un token bucket por
+cliente (la IP de la conexión; ``X-Forwarded-For`` solo se usa si la conexión
+viene de un proxy listado en ``ADMISSION_TRUSTED_PROXIES``). Lo que no entra a
+tiempo se rechaza con ``503`` (o ``429`` si el cliente superó su tasa) y
+``Retry-After``, antes de ejecutar el handler.
+"""
+import asyncio
+import ipaddress
+import math
+import os
+import time
+from collections import deque
+from datetime import date
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+from starlette.routing import compile_path
+
+CRITICAL = "critical"
+DEFAULT = "default"
+HEAVY = "heavy"
+
+# Conexiones de larga duración que no ocupan hilos: no pasan por el control de admisión
+EXEMPT_PATHS = {"/metrics", "/restaurants/stream"}
+# Cantidad máxima de buckets por cliente antes de descartar los que ya están llenos
+MAX_BUCKETS = 10000
+
+
+def _env(name, default, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value else default
+
+
+# Ventanas de hasta estos días son consultas acotadas
+WINDOW_DAYS = _env("ADMISSION_WINDOW_DAYS", 31, int)
+
+
+def _windowed(query_string):
+    """``default`` si el request trae ``from`` y ``to`` con una ventana corta; si no, recorre la colección."""
+    params = parse_qs(query_string)
+    try:
+        start = date.fromisoformat(params["from"][0])
+        end = date.fromisoformat(params["to"][0])
+    except (KeyError, ValueError):
+        return HEAVY
+    return DEFAULT if 0 <= (end - start).days < WINDOW_DAYS else HEAVY
+
+
+ROUTE_CLASSES = {
+    # Pedidos y catálogo
+    ("GET", "/restaurants"): CRITICAL,
+    ("GET", "/restaurants/type/{type}"): CRITICAL,
+    ("GET", "/restaurants/search/{query}"): CRITICAL,
+    ("POST", "/restaurants"): CRITICAL,
+    ("PUT", "/restaurants/{restaurant_id}"): CRITICAL,
+    ("GET", "/products"): CRITICAL,
+    ("GET", "/products/{product_id}"): CRITICAL,
+    ("POST", "/order"): CRITICAL,
+    ("GET", "/order/{restaurant_name}/decrease-stock/{product_name}/{price}/{u_id}"): CRITICAL,
+    ("GET", "/orders/{user_id}"): CRITICAL,
+    ("GET", "/orders/{user_id}/cancel/{order_id}"): CRITICAL,
+    # Usuarios, recomendaciones y pronóstico: lecturas por clave o de resultados precalculados
+    ("POST", "/signup"): DEFAULT,
+    ("GET", "/users/me"): DEFAULT,
+    ("GET", "/users"): DEFAULT,
+    ("POST", "/users/{user_id}"): DEFAULT,
+    ("GET", "/users/{user_id}"): DEFAULT,
+    ("PUT", "/users/{user_id}"): DEFAULT,
+    ("DELETE", "/users/{user_id}"): DEFAULT,
+    ("GET", "/recommendations/{user_id}"): DEFAULT,
+    ("GET", "/forecast/{restaurant}"): DEFAULT,
+    # Ingesta de eventos
+    ("POST", "/analyticspages"): DEFAULT,
+    ("POST", "/analytics/feature-usage"): DEFAULT,
+    ("POST", "/analytics/restaurant-visits"): DEFAULT,
+    # Analíticas sobre agregados: un snapshot mensual o los sketches del rango
+    ("GET", "/analytics/restaurants/{name}"): DEFAULT,
+    ("GET", "/analytics/features/distinct-users"): DEFAULT,
+    ("GET", "/analytics/restaurants-distinct-visitors"): DEFAULT,
+    ("GET", "/analytics/heatmap"): _windowed,
+    # Analíticas que recorren colecciones de eventos
+    ("GET", "/features-usage"): HEAVY,
+    ("GET", "/features-increasing-rate"): HEAVY,
+    ("GET", "/features-increasing-rate-daily"): HEAVY,
+    ("GET", "/screen-analytics"): HEAVY,
+    ("GET", "/average-time-spent"): HEAVY,
+    ("GET", "/devices-summary"): HEAVY,
+    ("GET", "/top-products"): HEAVY,
+    ("GET", "/android-version-summary"): HEAVY,
+    ("GET", "/cancellation-time-stats"): HEAVY,
+    ("GET", "/analytics/detail-feature-usage"): HEAVY,
+    ("GET", "/analytics/most-liked-restaurants"): HEAVY,
+    ("GET", "/analytics/orders-by-weekday"): HEAVY,
+    ("GET", "/analytics/most-products-ordered"): HEAVY,
+    ("GET", "/export/{collection}"): HEAVY,
+}
+
+# Rutas fijas por búsqueda directa; las que tienen parámetros, por expresión regular
+_STATIC_ROUTES = {key: value for key, value in ROUTE_CLASSES.items() if "{" not in key[1]}
+_PARAMETER_ROUTES = [(method, compile_path(path)[0], value)
+                     for (method, path), value in ROUTE_CLASSES.items() if "{" in path]
+
+
+def classify(method, path, query_string=""):
+    if method == "HEAD":
+        method = "GET"
+    traffic = _STATIC_ROUTES.get((method, path))
+    if traffic is None:
+        traffic = next((value for route_method, regex, value in _PARAMETER_ROUTES
+                        if route_method == method and regex.match(path)), DEFAULT)
+    return traffic(query_string) if callable(traffic) else traffic
+
+
+def unclassified(routes):
+    """(método, ruta) de los endpoints montados que faltan en ``ROUTE_CLASSES``."""
+    return [(method, route.path) for route in routes for method in sorted(getattr(route, "methods", None) or ())
+            if method != "HEAD" and route.path not in EXEMPT_PATHS and (method, route.path) not in ROUTE_CLASSES]
+
+
+class TrafficClass:
+    def __init__(self, name, priority, concurrency, reserve, queue_timeout, max_queue,
+                 rate=None, burst=None, retry_after=1):
+        self.name = name
+        self.priority = priority  # menor = se atiende antes
+        self.concurrency = concurrency
+        self.reserve = reserve  # lugares del límite global que esta clase no puede ocupar
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.rate = rate  # requests por segundo por cliente (None = sin límite)
+        self.burst = burst
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiters = deque()
+        self.buckets = {}  # {cliente: (tokens, último refill)}
+        self.stats = {"admitted": 0, "queued": 0, "queue_seconds": 0.0,
+                      "shed_queue_full": 0, "shed_queue_timeout": 0, "shed_rate_limited": 0}
+
+
+def default_classes():
+    """Clases de tráfico configuradas con variables ``ADMISSION_*``."""
+    return [
+        TrafficClass(
+            CRITICAL, 0,
+            concurrency=_env("ADMISSION_CRITICAL_CONCURRENCY", 32, int),
+            reserve=0,
+            queue_timeout=_env("ADMISSION_CRITICAL_QUEUE_TIMEOUT", 2.0),
+            max_queue=_env("ADMISSION_CRITICAL_MAX_QUEUE", 200, int),
+        ),
+        TrafficClass(
+            DEFAULT, 1,
+            concurrency=_env("ADMISSION_DEFAULT_CONCURRENCY", 16, int),
+            reserve=_env("ADMISSION_DEFAULT_RESERVE", 4, int),
+            queue_timeout=_env("ADMISSION_DEFAULT_QUEUE_TIMEOUT", 1.0),
+            max_queue=_env("ADMISSION_DEFAULT_MAX_QUEUE", 100, int),
+        ),
+        TrafficClass(
+            HEAVY, 2,
+            concurrency=_env("ADMISSION_HEAVY_CONCURRENCY", 4, int),
+            reserve=_env("ADMISSION_HEAVY_RESERVE", 8, int),
+            queue_timeout=_env("ADMISSION_HEAVY_QUEUE_TIMEOUT", 0.5),
+            max_queue=_env("ADMISSION_HEAVY_MAX_QUEUE", 8, int),
+            rate=_env("ADMISSION_HEAVY_RATE", 1.0),
+            burst=_env("ADMISSION_HEAVY_BURST", 5, int),
+            retry_after=_env("ADMISSION_HEAVY_RETRY_AFTER", 5, int),
+        ),
+    ]
+
+
+class Rejected(Exception):
+    def __init__(self, status_code, reason, retry_after):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Debe usarse desde un único event loop (el middleware): el estado no lleva locks
+    porque solo se modifica entre ``await``.
+    """
+
+    def __init__(self, classes=None, total_concurrency=None):
+        self.classes = {c.name: c for c in (classes or default_classes())}
+        # Por defecto, el tamaño del pool de hilos de AnyIO donde corren los handlers síncronos
+        self.total_concurrency = total_concurrency or _env("ADMISSION_TOTAL_CONCURRENCY", 40, int)
+        self.in_flight = 0
+
+    def _can_admit(self, traffic):
+        return (traffic.in_flight < traffic.concurrency
+                and self.in_flight < self.total_concurrency - traffic.reserve)
+
+    def _admit(self, traffic):
+        traffic.in_flight += 1
+        self.in_flight += 1
+        traffic.stats["admitted"] += 1
+
+    def _take_token(self, traffic, client):
+        if traffic.rate is None:
+            return
+        now = time.monotonic()
+        tokens, updated = traffic.buckets.get(client, (traffic.burst, now))
+        tokens = min(traffic.burst, tokens + (now - updated) * traffic.rate)
+        if tokens < 1:
+            traffic.buckets[client] = (tokens, now)
+            traffic.stats["shed_rate_limited"] += 1
+            raise Rejected(429, "rate_limited", math.ceil((1 - tokens) / traffic.rate))
+        traffic.buckets[client] = (tokens - 1, now)
+
+        if len(traffic.buckets) > MAX_BUCKETS:
+            full = [key for key, (value, last) in traffic.buckets.items()
+                    if value + (now - last) * traffic.rate >= traffic.burst]
+            for key in full:
+                del traffic.buckets[key]
+
+    async def acquire(self, class_name, client):
+        """Espera un lugar para la clase; lanza ``Rejected`` si se descarta el request."""
+        traffic = self.classes[class_name]
+        self._take_token(traffic, client)
+
+        if not traffic.waiters and self._can_admit(traffic):
+            self._admit(traffic)
+            return
+        if len(traffic.waiters) >= traffic.max_queue:
+            traffic.stats["shed_queue_full"] += 1
+            raise Rejected(503, "queue_full", traffic.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        traffic.waiters.append(waiter)
+        traffic.stats["queued"] += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, traffic.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(traffic, waiter)
+            traffic.stats["shed_queue_timeout"] += 1
+            raise Rejected(503, "queue_timeout", traffic.retry_after)
+        except BaseException:
+            # El cliente se desconectó mientras esperaba
+            if waiter.done() and not waiter.cancelled():
+                self.release(class_name)
+            else:
+                self._forget(traffic, waiter)
+            raise
+        finally:
+            traffic.stats["queue_seconds"] += time.perf_counter() - started
+
+    def _forget(self, traffic, waiter):
+        waiter.cancel()
+        try:
+            traffic.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, class_name):
+        traffic = self.classes[class_name]
+        traffic.in_flight -= 1
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # Las colas de mayor prioridad toman primero los lugares libres
+        for traffic in sorted(self.classes.values(), key=lambda c: c.priority):
+            while traffic.waiters and self._can_admit(traffic):
+                waiter = traffic.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._admit(traffic)
+                waiter.set_result(None)
+
+    def render_metrics(self):
+        """Métricas de admisión en formato de texto de Prometheus."""
+        counters = [
+            ("backend_admission_admitted_total", "admitted", "Requests admitidos"),
+            ("backend_admission_queued_total", "queued", "Requests que tuvieron que esperar en cola"),
+            ("backend_admission_queue_seconds_total", "queue_seconds", "Tiempo total esperando en cola"),
+        ]
+        lines = []
+        for name, field, help_text in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for traffic in self.classes.values():
+                lines.append(f'{name}{{class="{traffic.name}"}} {traffic.stats[field]:g}')
+
+        lines += ["# HELP backend_admission_shed_total Requests descartados antes de ejecutarse",
+                  "# TYPE backend_admission_shed_total counter"]
+        for traffic in self.classes.values():
+            for reason in ("queue_full", "queue_timeout", "rate_limited"):
+                lines.append(f'backend_admission_shed_total{{class="{traffic.name}",reason="{reason}"}} '
+                             f'{traffic.stats["shed_" + reason]:g}')
+
+        gauges = [
+            ("backend_admission_in_flight", lambda c: c.in_flight, "Requests en ejecución"),
+            ("backend_admission_queue_length", lambda c: len(c.waiters), "Requests esperando en cola"),
+        ]
+        for name, value, help_text in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for traffic in self.classes.values():
+                lines.append(f'{name}{{class="{traffic.name}"}} {value(traffic)}')
+        return "\n".join(lines) + "\n"
+
+
+def _trusted_proxies():
+    networks = []
+    for value in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(","):
+        if value.strip():
+            networks.append(ipaddress.ip_network(value.strip(), strict=False))
+    return networks
+
+
+TRUSTED_PROXIES = _trusted_proxies()
+
+
+def _is_trusted(address, proxies):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def _client_key(scope, proxies=None):
+    """
+    IP del cliente. Los headers los elige quien llama (rotándolos escaparía de su bucket),
+    así que ``X-Forwarded-For`` solo cuenta si la conexión viene de un proxy de confianza y
+    se toma la última dirección que no sea otro proxy de confianza.
+    """
+    proxies = TRUSTED_PROXIES if proxies is None else proxies
+    client = scope.get("client")
+    address = client[0] if client else "anonymous"
+    if not proxies or not _is_trusted(address, proxies):
+        return address
+    forwarded = [value.decode("latin-1") for name, value in scope.get("headers") or [] if name == b"x-forwarded-for"]
+    hops = [hop.strip() for value in forwarded for hop in value.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, proxies):
+            return hop
+    return hops[0] if hops else address
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI: mantiene el lugar ocupado hasta que termina de enviarse la respuesta,
+    incluidas las respuestas en streaming de ``/export``.
+    """
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        class_name = classify(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"))
+        try:
+            await self.controller.acquire(class_name, _client_key(scope))
+        except Rejected as rejected:
+            response = JSONResponse(
+                {"detail": "Servidor ocupado, intenta más tarde" if rejected.status_code == 503
+                 else "Demasiados requests, intenta más tarde", "reason": rejected.reason},
+                status_code=rejected.status_code,
+                headers={"Retry-After": str(rejected.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(class_name)
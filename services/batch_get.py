@@ -0,0 +1,55 @@
+"""
+Lecturas de muchos documentos por id en pocas llamadas a Firestore.
+
+``get_many`` elimina ids repetidos, los parte en grupos de ``BATCH_GET_CHUNK_SIZE``
+y resuelve cada grupo con un solo ``db.get_all``; los grupos se piden en
+paralelo. ``parse_ids`` lee ``?ids=a,b,c`` (o ``?ids=a&ids=b``) para las rutas.
+"""
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+CHUNK_SIZE = int(os.getenv("BATCH_GET_CHUNK_SIZE", "100"))
+MAX_WORKERS = int(os.getenv("BATCH_GET_WORKERS", "4"))
+MAX_IDS = int(os.getenv("BATCH_GET_MAX_IDS", "1000"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="batch-get")
+
+
+def parse_ids(values):
+    """Ids únicos, en el orden en que llegaron; 400 si no hay ninguno o son demasiados."""
+    ids = list(dict.fromkeys(
+        part.strip() for value in values for part in value.split(",") if part.strip()
+    ))
+    if not ids:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un id en 'ids'")
+    if len(ids) > MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Se permiten a lo sumo {MAX_IDS} ids por request")
+    return ids
+
+
+def _fetch(db, collection, ids):
+    refs = [db.collection(collection).document(doc_id) for doc_id in ids]
+    return {snap.id: snap.to_dict() for snap in db.get_all(refs) if snap.exists}
+
+
+def get_many(db, collection, ids, chunk_size=None):
+    """({id: datos} de los documentos encontrados, [ids que no existen])."""
+    ids = list(dict.fromkeys(ids))
+    chunk_size = chunk_size or CHUNK_SIZE
+    chunks = [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+
+    found = {}
+    if len(chunks) == 1:
+        found.update(_fetch(db, collection, chunks[0]))
+    else:
+        # Cada grupo corre con una copia del contexto para que su costo se sume al request en curso
+        futures = [
+            _executor.submit(contextvars.copy_context().run, _fetch, db, collection, chunk)
+            for chunk in chunks
+        ]
+        for future in futures:
+            found.update(future.result())
+    return found, [doc_id for doc_id in ids if doc_id not in found]
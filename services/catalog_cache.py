@@ -0,0 +1,179 @@
+"""
+Caché del catálogo de restaurantes (colección ``retaurants``).
+
+Los documentos se validan contra el modelo de Pydantic una sola vez, cuando
+entran al caché, y se serializan en un snapshot inmutable (``catalog_snapshot``)
+del que las rutas cortan las respuestas ya codificadas con orjson, sin volver a
+pasar por ``response_model`` ni por el ``json`` estándar.
+
+Con un solo proceso el snapshot vive en memoria y se recarga cada
+``CATALOG_CACHE_TTL`` segundos o al invalidarse. Con ``CATALOG_SHARED_PATH``
+(p. ej. ``/dev/shm/backend-wiki-catalog.bin``) los workers no leen Firestore:
+un único ``CatalogPublisher`` (el proceso que tiene el lock del archivo) escribe
+cada generación en un archivo temporal y lo reemplaza con ``os.replace``; cada
+worker mapea el archivo con ``mmap`` (``shared_snapshot``) y pasa a la
+generación nueva cuando cambia el inodo. Las páginas del archivo son
+compartidas, así que la memoria por worker no crece con la cantidad de workers. ``invalidate`` en un worker marca el
+archivo ``.dirty`` y el publicador vuelve a cargar en su próxima revisión.
+
+Si Firestore no responde al recargar, se sigue sirviendo la generación anterior
+marcada como vieja (``resilience.mark_stale``).
+"""
+import os
+import struct
+import threading
+import time
+
+import orjson
+from fastapi import Response
+
+from services.catalog_snapshot import HEADER, CatalogSnapshot, build_snapshot
+from services.resilience import FirestoreUnavailable, mark_stale
+from services.shared_snapshot import PublisherLock, SharedSnapshotReader, publish
+
+CATALOG_COLLECTION = "retaurants"
+
+
+def _shared_path():
+    return os.getenv("CATALOG_SHARED_PATH") or None
+
+
+class SharedCatalogReader(SharedSnapshotReader):
+    """Mapea el catálogo publicado en ``CATALOG_SHARED_PATH``."""
+
+    def __init__(self, path, check_interval=None):
+        super().__init__(path, CatalogSnapshot, check_interval if check_interval is not None
+                         else float(os.getenv("CATALOG_SHARED_CHECK_INTERVAL", "0.2")))
+
+
+class CatalogCache:
+    def __init__(self, db, model, collection=CATALOG_COLLECTION, ttl=None, shared_path=None):
+        self._db = db
+        self._model = model
+        self._collection = collection
+        self._ttl = ttl if ttl is not None else float(os.getenv("CATALOG_CACHE_TTL", "30"))
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._invalidations = 0
+        self._loaded_invalidations = 0
+        self._generation = 0
+        self.shared_path = shared_path or _shared_path()
+        self._reader = SharedCatalogReader(self.shared_path) if self.shared_path else None
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def load(self, generation=None):
+        """Lee y valida el catálogo desde Firestore y devuelve el buffer de una generación nueva."""
+        entries = []
+        for doc in self._db.collection(self._collection).stream():
+            data = doc.to_dict()
+            # Verificar si los campos esenciales existen
+            if 'name' not in data or 'products' not in data:
+                continue
+            try:
+                restaurant = self._model(**data).dict()
+            except Exception as e:
+                print(f"⚠ Restaurante {doc.id} inválido, se omite del catálogo: {str(e)}")
+                continue
+            entries.append((doc.id, restaurant))
+        self._generation = generation if generation is not None else self._generation + 1
+        return build_snapshot(self._generation, entries)
+
+    def _fresh(self, snapshot):
+        return (snapshot is not None and self._loaded_invalidations == self._invalidations
+                and time.time() - snapshot.loaded_at < self._ttl)
+
+    def get(self):
+        """Generación vigente del catálogo; se recarga si venció el TTL o fue invalidada."""
+        if self._reader is not None:
+            snapshot = self._reader.get()
+            if snapshot is not None:
+                # El publicador no pudo recargar en más de dos TTL: Firestore no está respondiendo
+                age = time.time() - snapshot.loaded_at
+                if age > 2 * self._ttl:
+                    mark_stale(age)
+                return snapshot
+            # Aún no hay nada publicado: este worker carga su propia copia mientras tanto
+
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            return snapshot
+        # Si otro hilo ya está recargando, se sirve la generación anterior en vez de esperar
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if not self._fresh(snapshot):
+                # Una invalidación que llegue durante la carga vuelve a forzar la recarga
+                invalidations = self._invalidations
+                try:
+                    snapshot = CatalogSnapshot(self.load())
+                except FirestoreUnavailable:
+                    if self._snapshot is None:
+                        raise
+                    mark_stale(time.time() - self._snapshot.loaded_at)
+                    return self._snapshot
+                self._snapshot = snapshot
+                self._loaded_invalidations = invalidations
+        finally:
+            self._lock.release()
+        return snapshot
+
+    def invalidate(self):
+        """Fuerza la recarga en el próximo acceso (llamar después de escribir en el catálogo)."""
+        self._invalidations += 1
+        if self._reader is not None:
+            with open(self.shared_path + ".dirty", "ab"):
+                pass
+            os.utime(self.shared_path + ".dirty")
+            self._reader.recheck()
+
+
+class CatalogPublisher:
+    """
+    Publica el catálogo en ``CATALOG_SHARED_PATH`` para todos los workers. Solo publica
+    el proceso que obtiene el lock exclusivo del archivo ``.lock``; el resto no hace nada.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._path = cache.shared_path
+        self._lock = PublisherLock(self._path) if self._path else None
+        self._published_at = 0.0
+
+    def _current_generation(self):
+        try:
+            with open(self._path, "rb") as file:
+                return HEADER.unpack(file.read(HEADER.size))[1]
+        except (FileNotFoundError, struct.error):
+            return 0
+
+    def _dirty_since_publish(self):
+        try:
+            return os.stat(self._path + ".dirty").st_mtime > self._published_at
+        except FileNotFoundError:
+            return False
+
+    def run_once(self, force=False):
+        """Publica una generación nueva si venció el TTL o algún worker invalidó el catálogo."""
+        if not self._path or not self._lock.held():
+            return False
+        expired = time.time() - self._published_at >= self._cache.ttl
+        if not (force or expired or self._dirty_since_publish()):
+            return False
+
+        started = time.time()
+        publish(self._path, self._cache.load(generation=self._current_generation() + 1))
+        # Cambios que lleguen mientras se cargaba disparan otra publicación
+        self._published_at = started
+        return True
+
+
+def encode(content):
+    return orjson.dumps(content)
+
+
+def json_bytes_response(payload, status_code=200):
+    return Response(content=payload, status_code=status_code, media_type="application/json")
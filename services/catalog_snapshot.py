@@ -0,0 +1,188 @@
+"""
+Formato binario inmutable de una generación del catálogo.
+
+``build_snapshot`` serializa los restaurantes ya validados en un solo buffer:
+
+* ``all``: la respuesta de ``/restaurants`` ya codificada (``[r0,r1,...]``); el
+  JSON de cada restaurante es un tramo de este arreglo (``spans``, relativos al
+  inicio de la sección), así que no se guarda dos veces.
+* ``spans`` (int64 [n, 2]), ``types`` (int64 [n]) y ``doc_ids`` (JSON).
+* ``product_ids`` ordenados (int64 [m]) y ``product_entries`` (int32 [m]) para
+  resolver un productId con búsqueda binaria, con ``product_amounts`` (int64 [m])
+  y ``product_available`` (uint8 [m]) en el mismo orden: el stream de stock
+  compara dos generaciones con estos arreglos (``stock_changes``).
+* ``search``: nombre normalizado y nombres de producto de cada restaurante,
+  separados por ``\\x00``, con ``search_offsets`` (int64 [n + 1]).
+
+``CatalogSnapshot`` lee ese buffer sin copiarlo: puede ser ``bytes`` en memoria
+o un ``mmap`` del archivo compartido entre workers (ver ``catalog_cache``). Las
+respuestas se arman cortando tramos del buffer, sin decodificar el catálogo.
+"""
+import struct
+import time
+
+import numpy as np
+import orjson
+
+MAGIC = b"WKCAT002"
+SECTIONS = ("all", "spans", "types", "doc_ids", "product_ids", "product_entries", "product_amounts",
+            "product_available", "search", "search_offsets")
+HEADER = struct.Struct("<8sQdQQ" + "QQ" * len(SECTIONS))
+SEPARATOR = b"\x00"
+
+
+def _normalize_name(name):
+    return name.strip().lower().replace(" ", "")
+
+
+def build_snapshot(generation, entries, loaded_at=None):
+    """Buffer de una generación a partir de [(id del documento, restaurante validado)]."""
+    encoded = [orjson.dumps(restaurant) for _, restaurant in entries]
+    spans = np.zeros((len(entries), 2), dtype=np.int64)
+    position = 1
+    for i, payload in enumerate(encoded):
+        spans[i] = (position, position + len(payload))
+        position += len(payload) + 1
+    all_json = b"[" + b",".join(encoded) + b"]"
+
+    products = sorted(
+        (product["productId"], i, product.get("amount", 0), bool(product.get("available", False)))
+        for i, (_, restaurant) in enumerate(entries)
+        for product in restaurant.get("products", [])
+    )
+    search_parts = [
+        SEPARATOR.join(
+            [_normalize_name(restaurant["name"]).encode()]
+            + [product["productName"].strip().lower().encode() for product in restaurant.get("products", [])]
+        ) + SEPARATOR
+        for _, restaurant in entries
+    ]
+    search_offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    np.cumsum([len(part) for part in search_parts], out=search_offsets[1:])
+
+    sections = {
+        "all": all_json,
+        "spans": spans.tobytes(),
+        "types": np.array([restaurant.get("type", 0) for _, restaurant in entries], dtype=np.int64).tobytes(),
+        "doc_ids": orjson.dumps([doc_id for doc_id, _ in entries]),
+        "product_ids": np.array([product[0] for product in products], dtype=np.int64).tobytes(),
+        "product_entries": np.array([product[1] for product in products], dtype=np.int32).tobytes(),
+        "product_amounts": np.array([product[2] for product in products], dtype=np.int64).tobytes(),
+        "product_available": np.array([product[3] for product in products], dtype=np.uint8).tobytes(),
+        "search": b"".join(search_parts),
+        "search_offsets": search_offsets.tobytes(),
+    }
+
+    # Cada sección empieza alineada a 8 bytes para poder verla como arreglo de NumPy
+    body = bytearray()
+    table = []
+    for name in SECTIONS:
+        start = HEADER.size + len(body)
+        padding = -start % 8
+        body += b"\x00" * padding
+        table += [start + padding, len(sections[name])]
+        body += sections[name]
+    header = HEADER.pack(MAGIC, generation, loaded_at or time.time(), len(entries), len(products), *table)
+    return header + bytes(body)
+
+
+class CatalogSnapshot:
+    """Una generación inmutable del catálogo, respaldada por un buffer (bytes o mmap)."""
+
+    def __init__(self, buffer):
+        magic, self.generation, self.loaded_at, self.count, products, *table = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("El buffer no es un snapshot del catálogo")
+        self._buffer = buffer
+        # Los cortes sobre la vista no copian: las respuestas salen directo del buffer (o del mmap)
+        self._view = memoryview(buffer)
+        self._sections = {name: (table[2 * i], table[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+        self._spans = self._array("spans", np.int64).reshape(self.count, 2)
+        self._types = self._array("types", np.int64)
+        self._product_ids = self._array("product_ids", np.int64)
+        self._product_entries = self._array("product_entries", np.int32)
+        self._product_amounts = self._array("product_amounts", np.int64)
+        self._product_available = self._array("product_available", np.uint8)
+        self._search_offsets = self._array("search_offsets", np.int64)
+        self._doc_ids = None
+
+    def _array(self, name, dtype):
+        start, length = self._sections[name]
+        return np.frombuffer(self._buffer, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=start)
+
+    def _bytes(self, name):
+        start, length = self._sections[name]
+        return self._view[start:start + length]
+
+    def _json(self, index):
+        # Los tramos son relativos a la sección "all"
+        base = self._sections["all"][0]
+        start, end = self._spans[index]
+        return self._view[base + start:base + end]
+
+    def _join(self, indexes):
+        return b"[" + b",".join(self._json(index) for index in indexes) + b"]"
+
+    @property
+    def nbytes(self):
+        return len(self._buffer)
+
+    def all_json(self):
+        """Respuesta de ``/restaurants`` ya codificada."""
+        return self._bytes("all")
+
+    def by_type_json(self, restaurant_type):
+        return self._join(np.nonzero(self._types == restaurant_type)[0])
+
+    def search_json(self, words):
+        """Restaurantes cuyo nombre normalizado o algún producto contiene alguna de ``words``."""
+        start, length = self._sections["search"]
+        end = start + length
+        matches = set()
+        for word in words:
+            needle = word.encode()
+            if SEPARATOR in needle:
+                # Un separador en la palabra podría unir dos nombres distintos
+                continue
+            position = self._buffer.find(needle, start, end)
+            while position != -1:
+                entry = int(np.searchsorted(self._search_offsets, position - start, side="right")) - 1
+                matches.add(entry)
+                # Seguir desde el restaurante siguiente: uno que ya coincidió no se repite
+                position = self._buffer.find(needle, start + int(self._search_offsets[entry + 1]), end)
+        return self._join(sorted(matches))
+
+    def restaurant(self, index):
+        return orjson.loads(self._json(index))
+
+    def doc_id(self, index):
+        if self._doc_ids is None:
+            self._doc_ids = orjson.loads(self._bytes("doc_ids"))
+        return self._doc_ids[index]
+
+    def product(self, product_id):
+        """(id del documento, restaurante) dueño del productId, o None."""
+        position = int(np.searchsorted(self._product_ids, product_id))
+        if position == len(self._product_ids) or self._product_ids[position] != product_id:
+            return None
+        index = int(self._product_entries[position])
+        return self.doc_id(index), self.restaurant(index)
+
+    def stock_changes(self, previous):
+        """[(id del documento, producto)] cuyo stock o disponibilidad cambió respecto de ``previous``."""
+        ids = self._product_ids
+        if len(previous._product_ids):
+            position = np.minimum(np.searchsorted(previous._product_ids, ids), len(previous._product_ids) - 1)
+            changed = ((previous._product_ids[position] != ids)
+                       | (previous._product_amounts[position] != self._product_amounts)
+                       | (previous._product_available[position] != self._product_available))
+        else:
+            changed = np.ones(len(ids), dtype=bool)
+        return [
+            (self.doc_id(int(self._product_entries[i])), {
+                "productId": int(ids[i]),
+                "amount": int(self._product_amounts[i]),
+                "available": bool(self._product_available[i]),
+            })
+            for i in np.nonzero(changed)[0]
+        ]
@@ -0,0 +1,90 @@
+"""
+Contadores diarios con escritura combinada (``feature_usage``, ``restaurant_visits``).
+
+En lugar de que cada evento incremente el documento ``{colección}/{YYYY-MM-DD}``
+(límite de ~1 escritura/segundo por documento en Firestore), los incrementos se
+acumulan en memoria y ``flush`` los escribe como un solo ``firestore.Increment``
+por campo y documento, todos en un batch.
+
+Con ``COUNTER_SHARDS=N`` (N > 1) cada flush elige al azar uno de N documentos
+por día: ``{día}`` o ``{día}_{n}``. Los lectores de analíticas agrupan por día
+con ``day_bucket``, que ignora el sufijo, así que suman los shards sin cambios.
+
+Garantías ante fallos:
+
+* Caída del proceso: se pierden los incrementos acumulados en ese worker desde
+  el último flush. El flush periódico corre en todos los workers, también en
+  los que tienen ``ENABLE_SCHEDULED_JOBS=0``, así que mientras Firestore acepte
+  los commits son a lo sumo ``COUNTER_FLUSH_INTERVAL`` segundos de eventos; si
+  los commits vienen fallando, también los que se están reintentando. Al
+  apagarse de forma ordenada la app hace un flush final.
+* Error al hacer commit: el batch de Firestore es atómico, así que o se aplicaron
+  todos los incrementos del batch o ninguno. Si el commit falla, los incrementos
+  vuelven al buffer y se reintentan en el próximo flush. Si el error fue ambiguo
+  (p. ej. timeout después de que Firestore aplicó el batch), el reintento puede
+  contar dos veces esos incrementos: la entrega es "al menos una vez" frente a
+  errores de commit y "a lo sumo una vez" frente a caídas del proceso.
+"""
+import os
+import random
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from firebase_admin import firestore
+
+BATCH_SIZE = 500
+
+
+def shard_document_id(day, shard):
+    return day if shard == 0 else f"{day}_{shard}"
+
+
+class WriteCombiningCounters:
+    def __init__(self, db, shards=None):
+        self._db = db
+        self._shards = shards if shards is not None else int(os.getenv("COUNTER_SHARDS", "1"))
+        self._lock = threading.Lock()
+        # {(colección, día): {campo: incremento pendiente}}
+        self._pending = defaultdict(lambda: defaultdict(int))
+
+    def increment(self, collection, field, amount=1, day=None):
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            self._pending[(collection, day)][field] += amount
+
+    def pending(self):
+        """Cantidad total de incrementos que aún no se escriben en Firestore."""
+        with self._lock:
+            return sum(sum(fields.values()) for fields in self._pending.values())
+
+    def _restore(self, pending):
+        with self._lock:
+            for target, fields in pending.items():
+                for field, amount in fields.items():
+                    self._pending[target][field] += amount
+
+    def flush(self):
+        """Escribe los incrementos acumulados; devuelve la cantidad de documentos actualizados."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        written = 0
+        for start in range(0, len(items), BATCH_SIZE):
+            chunk = items[start:start + BATCH_SIZE]
+            batch = self._db.batch()
+            for (collection, day), fields in chunk:
+                shard = random.randrange(self._shards) if self._shards > 1 else 0
+                ref = self._db.collection(collection).document(shard_document_id(day, shard))
+                batch.set(ref, {field: firestore.Increment(amount) for field, amount in fields.items()}, merge=True)
+            try:
+                batch.commit()
+            except Exception:
+                # Este batch no se aplicó (o no se sabe): se reintenta junto con los que faltaban
+                self._restore(dict(items[start:]))
+                raise
+            written += len(chunk)
+        return written
@@ -0,0 +1,113 @@
+"""
+Rangos de fechas para las consultas de analíticas.
+
+``date_range`` es la dependencia de FastAPI que lee ``from``/``to``
+(YYYY-MM-DD, ambos inclusivos) y devuelve un ``DateRange`` capaz de traducirse
+a una consulta de Firestore: por id de documento para las colecciones diarias
+(``feature_usage/{YYYY-MM-DD}``, ``restaurant_visits``...) o por un campo de
+fecha. Los días de un campo Timestamp son días locales (``ANALYTICS_TIMEZONE``),
+los mismos en los que ``heatmap`` agrupa los eventos. Los instantes guardados
+como texto ISO pueden traer zona ("...Z", "-05:00") y Firestore los compara
+como texto, por su fecha escrita: ``filter_local_iso_field`` consulta un día
+de margen y ``local_mask`` deja solo los de los días locales pedidos.
+``filter_iso_field`` compara el texto tal cual y sirve para campos que son un
+día ("YYYY-MM-DD") o instantes sin zona en hora local. ``day_bucket`` reemplaza el ``strptime`` + ``strftime`` por documento.
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from fastapi import HTTPException, Query
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from services.heatmap import DEFAULT_TIMEZONE
+
+
+@lru_cache(maxsize=8192)
+def day_bucket(doc_id):
+    """
+    ("YYYY-MM-DD", "YYYY-MM") para el id de un documento diario, o None si no es una fecha.
+    Los shards de contadores (``YYYY-MM-DD_n``) caen en el mismo día que el documento principal.
+    """
+    if len(doc_id) > 10 and doc_id[10] == "_":
+        doc_id = doc_id[:10]
+    if len(doc_id) != 10 or doc_id[4] != "-" or doc_id[7] != "-":
+        return None
+    try:
+        date.fromisoformat(doc_id)
+    except ValueError:
+        return None
+    return doc_id, doc_id[:7]
+
+
+class DateRange:
+    def __init__(self, start: Optional[date] = None, end: Optional[date] = None):
+        self.start = start
+        self.end = end
+
+    @property
+    def is_open(self):
+        return self.start is None and self.end is None
+
+    def daily_documents(self, collection_ref):
+        """Consulta sobre una colección cuyos ids son fechas YYYY-MM-DD, limitada al rango."""
+        if self.is_open:
+            return collection_ref
+        query = collection_ref.order_by(FieldPath.document_id())
+        if self.start is not None:
+            query = query.start_at([self.start.isoformat()])
+        if self.end is not None:
+            # end_before del día siguiente incluye también los shards "YYYY-MM-DD_n" del último día
+            query = query.end_before([(self.end + timedelta(days=1)).isoformat()])
+        return query
+
+    def filter_iso_field(self, query, field):
+        """
+        Filtra un campo guardado como texto ISO 8601 ("2025-04-26T10:15:00") comparando el texto:
+        un valor con zona ("...Z") queda en el día de su fecha escrita, no en su día local.
+        """
+        if self.start is not None:
+            query = query.where(field, ">=", self.start.isoformat())
+        if self.end is not None:
+            query = query.where(field, "<", (self.end + timedelta(days=1)).isoformat())
+        return query
+
+    def filter_local_iso_field(self, query, field):
+        """
+        Filtra un instante guardado como texto ISO, con o sin zona, por día local. La zona mueve
+        un valor a lo sumo un día respecto de su fecha escrita, así que se consulta un día de
+        margen a cada lado; el llamador descarta el margen con ``local_mask``.
+        """
+        start = self.start - timedelta(days=1) if self.start is not None else None
+        end = self.end + timedelta(days=1) if self.end is not None else None
+        return DateRange(start, end).filter_iso_field(query, field)
+
+    def local_mask(self, local):
+        """Máscara de los ``datetime64`` en hora local (``heatmap.local_datetimes``) que caen en el rango."""
+        mask = np.ones(len(local), dtype=bool)
+        if self.start is not None:
+            mask &= local >= np.datetime64(self.start, "s")
+        if self.end is not None:
+            mask &= local < np.datetime64(self.end + timedelta(days=1), "s")
+        return mask
+
+    def filter_timestamp_field(self, query, field, tz=DEFAULT_TIMEZONE):
+        """Filtra un campo Timestamp de Firestore (días locales en ``tz``, America/Bogota por defecto)."""
+        zone = ZoneInfo(tz)
+        if self.start is not None:
+            query = query.where(field, ">=", datetime.combine(self.start, time.min, tzinfo=zone))
+        if self.end is not None:
+            end = datetime.combine(self.end + timedelta(days=1), time.min, tzinfo=zone)
+            query = query.where(field, "<", end)
+        return query
+
+
+def date_range(
+    from_: Optional[date] = Query(None, alias="from", description="Fecha inicial YYYY-MM-DD (inclusiva)"),
+    to: Optional[date] = Query(None, description="Fecha final YYYY-MM-DD (inclusiva)"),
+) -> DateRange:
+    if from_ is not None and to is not None and from_ > to:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior o igual a 'to'")
+    return DateRange(from_, to)
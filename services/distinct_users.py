@@ -0,0 +1,161 @@
+"""
+Sketches HyperLogLog de usuarios distintos por (funcionalidad, día) y (restaurante, día).
+
+Los eventos se agregan en memoria y ``flush`` los persiste en ``user_sketches``.
+Cada proceso escribe sus propios documentos (``{tipo}:{clave}:{día}:{worker}``),
+de modo que no hay contención entre workers: al leer se combinan todos los
+shards del rango pedido. Si el proceso muere, se pierden a lo sumo los usuarios
+registrados desde el último flush.
+
+Como cada reinicio es un worker nuevo, ``compact`` junta los shards de los días
+ya cerrados en un solo documento ``{tipo}:{clave}:{día}:compacted``. Combinar
+sketches es tomar el máximo por registro, así que repetir o cortar a la mitad
+la compactación no cambia ningún conteo.
+"""
+import os
+import socket
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from services.date_ranges import DateRange
+from services.hyperloglog import HyperLogLog
+
+SKETCHES_COLLECTION = "user_sketches"
+FEATURE = "feature"
+RESTAURANT = "restaurant"
+BATCH_SIZE = 500
+COMPACTED = "compacted"
+STATE_COLLECTION = "analytics_jobs"
+STATE_DOCUMENT = "user_sketches"
+
+
+def _document_id(kind, key, day, worker):
+    return f"{kind}:{key.replace('/', '_')}:{day}:{worker}"
+
+
+class DistinctUserSketches:
+    def __init__(self, db, collection=SKETCHES_COLLECTION, worker=None):
+        self._db = db
+        self._collection = collection
+        self._worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self._lock = threading.Lock()
+        # Sketches con usuarios nuevos desde el último flush: {(tipo, clave, día): HyperLogLog}
+        self._dirty = {}
+
+    def record(self, kind, key, user_id, day=None):
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            sketch = self._dirty.get((kind, key, day))
+            if sketch is None:
+                sketch = self._dirty[(kind, key, day)] = HyperLogLog()
+            sketch.add(user_id)
+
+    def flush(self):
+        """Combina los sketches pendientes con los shards de este worker y los guarda."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+
+        collection = self._db.collection(self._collection)
+        refs = {target: collection.document(_document_id(*target, self._worker)) for target in dirty}
+        try:
+            existing = {snap.id: snap.to_dict() for snap in self._db.get_all(list(refs.values())) if snap.exists}
+            batch = self._db.batch()
+            pending = 0
+            for (kind, key, day), sketch in dirty.items():
+                ref = refs[(kind, key, day)]
+                if ref.id in existing:
+                    sketch.merge(HyperLogLog.from_bytes(existing[ref.id]["registers"]))
+                batch.set(ref, {
+                    "kind": kind,
+                    "key": key,
+                    "day": day,
+                    "worker": self._worker,
+                    "registers": sketch.to_bytes(),
+                    "updated_at": datetime.now(),
+                })
+                pending += 1
+                if pending == BATCH_SIZE:
+                    batch.commit()
+                    batch = self._db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+        except Exception:
+            # Devolver los sketches para reintentar en el próximo flush
+            with self._lock:
+                for target, sketch in dirty.items():
+                    current = self._dirty.get(target)
+                    self._dirty[target] = sketch.merge(current) if current is not None else sketch
+            raise
+        return len(dirty)
+
+    def compact(self, now=None):
+        """Junta en un documento los shards de cada (tipo, clave, día) anterior a ayer; devuelve cuántos borró."""
+        now = now or datetime.now()
+        # Ayer puede recibir todavía el flush de algún worker justo después de medianoche
+        cutoff = (now - timedelta(days=1)).strftime("%Y-%m-%d")
+        state_ref = self._db.collection(STATE_COLLECTION).document(STATE_DOCUMENT)
+        state = state_ref.get()
+        since = state.to_dict().get("compacted_before") if state.exists else None
+
+        collection = self._db.collection(self._collection)
+        query = collection.where("day", "<", cutoff)
+        if since:
+            query = query.where("day", ">=", since)
+        shards = defaultdict(list)
+        for doc in query.stream():
+            data = doc.to_dict()
+            shards[(data["kind"], data["key"], data["day"])].append((doc, data))
+
+        batch = self._db.batch()
+        pending = 0
+        removed = 0
+        for (kind, key, day), docs in shards.items():
+            if len(docs) == 1 and docs[0][1].get("worker") == COMPACTED:
+                continue
+            sketch = HyperLogLog.from_bytes(docs[0][1]["registers"])
+            for _, data in docs[1:]:
+                sketch.merge(HyperLogLog.from_bytes(data["registers"]))
+            target = collection.document(_document_id(kind, key, day, COMPACTED))
+            # Primero el documento combinado y después los borrados: si se corta en medio, al leer
+            # se combinan los dos y el conteo es el mismo
+            operations = [("set", target, {"kind": kind, "key": key, "day": day, "worker": COMPACTED,
+                                           "registers": sketch.to_bytes(), "updated_at": now})]
+            operations += [("delete", doc.reference, None) for doc, _ in docs if doc.id != target.id]
+            for operation, ref, data in operations:
+                if operation == "set":
+                    batch.set(ref, data)
+                else:
+                    batch.delete(ref)
+                    removed += 1
+                pending += 1
+                if pending == BATCH_SIZE:
+                    batch.commit()
+                    batch = self._db.batch()
+                    pending = 0
+
+        # Los shards que lleguen tarde a días ya compactados se siguen combinando al leer
+        batch.set(state_ref, {"compacted_before": cutoff, "updated_at": now})
+        batch.commit()
+        return removed
+
+    def distinct_users(self, kind, period: DateRange, granularity="day"):
+        """{clave: {día o mes: usuarios distintos aproximados}} combinando todos los shards."""
+        query = self._db.collection(self._collection).where("kind", "==", kind)
+        query = period.filter_iso_field(query, "day")
+
+        merged = defaultdict(dict)
+        for doc in query.stream():
+            data = doc.to_dict()
+            bucket = data["day"] if granularity == "day" else data["day"][:7]
+            sketch = HyperLogLog.from_bytes(data["registers"])
+            current = merged[data["key"]].get(bucket)
+            merged[data["key"]][bucket] = current.merge(sketch) if current is not None else sketch
+
+        return {
+            key: {bucket: sketch.count() for bucket, sketch in sorted(buckets.items())}
+            for key, buckets in merged.items()
+        }
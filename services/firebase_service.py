@@ -0,0 +1,54 @@
+"""
+App de Firebase y cliente de Firestore compartidos por todos los routers.
+
+La inicialización es perezosa y ocurre una sola vez por proceso, de modo que
+las rutas principales y las de analíticas pueden montarse en la misma app (o
+desplegarse por separado) sin duplicar ``initialize_app`` ni los canales gRPC.
+"""
+import os
+import threading
+
+import firebase_admin
+from dotenv import load_dotenv
+from firebase_admin import credentials, firestore
+
+from services.firestore_metrics import instrument_client
+
+load_dotenv()
+
+DEFAULT_CREDENTIALS = os.path.join(os.path.dirname(__file__), "..", "app", "serviceAccountKey.json")
+
+_lock = threading.Lock()
+_firebase_app = None
+_client = None
+
+
+def get_firebase_app():
+    """App de Firebase del proceso; se inicializa en el primer uso."""
+    global _firebase_app
+    if _firebase_app is None:
+        with _lock:
+            if _firebase_app is None:
+                cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS", DEFAULT_CREDENTIALS))
+                _firebase_app = firebase_admin.initialize_app(cred)
+    return _firebase_app
+
+
+def get_db():
+    """Cliente de Firestore compartido (instrumentado para contar lecturas/escrituras)."""
+    global _client
+    if _client is None:
+        app = get_firebase_app()
+        with _lock:
+            if _client is None:
+                _client = instrument_client(firestore.client(app))
+    return _client
+
+
+class _LazyClient:
+    # Permite usar ``db.collection(...)`` en las rutas sin inicializar Firebase al importar
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+
+db = _LazyClient()
@@ -0,0 +1,460 @@
+"""
+Contabilidad de costo de Firestore por request.
+
+``instrument_client`` envuelve el cliente de Firestore y cuenta documentos
+leídos y escritos, RPCs, bytes y tiempo de espera en cada llamada; cada
+llamada pasa además por el deadline y el circuit breaker de su colección
+(``resilience``).
+``instrument_app`` agrega el middleware que acumula esos valores por request,
+los devuelve en el header ``Server-Timing`` y los expone en formato Prometheus
+en ``/metrics``. El request se cuenta cuando se envía el último fragmento del
+cuerpo, así que las respuestas en streaming (exportaciones) incluyen las
+lecturas que hacen mientras se envían; como sus headers ya salieron, su costo
+va en un trailer ``Server-Timing`` si el servidor los soporta o, si no, en una
+línea del log.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+
+from fastapi.responses import PlainTextResponse
+
+from services.resilience import FirestoreCall
+
+
+class RequestCost:
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.firestore_seconds = 0.0
+
+
+_current_cost = ContextVar("firestore_request_cost", default=None)
+
+_lock = threading.Lock()
+_route_totals = defaultdict(lambda: defaultdict(float))  # {(method, route): {métrica: valor}}
+_collection_totals = defaultdict(lambda: defaultdict(float))  # {colección: {métrica: valor}}
+_extra_metrics = {}  # {nombre: función que devuelve más métricas en formato Prometheus}
+
+
+def current_cost():
+    """Costo acumulado del request en curso (None fuera de un request)."""
+    return _current_cost.get()
+
+
+def document_size(value):
+    """Tamaño aproximado en bytes según las reglas de almacenamiento de Firestore."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key.encode("utf-8")) + 1 + document_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(document_size(item) for item in value)
+    return 16
+
+
+def _collection_label(path):
+    # "users/abc/orders" -> "users/*/orders"; las consultas collection_group ya vienen como "*/orders"
+    if path.startswith("*/"):
+        return path
+    parts = path.split("/")
+    return "/".join("*" if i % 2 else part for i, part in enumerate(parts))
+
+
+def _record(collection, seconds=0.0, reads=0, writes=0, rpcs=0, bytes_read=0, bytes_written=0):
+    cost = _current_cost.get()
+    if cost is not None:
+        cost.reads += reads
+        cost.writes += writes
+        cost.rpcs += rpcs
+        cost.bytes_read += bytes_read
+        cost.bytes_written += bytes_written
+        cost.firestore_seconds += seconds
+
+    label = _collection_label(collection)
+    with _lock:
+        totals = _collection_totals[label]
+        totals["reads"] += reads
+        totals["writes"] += writes
+        totals["rpcs"] += rpcs
+        totals["seconds"] += seconds
+
+
+def _snapshot_size(snapshot):
+    if not snapshot.exists:
+        return 0
+    # Se usa el dict interno cuando existe para no pagar la copia de to_dict()
+    data = getattr(snapshot, "_data", None)
+    if data is None:
+        data = snapshot.to_dict()
+    return document_size(data) + len(snapshot.reference.path) + 16 if data is not None else 0
+
+
+def _unwrap(value):
+    return getattr(value, "_wrapped", value)
+
+
+class _Proxy:
+    def __init__(self, wrapped, path):
+        self._wrapped = wrapped
+        self._path = path
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class InstrumentedSnapshot(_Proxy):
+    @property
+    def reference(self):
+        return InstrumentedDocument(self._wrapped.reference, self._wrapped.reference.path)
+
+
+def _instrumented_stream(stream, args, kwargs, path):
+    call = FirestoreCall(_collection_label(path), kwargs, stream=True)
+    start = time.perf_counter()
+    with call:
+        iterator = iter(stream(*args, **kwargs))
+    _record(path, seconds=time.perf_counter() - start, rpcs=1)
+
+    count = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            with call:
+                call.check_deadline()
+                snapshot = next(iterator)
+        except StopIteration:
+            _record(path, seconds=time.perf_counter() - start)
+            break
+        elapsed = time.perf_counter() - start
+        _record(path, seconds=elapsed, reads=1, bytes_read=_snapshot_size(snapshot))
+        count += 1
+        yield InstrumentedSnapshot(snapshot, path)
+
+    # Firestore factura una lectura aunque la consulta no devuelva documentos
+    if count == 0:
+        _record(path, reads=1)
+
+
+class InstrumentedQuery(_Proxy):
+    def _chain(self, name, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return InstrumentedQuery(getattr(self._wrapped, name)(*args, **kwargs), self._path)
+
+    def where(self, *args, **kwargs):
+        return self._chain("where", *args, **kwargs)
+
+    def order_by(self, *args, **kwargs):
+        return self._chain("order_by", *args, **kwargs)
+
+    def limit(self, *args, **kwargs):
+        return self._chain("limit", *args, **kwargs)
+
+    def start_at(self, *args, **kwargs):
+        return self._chain("start_at", *args, **kwargs)
+
+    def start_after(self, *args, **kwargs):
+        return self._chain("start_after", *args, **kwargs)
+
+    def end_at(self, *args, **kwargs):
+        return self._chain("end_at", *args, **kwargs)
+
+    def end_before(self, *args, **kwargs):
+        return self._chain("end_before", *args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return _instrumented_stream(self._wrapped.stream, args, kwargs, self._path)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+
+class InstrumentedCollection(InstrumentedQuery):
+    def document(self, *args, **kwargs):
+        ref = self._wrapped.document(*args, **kwargs)
+        return InstrumentedDocument(ref, ref.path)
+
+    def add(self, document_data, *args, **kwargs):
+        start = time.perf_counter()
+        with FirestoreCall(_collection_label(self._path), kwargs, write=True):
+            result = self._wrapped.add(document_data, *args, **kwargs)
+        _record(self._path, seconds=time.perf_counter() - start, writes=1, rpcs=1,
+                bytes_written=document_size(document_data))
+        return result
+
+
+class InstrumentedDocument(_Proxy):
+    @property
+    def _collection_path(self):
+        return self._path.rsplit("/", 1)[0]
+
+    def collection(self, name):
+        return InstrumentedCollection(self._wrapped.collection(name), f"{self._path}/{name}")
+
+    def get(self, *args, **kwargs):
+        start = time.perf_counter()
+        with FirestoreCall(_collection_label(self._collection_path), kwargs):
+            snapshot = self._wrapped.get(*args, **kwargs)
+        _record(self._collection_path, seconds=time.perf_counter() - start, reads=1, rpcs=1,
+                bytes_read=_snapshot_size(snapshot))
+        return InstrumentedSnapshot(snapshot, self._collection_path)
+
+    def _write(self, name, data, *args, **kwargs):
+        start = time.perf_counter()
+        with FirestoreCall(_collection_label(self._collection_path), kwargs, write=True):
+            result = getattr(self._wrapped, name)(*args, **kwargs)
+        _record(self._collection_path, seconds=time.perf_counter() - start, writes=1, rpcs=1,
+                bytes_written=document_size(data))
+        return result
+
+    def set(self, document_data, *args, **kwargs):
+        return self._write("set", document_data, document_data, *args, **kwargs)
+
+    def update(self, field_updates, *args, **kwargs):
+        return self._write("update", field_updates, field_updates, *args, **kwargs)
+
+    def create(self, document_data, *args, **kwargs):
+        return self._write("create", document_data, document_data, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", None, *args, **kwargs)
+
+
+class InstrumentedBatch(_Proxy):
+    def __init__(self, wrapped):
+        super().__init__(wrapped, "")
+        self._pending = []
+
+    def _add(self, name, reference, data, *args, **kwargs):
+        getattr(self._wrapped, name)(_unwrap(reference), *args, **kwargs)
+        self._pending.append((reference.path.rsplit("/", 1)[0], document_size(data)))
+
+    def set(self, reference, document_data, *args, **kwargs):
+        self._add("set", reference, document_data, document_data, *args, **kwargs)
+
+    def update(self, reference, field_updates, *args, **kwargs):
+        self._add("update", reference, field_updates, field_updates, *args, **kwargs)
+
+    def create(self, reference, document_data, *args, **kwargs):
+        self._add("create", reference, document_data, document_data, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        self._add("delete", reference, None, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        # El breaker del batch es el de la colección de su primer documento
+        collection = self._pending[0][0] if self._pending else ""
+        start = time.perf_counter()
+        with FirestoreCall(_collection_label(collection), kwargs, write=True):
+            result = self._wrapped.commit(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        pending, self._pending = self._pending, []
+        for i, (collection, size) in enumerate(pending):
+            # El RPC y su duración se atribuyen una sola vez al primer documento del batch
+            _record(collection, seconds=elapsed if i == 0 else 0.0, writes=1,
+                    rpcs=1 if i == 0 else 0, bytes_written=size)
+        return result
+
+
+class InstrumentedClient(_Proxy):
+    def __init__(self, client):
+        super().__init__(client, "")
+
+    def collection(self, name):
+        return InstrumentedCollection(self._wrapped.collection(name), name)
+
+    def document(self, path):
+        return InstrumentedDocument(self._wrapped.document(path), path)
+
+    def collection_group(self, collection_id):
+        return InstrumentedQuery(self._wrapped.collection_group(collection_id), f"*/{collection_id}")
+
+    def batch(self):
+        return InstrumentedBatch(self._wrapped.batch())
+
+    def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        collections = {ref.path: ref.path.rsplit("/", 1)[0] for ref in references}
+        label = _collection_label(next(iter(collections.values()), ""))
+        start = time.perf_counter()
+        with FirestoreCall(label, kwargs):
+            snapshots = list(self._wrapped.get_all([_unwrap(ref) for ref in references], *args, **kwargs))
+        elapsed = time.perf_counter() - start
+        for i, snapshot in enumerate(snapshots):
+            collection = collections.get(snapshot.reference.path, "")
+            _record(collection, seconds=elapsed if i == 0 else 0.0, reads=1,
+                    rpcs=1 if i == 0 else 0, bytes_read=_snapshot_size(snapshot))
+            yield InstrumentedSnapshot(snapshot, collection)
+
+
+def instrument_client(client):
+    """Envuelve un cliente de Firestore para contar el costo de cada llamada."""
+    return InstrumentedClient(client)
+
+
+def _route_key(scope):
+    route = scope.get("route")
+    return scope["method"], getattr(route, "path", "unmatched")
+
+
+def server_timing(cost, total_seconds):
+    """Valor del header ``Server-Timing`` para un request."""
+    firestore_ms = cost.firestore_seconds * 1000
+    total_ms = total_seconds * 1000
+    return (
+        f'firestore;dur={firestore_ms:.2f};desc="reads={cost.reads} writes={cost.writes} '
+        f'rpcs={cost.rpcs} bytes={cost.bytes_read + cost.bytes_written}", '
+        f"app;dur={max(total_ms - firestore_ms, 0.0):.2f}, "
+        f"total;dur={total_ms:.2f}"
+    )
+
+
+def register_metrics(name, render):
+    """Agrega a ``/metrics`` las líneas de ``render()``; el mismo nombre reemplaza al registro anterior."""
+    _extra_metrics[name] = render
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_metrics():
+    """Métricas acumuladas en formato de texto de Prometheus."""
+    route_metrics = [
+        ("backend_requests_total", "requests", "counter", "Requests atendidos"),
+        ("backend_request_seconds_total", "seconds", "counter", "Tiempo total de los requests"),
+        ("backend_firestore_seconds_total", "firestore_seconds", "counter", "Tiempo esperando a Firestore"),
+        ("backend_firestore_document_reads_total", "reads", "counter", "Documentos leídos de Firestore"),
+        ("backend_firestore_document_writes_total", "writes", "counter", "Documentos escritos en Firestore"),
+        ("backend_firestore_rpcs_total", "rpcs", "counter", "RPCs a Firestore"),
+        ("backend_firestore_bytes_read_total", "bytes_read", "counter", "Bytes leídos de Firestore"),
+        ("backend_firestore_bytes_written_total", "bytes_written", "counter", "Bytes escritos en Firestore"),
+    ]
+    collection_metrics = [
+        ("backend_firestore_collection_reads_total", "reads", "counter", "Documentos leídos por colección"),
+        ("backend_firestore_collection_writes_total", "writes", "counter", "Documentos escritos por colección"),
+        ("backend_firestore_collection_rpcs_total", "rpcs", "counter", "RPCs por colección"),
+        ("backend_firestore_collection_seconds_total", "seconds", "counter", "Tiempo en Firestore por colección"),
+    ]
+
+    with _lock:
+        routes = {key: dict(values) for key, values in _route_totals.items()}
+        collections = {key: dict(values) for key, values in _collection_totals.items()}
+
+    lines = []
+    for name, field, kind, help_text in route_metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (method, route), values in sorted(routes.items()):
+            lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {values.get(field, 0):g}')
+    for name, field, kind, help_text in collection_metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for collection, values in sorted(collections.items()):
+            lines.append(f'{name}{{collection="{_escape(collection)}"}} {values.get(field, 0):g}')
+    return "\n".join(lines) + "\n" + "".join(render() for render in list(_extra_metrics.values()))
+
+
+def _record_request(scope, cost, seconds):
+    with _lock:
+        totals = _route_totals[_route_key(scope)]
+        totals["requests"] += 1
+        totals["seconds"] += seconds
+        totals["firestore_seconds"] += cost.firestore_seconds
+        totals["reads"] += cost.reads
+        totals["writes"] += cost.writes
+        totals["rpcs"] += cost.rpcs
+        totals["bytes_read"] += cost.bytes_read
+        totals["bytes_written"] += cost.bytes_written
+
+
+class FirestoreCostMiddleware:
+    """
+    Middleware ASGI: acumula el costo de Firestore de cada request hasta el último fragmento
+    del cuerpo. Una respuesta de un solo fragmento lleva ``Server-Timing`` en sus headers; una en
+    streaming lo lleva como trailer (si el servidor anuncia ``http.response.trailers``) o en el log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cost = RequestCost()
+        token = _current_cost.set(cost)
+        start = time.perf_counter()
+        trailers = "http.response.trailers" in scope.get("extensions", {})
+        state = {"start": None, "streaming": False, "recorded": False}
+
+        def finish():
+            state["recorded"] = True
+            total = time.perf_counter() - start
+            _record_request(scope, cost, total)
+            return server_timing(cost, total)
+
+        async def counted_send(message):
+            if message["type"] == "http.response.start":
+                # Se retiene hasta saber si el cuerpo viene en un solo fragmento
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["recorded"]:
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            if state["start"] is not None:
+                start_message, state["start"] = state["start"], None
+                headers = list(start_message.get("headers", []))
+                if not more_body:
+                    headers.append((b"server-timing", finish().encode()))
+                else:
+                    state["streaming"] = True
+                    if trailers:
+                        headers.append((b"trailer", b"Server-Timing"))
+                        start_message = {**start_message, "trailers": True}
+                await send({**start_message, "headers": headers})
+                if not more_body:
+                    await send(message)
+                    return
+
+            await send(message)
+            if not more_body:
+                timing = finish()
+                if trailers:
+                    await send({"type": "http.response.trailers", "more_trailers": False,
+                                "headers": [(b"server-timing", timing.encode())]})
+                else:
+                    print(f"Costo de Firestore {scope['method']} {scope['path']}: {timing}")
+
+        try:
+            await self.app(scope, receive, counted_send)
+        finally:
+            _current_cost.reset(token)
+            if not state["recorded"]:
+                # Error o cliente desconectado antes del último fragmento: el costo se cuenta igual
+                finish()
+
+
+def instrument_app(app):
+    """Registra el middleware de costo de Firestore y la ruta ``/metrics`` en la app."""
+    app.add_middleware(FirestoreCostMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    return app
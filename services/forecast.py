@@ -0,0 +1,239 @@
+"""
+Pronóstico de demanda diaria por producto para sugerir el stock (``amount``).
+
+``load_daily_demand`` arma la matriz producto x día con los documentos diarios
+de ``orders_product`` y los eventos ``order`` de ``detail_events`` (por día se
+toma el mayor de los dos, porque ambos registran los mismos pedidos).
+``train_and_forecast`` entrena un único modelo lineal (Ridge) para todos los
+productos a la vez: cada fila es (producto, día) con los rezagos de la última
+semana, los promedios de 7 y 28 días y el día de la semana, escalados por la
+demanda media del producto. El pronóstico se calcula de forma recursiva para
+todos los productos en cada paso, sin bucles por producto.
+
+Con ``FORECAST_SHARED_PATH`` (p. ej. ``/dev/shm/backend-wiki-forecast.json``)
+solo el worker que tiene el lock del archivo lee la historia y entrena; publica
+el resultado en ese archivo y los demás lo leen (``shared_snapshot``).
+"""
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import orjson
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.linear_model import Ridge
+
+from services.date_ranges import DateRange, day_bucket
+from services.heatmap import DEFAULT_TIMEZONE
+from services.restaurant_snapshots import restaurant_key
+from services.shared_snapshot import PublisherLock, SharedSnapshotReader, publish
+
+LAGS = 7
+WINDOW = 28
+DEFAULT_HISTORY_DAYS = 180
+DEFAULT_HORIZON = 7
+# Stock de seguridad: ~95 % de nivel de servicio sobre el error del modelo
+SAFETY_Z = 1.65
+
+
+def load_daily_demand(db, start, end):
+    """{producto: {día: unidades}} entre ``start`` y ``end`` (inclusivos)."""
+    period = DateRange(start, end)
+    demand = defaultdict(lambda: defaultdict(int))
+    for doc in period.daily_documents(db.collection("orders_product")).stream():
+        bucket = day_bucket(doc.id)
+        if bucket is None:
+            continue
+        for product_name, count in doc.to_dict().items():
+            try:
+                demand[product_name][bucket[0]] += int(count)
+            except (TypeError, ValueError):
+                continue
+
+    events = defaultdict(lambda: defaultdict(int))
+    zone = ZoneInfo(DEFAULT_TIMEZONE)
+    query = db.collection("detail_events").where("event_type", "==", "order")
+    for doc in period.filter_timestamp_field(query, "timestamp").stream():
+        data = doc.to_dict()
+        product_name, timestamp = data.get("product_name"), data.get("timestamp")
+        if not product_name or not timestamp:
+            continue
+        if isinstance(timestamp, datetime):
+            # Mismo día local que usa el filtro del rango
+            day = (timestamp.astimezone(zone) if timestamp.tzinfo else timestamp).date().isoformat()
+        else:
+            day = str(timestamp)[:10]
+        events[product_name][day] += 1
+
+    for product_name, days in events.items():
+        for day, count in days.items():
+            if count > demand[product_name].get(day, 0):
+                demand[product_name][day] = count
+    return demand
+
+
+def demand_matrix(demand, start, end):
+    """(productos, fechas, matriz float32 [productos, días]) con ceros en los días sin pedidos."""
+    dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    column = {day.isoformat(): i for i, day in enumerate(dates)}
+    products = sorted(demand)
+    matrix = np.zeros((len(products), len(dates)), dtype=np.float32)
+    for row, product_name in enumerate(products):
+        for day, count in demand[product_name].items():
+            col = column.get(day)
+            if col is not None:
+                matrix[row, col] = count
+    return products, dates, matrix
+
+
+def _features(windows, weekdays):
+    """
+    Matriz de features a partir de ventanas [..., WINDOW] (el último valor es el día anterior
+    al pronosticado) y el día de la semana del día pronosticado.
+    """
+    lags = windows[..., :-LAGS - 1:-1]
+    mean_7 = windows[..., -7:].mean(axis=-1, keepdims=True)
+    mean_28 = windows.mean(axis=-1, keepdims=True)
+    dow = np.zeros(windows.shape[:-1] + (7,), dtype=np.float32)
+    np.put_along_axis(dow, np.broadcast_to(weekdays, windows.shape[:-1])[..., None], 1.0, axis=-1)
+    return np.concatenate([lags, mean_7, mean_28, dow], axis=-1)
+
+
+def train_and_forecast(matrix, dates, horizon=DEFAULT_HORIZON, alpha=1.0):
+    """
+    Entrena con toda la historia y pronostica ``horizon`` días para todos los productos.
+    Devuelve (pronóstico [productos, horizon], error estándar por producto [productos]).
+    """
+    products = matrix.shape[0]
+    if products == 0:
+        return np.zeros((0, horizon), dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+    # Con menos historia que la ventana se asume demanda 0 en los días faltantes
+    missing = WINDOW + 1 - matrix.shape[1]
+    if missing > 0:
+        matrix = np.pad(matrix, ((0, 0), (missing, 0)))
+        dates = [dates[0] - timedelta(days=missing - i) for i in range(missing)] + list(dates)
+
+    scale = matrix.mean(axis=1, keepdims=True) + 1.0
+    scaled = matrix / scale
+    weekdays = np.array([day.weekday() for day in dates], dtype=np.int64)
+
+    # Fila de entrenamiento = (producto, día t): ventana de los WINDOW días previos -> demanda de t
+    windows = sliding_window_view(scaled, WINDOW, axis=1)[:, :-1]
+    targets = scaled[:, WINDOW:]
+    features = _features(windows, weekdays[WINDOW:])
+    model = Ridge(alpha=alpha)
+    model.fit(features.reshape(-1, features.shape[-1]), targets.ravel())
+
+    fitted = model.predict(features.reshape(-1, features.shape[-1])).reshape(targets.shape)
+    error = np.sqrt(np.mean((targets - fitted) ** 2, axis=1)) * scale[:, 0]
+
+    history = scaled[:, -WINDOW:].copy()
+    last_day = dates[-1]
+    forecast = np.empty((products, horizon), dtype=np.float32)
+    for step in range(horizon):
+        weekday = np.array([(last_day + timedelta(days=step + 1)).weekday()])
+        prediction = np.clip(model.predict(_features(history, weekday)), 0, None)
+        forecast[:, step] = prediction
+        history = np.concatenate([history[:, 1:], prediction[:, None]], axis=1)
+
+    return forecast * scale, error.astype(np.float32)
+
+
+def _catalog(db):
+    """{restaurant_key: (nombre, [productos])} con el ``amount`` actual de cada producto."""
+    restaurants = {}
+    for doc in db.collection("retaurants").stream():
+        data = doc.to_dict()
+        if data.get("name"):
+            restaurants[restaurant_key(data["name"])] = (data["name"], data.get("products", []))
+    return restaurants
+
+
+class ForecastSnapshot:
+    """Un pronóstico publicado: ``{"generated_at", "forecasts": {restaurant_key: {...}}}`` en JSON."""
+
+    def __init__(self, buffer):
+        with memoryview(buffer) as view:
+            data = orjson.loads(view)
+        self.generated_at = data["generated_at"]
+        self.forecasts = data["forecasts"]
+
+
+class DemandForecaster:
+    """
+    Mantiene el último pronóstico por restaurante; ``rebuild`` lo reemplaza de forma
+    atómica. Con ``FORECAST_SHARED_PATH`` solo lo calcula el proceso con el lock del
+    archivo y el resto sirve lo publicado, también después de reiniciarse.
+    """
+
+    def __init__(self, db, history_days=DEFAULT_HISTORY_DAYS, horizon=DEFAULT_HORIZON, shared_path=None):
+        self._db = db
+        self._history_days = history_days
+        self._horizon = horizon
+        self.shared_path = shared_path or os.getenv("FORECAST_SHARED_PATH") or None
+        self._reader = SharedSnapshotReader(self.shared_path, ForecastSnapshot, check_interval=1.0) \
+            if self.shared_path else None
+        self._publisher = PublisherLock(self.shared_path) if self.shared_path else None
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @property
+    def snapshot(self):
+        if self._reader is not None:
+            return self._reader.get()
+        return self._snapshot
+
+    def rebuild(self, today=None):
+        """Entrena y publica; con archivo compartido, solo si este proceso es el publicador."""
+        if self._publisher is not None and not self._publisher.held():
+            return None
+        # El día actual está incompleto: la historia termina ayer
+        today = today or date.today()
+        end = today - timedelta(days=1)
+        start = end - timedelta(days=self._history_days - 1)
+
+        demand = load_daily_demand(self._db, start, end)
+        products, dates, matrix = demand_matrix(demand, start, end)
+        started = time.perf_counter()
+        forecast, error = train_and_forecast(matrix, dates, self._horizon)
+        print(f"Pronóstico de {len(products)} productos entrenado en {time.perf_counter() - started:.2f} s")
+
+        row = {product_name: i for i, product_name in enumerate(products)}
+        days = [(today + timedelta(days=i)).isoformat() for i in range(self._horizon)]
+        forecasts = {}
+        for key, (name, catalog_products) in _catalog(self._db).items():
+            entries = []
+            for product in catalog_products:
+                i = row.get(product.get("productName"))
+                units = forecast[i] if i is not None else np.zeros(self._horizon, dtype=np.float32)
+                sigma = float(error[i]) if i is not None else 0.0
+                entries.append({
+                    "productId": product.get("productId"),
+                    "productName": product.get("productName"),
+                    "amount": product.get("amount"),
+                    "forecast": [{"date": day, "units": round(float(value), 2)} for day, value in zip(days, units)],
+                    "suggested_amount": math.ceil(float(units[0]) + SAFETY_Z * sigma),
+                })
+            forecasts[key] = {"restaurant": name, "products": entries}
+
+        buffer = orjson.dumps({"generated_at": datetime.now().isoformat(), "forecasts": forecasts})
+        if self._publisher is not None:
+            publish(self.shared_path, buffer)
+            self._reader.recheck()
+        else:
+            with self._lock:
+                self._snapshot = ForecastSnapshot(buffer)
+        return len(products)
+
+    def get(self, restaurant_name):
+        """Respuesta de ``/forecast/{restaurant}``; None si aún no hay pronóstico y {} si no existe."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        forecast = snapshot.forecasts.get(restaurant_key(restaurant_name))
+        return {"generated_at": snapshot.generated_at, **forecast} if forecast else {}
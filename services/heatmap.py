@@ -0,0 +1,105 @@
+"""
+Histogramas día de la semana x hora sobre timestamps de eventos.
+
+``local_datetimes`` convierte de una sola vez una columna de timestamps
+(``datetime`` de Firestore o texto ISO 8601, con o sin zona) a ``datetime64``
+en la hora local de los usuarios (``ANALYTICS_TIMEZONE``, America/Bogota por
+defecto). Los valores con zona (Timestamps de Firestore, "...Z", "...-05:00")
+se convierten; los que no tienen zona se asumen ya en hora local, como los
+guarda la app móvil. ``histogram`` calcula día de la semana y hora con
+aritmética entera sobre el arreglo y cuenta todas las celdas con un solo
+``np.bincount``, opcionalmente por clave (pantalla, producto...) y sumando un
+peso (duración...).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_TIMEZONE = os.getenv("ANALYTICS_TIMEZONE", "America/Bogota")
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+CELLS = 7 * 24
+
+NAIVE_TEXT, AWARE_TEXT, MOMENT, EMPTY = range(4)
+
+
+def _kind(value):
+    # Solo se mira el final del texto ("Z" o "+HH:MM"); el parseo se hace en bloque con pandas
+    if type(value) is str:
+        return AWARE_TEXT if value.endswith("Z") or (len(value) > 10 and value[-6] in "+-") else NAIVE_TEXT
+    return EMPTY if value is None else MOMENT
+
+
+def local_datetimes(values, tz=DEFAULT_TIMEZONE):
+    """``datetime64[s]`` en hora local para cada valor; NaT para los vacíos o inválidos."""
+    series = pd.Series(values, dtype=object)
+    result = np.full(len(series), np.datetime64("NaT"), dtype="datetime64[s]")
+    if not len(series):
+        return result
+    kinds = np.fromiter((_kind(value) for value in series), dtype=np.int8, count=len(series))
+
+    naive = kinds == NAIVE_TEXT
+    if naive.any():
+        parsed = pd.to_datetime(series[naive], format="ISO8601", errors="coerce")
+        result[naive] = parsed.to_numpy().astype("datetime64[s]")
+    aware = kinds == AWARE_TEXT
+    if aware.any():
+        parsed = pd.to_datetime(series[aware], format="ISO8601", utc=True, errors="coerce")
+        result[aware] = parsed.dt.tz_convert(tz).dt.tz_localize(None).to_numpy().astype("datetime64[s]")
+    # datetime de Firestore (DatetimeWithNanoseconds, siempre en UTC)
+    moments = kinds == MOMENT
+    if moments.any():
+        parsed = pd.to_datetime(series[moments], utc=True, errors="coerce")
+        result[moments] = parsed.dt.tz_convert(tz).dt.tz_localize(None).to_numpy().astype("datetime64[s]")
+    return result
+
+
+def weekday_hour(local):
+    """(día de la semana 0=lunes, hora 0-23, máscara de válidos) para un arreglo ``datetime64``."""
+    valid = ~np.isnat(local)
+    seconds = local.astype("datetime64[s]").astype(np.int64)
+    seconds = np.where(valid, seconds, 0)
+    days = np.floor_divide(seconds, 86400)
+    # El 1970-01-01 fue jueves (3 con lunes = 0)
+    weekday = (days + 3) % 7
+    hour = np.floor_divide(seconds, 3600) % 24
+    return weekday, hour, valid
+
+
+class Heatmap:
+    def __init__(self, counts, sums=None, keys=None):
+        self.counts = counts  # int64 [7, 24] o [claves, 7, 24]
+        self.sums = sums  # float64 con la misma forma, si hubo pesos
+        self.keys = keys  # etiquetas de la primera dimensión, si se agrupó por clave
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def by_hour(self):
+        return self.counts.sum(axis=-2)
+
+    def by_weekday(self):
+        return self.counts.sum(axis=-1)
+
+
+def histogram(local, weights=None, keys=None):
+    """Cuenta (y suma ``weights``) por día de la semana y hora, opcionalmente por ``keys``."""
+    weekday, hour, valid = weekday_hour(local)
+    cells = (weekday * 24 + hour)[valid]
+
+    labels = None
+    size = CELLS
+    if keys is not None:
+        codes, labels = pd.factorize(pd.Series(keys, dtype=object).fillna("Unknown"))
+        cells = codes[valid] * CELLS + cells
+        size = len(labels) * CELLS
+        labels = list(labels)
+
+    shape = (len(labels), 7, 24) if labels is not None else (7, 24)
+    counts = np.bincount(cells, minlength=size).reshape(shape)
+    sums = None
+    if weights is not None:
+        weights = pd.to_numeric(pd.Series(weights, dtype=object), errors="coerce").fillna(0).to_numpy(np.float64)
+        sums = np.bincount(cells, weights=weights[valid], minlength=size).reshape(shape)
+    return Heatmap(counts, sums, labels)
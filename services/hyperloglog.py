@@ -0,0 +1,68 @@
+"""
+HyperLogLog para contar usuarios distintos de forma aproximada.
+
+Con la precisión por defecto (p=12) cada sketch ocupa 4096 registros de un
+byte (~4 KB, menos comprimido) y el error estándar es ~1.6 %. Dos sketches con
+la misma precisión se combinan tomando el máximo de cada registro, así que los
+sketches diarios se pueden sumar en meses sin volver a leer usuarios.
+"""
+import hashlib
+import math
+import zlib
+
+import numpy as np
+
+DEFAULT_PRECISION = 12
+
+
+def _alpha(m):
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class HyperLogLog:
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+        x = int.from_bytes(digest, "big")
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        # Posición del primer 1 en los 64-p bits restantes
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Solo se pueden combinar sketches con la misma precisión")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        registers = self.registers.astype(np.float64)
+        estimate = _alpha(self.m) * self.m ** 2 / np.sum(np.exp2(-registers))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Corrección para rangos pequeños (linear counting)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes([self.precision]) + zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        precision = data[0]
+        registers = np.frombuffer(zlib.decompress(data[1:]), dtype=np.uint8).copy()
+        return cls(precision, registers)
@@ -0,0 +1,320 @@
+"""
+Claves de idempotencia para las rutas que crean pedidos.
+
+Si el cliente manda ``Idempotency-Key``, ``IdempotencyCache.run`` ejecuta el
+handler una sola vez por clave y guarda su respuesta (también los 4xx) durante
+``IDEMPOTENCY_TTL`` segundos; los reintentos con la misma clave reciben esa
+respuesta con ``Idempotent-Replayed: true`` sin volver a leer el catálogo ni
+descontar stock. Un duplicado que llega mientras el primero sigue en curso
+espera a que termine (hasta ``IDEMPOTENCY_WAIT_TIMEOUT`` segundos, si no 409).
+Reusar una clave con otros parámetros responde 422. Los 5xx no se guardan:
+el siguiente reintento vuelve a ejecutar.
+
+Una vez ejecutado el pedido, guardar la respuesta se reintenta hasta
+``IDEMPOTENCY_COMPLETE_ATTEMPTS`` veces: si no queda guardada, la reserva
+vencería y un reintento volvería a descontar stock. Si aun así falla, la
+respuesta queda en memoria del proceso, que la repite a los reintentos que
+le lleguen y vuelve a intentar guardarla con cada uno.
+
+El almacén por defecto vive en memoria del proceso. Con varios workers,
+``IDEMPOTENCY_BACKEND=firestore`` guarda las claves en la colección
+``idempotency_keys``: el primero en crear el documento la reserva y los demás
+esperan a que pase a ``done``. Tomar una clave vencida (o la reserva de un
+worker que se cayó) se hace en una transacción que vuelve a leer el documento,
+así que dos workers no pueden tomarla a la vez. ``expires_at`` sirve para una
+política de TTL.
+"""
+import hashlib
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from fastapi import HTTPException
+from firebase_admin import firestore
+from google.api_core import exceptions as gexc
+
+TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+# Tiempo que una reserva sin terminar bloquea la clave (p. ej. si el worker se cayó)
+LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))
+MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+# Intentos de guardar la respuesta después de ejecutar el pedido
+COMPLETE_ATTEMPTS = int(os.getenv("IDEMPOTENCY_COMPLETE_ATTEMPTS", "4"))
+MAX_KEY_LENGTH = 255
+COLLECTION = "idempotency_keys"
+
+PENDING = "pending"
+DONE = "done"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(*values):
+    """Huella de los parámetros del request, para detectar una clave reusada en otro pedido."""
+    return hashlib.sha256(orjson.dumps(values)).hexdigest()
+
+
+class MemoryIdempotencyStore:
+    def __init__(self, ttl=None, max_keys=None):
+        self.ttl = ttl or TTL
+        self.max_keys = max_keys or MAX_KEYS
+        self._lock = threading.Lock()
+        self._records = {}  # {clave: registro}
+        # (vencimiento, clave) de cada registro escrito; las reservas (LEASE) y las respuestas (TTL)
+        # vencen en otro orden que el de escritura. Las entradas de un registro ya reemplazado se
+        # descartan al salir del heap
+        self._expiries = []
+
+    def _store(self, key, record, now):
+        self._records[key] = record
+        heapq.heappush(self._expiries, (record["expires_at"], key))
+        self._evict(now)
+
+    def _evict(self, now):
+        while self._expiries:
+            expires_at, key = self._expiries[0]
+            record = self._records.get(key)
+            if record is not None and record["expires_at"] == expires_at:
+                if expires_at > now and len(self._records) <= self.max_keys:
+                    break
+                del self._records[key]
+            heapq.heappop(self._expiries)
+
+    def _valid(self, key, now):
+        record = self._records.get(key)
+        return record if record is not None and record["expires_at"] > now else None
+
+    def reserve(self, key, signature):
+        """None si la clave quedó reservada para este request; si no, el registro existente."""
+        now = time.time()
+        with self._lock:
+            record = self._valid(key, now)
+            if record is not None:
+                return record
+            self._store(key, {"fingerprint": signature, "state": PENDING, "expires_at": now + LEASE}, now)
+        return None
+
+    def get(self, key):
+        with self._lock:
+            return self._valid(key, time.time())
+
+    def complete(self, key, signature, status_code, body):
+        now = time.time()
+        with self._lock:
+            self._store(key, {"fingerprint": signature, "state": DONE, "status_code": status_code,
+                              "body": body, "expires_at": now + self.ttl}, now)
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class FirestoreIdempotencyStore:
+    def __init__(self, db, collection=COLLECTION, ttl=None):
+        self._db = db
+        self._collection = collection
+        self.ttl = ttl or TTL
+
+    def _ref(self, key):
+        # Las claves pueden traer "/" u otros caracteres que no valen como id de documento
+        return self._db.collection(self._collection).document(hashlib.sha256(key.encode()).hexdigest())
+
+    @staticmethod
+    def _decode(data):
+        if data is None or data["expires_at"].timestamp() <= time.time():
+            return None
+        record = {"fingerprint": data["fingerprint"], "state": data["state"],
+                  "expires_at": data["expires_at"].timestamp()}
+        if data["state"] == DONE:
+            record["status_code"] = data["status_code"]
+            record["body"] = orjson.loads(data["body"])
+        return record
+
+    def _pending(self, signature):
+        return {"fingerprint": signature, "state": PENDING,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=LEASE)}
+
+    def reserve(self, key, signature):
+        ref = self._ref(key)
+        try:
+            ref.create(self._pending(signature))
+            return None
+        except (gexc.AlreadyExists, gexc.Conflict):
+            pass
+
+        @firestore.transactional
+        def take_over(transaction):
+            record = self._decode(ref.get(transaction=transaction).to_dict())
+            if record is not None:
+                return record
+            # Registro vencido (o reserva de un worker que se cayó): si otro lo toma antes
+            # del commit, la transacción se reintenta y ve su reserva
+            transaction.set(ref, self._pending(signature))
+            return None
+
+        return take_over(self._db.transaction())
+
+    def get(self, key):
+        return self._decode(self._ref(key).get().to_dict())
+
+    def complete(self, key, signature, status_code, body):
+        self._ref(key).set({
+            "fingerprint": signature,
+            "state": DONE,
+            "status_code": status_code,
+            "body": orjson.dumps(body).decode(),
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+        })
+
+    def release(self, key):
+        self._ref(key).delete()
+
+
+def default_store(db):
+    if os.getenv("IDEMPOTENCY_BACKEND", "memory") == "firestore":
+        return FirestoreIdempotencyStore(db)
+    return MemoryIdempotencyStore()
+
+
+class IdempotencyCache:
+    def __init__(self, store, wait_timeout=None):
+        self.store = store
+        self.wait_timeout = wait_timeout or WAIT_TIMEOUT
+        self._lock = threading.Lock()
+        self._in_flight = {}  # {clave: threading.Event} de los requests en curso en este proceso
+        # {clave: registro} de respuestas ya ejecutadas que no se pudieron guardar en el almacén
+        self._unsaved = OrderedDict()
+        self.stats = {"executed": 0, "replayed": 0, "waited": 0, "mismatched": 0, "timed_out": 0, "unsaved": 0}
+
+    def run(self, scope, key, signature, func, response=None):
+        """Resultado de ``func()``, ejecutado una sola vez por ``key`` dentro de ``scope``."""
+        if not key:
+            return func()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400,
+                                detail=f"Idempotency-Key no puede tener más de {MAX_KEY_LENGTH} caracteres")
+        full_key = f"{scope}:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            with self._lock:
+                event = self._in_flight.get(full_key)
+                owner = event is None
+                if owner:
+                    event = self._in_flight[full_key] = threading.Event()
+            if owner:
+                break
+            # Duplicado en curso en este proceso: esperar su respuesta en vez de ejecutar otra vez
+            self.stats["waited"] += 1
+            if not event.wait(max(0.0, deadline - time.monotonic())):
+                self._timed_out()
+            # Todos los que esperaban leen la respuesta a la vez, sin turnarse la reserva
+            record = self.store.get(full_key)
+            if record is not None and record["state"] == DONE:
+                return self._replay(record, signature, response)
+
+        try:
+            unsaved = self._unsaved.get(full_key)
+            if unsaved is not None and unsaved["expires_at"] > time.time():
+                # Ya se ejecutó aquí pero el almacén no lo tiene: nunca se vuelve a ejecutar
+                self._save(full_key, unsaved["fingerprint"], unsaved["status_code"], unsaved["body"], attempts=1)
+                return self._replay(unsaved, signature, response)
+            record = self.store.reserve(full_key, signature)
+            if record is not None and record["state"] == PENDING:
+                record = self._wait_remote(full_key, signature, record, deadline)
+            if record is not None:
+                return self._replay(record, signature, response)
+            return self._execute(full_key, signature, func)
+        finally:
+            with self._lock:
+                del self._in_flight[full_key]
+            event.set()
+
+    def _wait_remote(self, full_key, signature, record, deadline):
+        # Otro worker tiene la clave reservada (solo con el almacén compartido)
+        self.stats["waited"] += 1
+        delay = 0.05
+        while record is not None and record["state"] == PENDING:
+            if record["fingerprint"] != signature:
+                return record
+            if time.monotonic() + delay > deadline:
+                self._timed_out()
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            record = self.store.get(full_key)
+        # Si la reserva se liberó (el otro falló con 5xx), este request la toma
+        return record if record is not None else self.store.reserve(full_key, signature)
+
+    def _timed_out(self):
+        self.stats["timed_out"] += 1
+        raise HTTPException(status_code=409,
+                            detail="Hay un request con la misma Idempotency-Key en curso, reintenta más tarde")
+
+    def _replay(self, record, signature, response):
+        if record["fingerprint"] != signature:
+            self.stats["mismatched"] += 1
+            raise HTTPException(status_code=422,
+                                detail="La Idempotency-Key ya se usó con otros parámetros")
+        if record["state"] == PENDING:
+            self._timed_out()
+        self.stats["replayed"] += 1
+        if record["status_code"] >= 400:
+            raise HTTPException(status_code=record["status_code"], detail=record["body"].get("detail"),
+                                headers={REPLAYED_HEADER: "true"})
+        if response is not None:
+            response.headers[REPLAYED_HEADER] = "true"
+        return record["body"]
+
+    def _save(self, full_key, signature, status_code, body, attempts=None):
+        """Guarda la respuesta de un pedido ya ejecutado; si no se puede, la conserva en memoria."""
+        attempts = attempts or COMPLETE_ATTEMPTS
+        delay = 0.05
+        for attempt in range(attempts):
+            try:
+                self.store.complete(full_key, signature, status_code, body)
+            except Exception as e:
+                error = e
+                if attempt + 1 < attempts:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+                continue
+            with self._lock:
+                self._unsaved.pop(full_key, None)
+            return
+        print(f"⚠ No se pudo guardar la respuesta de la Idempotency-Key {full_key}: {str(error)}")
+        with self._lock:
+            if full_key not in self._unsaved:
+                self.stats["unsaved"] += 1
+            self._unsaved[full_key] = {"fingerprint": signature, "state": DONE, "status_code": status_code,
+                                       "body": body, "expires_at": time.time() + self.store.ttl}
+            while len(self._unsaved) > MAX_KEYS:
+                self._unsaved.popitem(last=False)
+
+    def _execute(self, full_key, signature, func):
+        self.stats["executed"] += 1
+        try:
+            result = func()
+        except HTTPException as e:
+            # Los errores del pedido (sin stock, no encontrado) son la respuesta definitiva
+            if e.status_code < 500:
+                self._save(full_key, signature, e.status_code, {"detail": e.detail})
+            else:
+                self.store.release(full_key)
+            raise
+        except BaseException:
+            self.store.release(full_key)
+            raise
+        # El pedido ya se aplicó: un error al guardar la respuesta no debe volverlo a ejecutar
+        self._save(full_key, signature, 200, result)
+        return result
+
+    def render_metrics(self):
+        """Uso de las claves de idempotencia en formato de texto de Prometheus."""
+        lines = ["# HELP backend_idempotency_requests_total Requests con Idempotency-Key por resultado",
+                 "# TYPE backend_idempotency_requests_total counter"]
+        lines += [f'backend_idempotency_requests_total{{outcome="{outcome}"}} {value}'
+                  for outcome, value in self.stats.items()]
+        return "\n".join(lines) + "\n"
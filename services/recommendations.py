@@ -0,0 +1,248 @@
+"""
+Recomendaciones item-item precalculadas a partir del historial de pedidos.
+
+``build_index`` arma la matriz dispersa usuario x producto con ``orders/{uid}``,
+calcula la similitud coseno entre productos y guarda para cada producto sus
+``k`` vecinos más parecidos. Servir una recomendación es buscar los productos
+del usuario y combinar sus listas de vecinos: no hay inferencia en el request.
+``orders_product`` se usa para el ranking de popularidad con el que se
+completan usuarios sin historial.
+
+El índice es un solo buffer con arreglos planos (como ``catalog_snapshot``):
+vecinos y puntajes, el historial de cada usuario en formato CSR (``indptr`` /
+``indices``) y los uid ordenados para encontrar su fila con búsqueda binaria.
+Con ``RECOMMENDATIONS_SHARED_PATH`` (p. ej.
+``/dev/shm/backend-wiki-recommendations.bin``) solo el worker que tiene el lock
+del archivo lo construye y lo publica; los demás lo mapean (``shared_snapshot``).
+"""
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+import orjson
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from services.shared_snapshot import PublisherLock, SharedSnapshotReader, publish
+
+DEFAULT_TOP_K = 20
+MAGIC = b"WKREC001"
+SECTIONS = ("products", "neighbors", "scores", "popular", "user_ids", "indptr", "indices")
+HEADER = struct.Struct("<8sdQQQQ" + "QQ" * len(SECTIONS))
+
+
+def build_buffer(products, neighbors, scores, popular, user_ids, indptr, indices, built_at=None):
+    """Buffer del índice; ``user_ids`` (bytes) deben venir ordenados y alineados con las filas del CSR."""
+    width = max((len(uid) for uid in user_ids), default=1)
+    sections = {
+        "products": orjson.dumps(products),
+        "neighbors": neighbors.astype(np.int32).tobytes(),
+        "scores": scores.astype(np.float32).tobytes(),
+        "popular": popular.astype(np.int32).tobytes(),
+        "user_ids": np.array(user_ids, dtype=f"S{width}").tobytes(),
+        "indptr": indptr.astype(np.int64).tobytes(),
+        "indices": indices.astype(np.int32).tobytes(),
+    }
+    # Cada sección empieza alineada a 8 bytes para poder verla como arreglo de NumPy
+    body = bytearray()
+    table = []
+    for name in SECTIONS:
+        start = HEADER.size + len(body)
+        padding = -start % 8
+        body += b"\x00" * padding
+        table += [start + padding, len(sections[name])]
+        body += sections[name]
+    header = HEADER.pack(MAGIC, built_at or time.time(), len(products), neighbors.shape[1],
+                         len(user_ids), width, *table)
+    return header + bytes(body)
+
+
+class RecommendationIndex:
+    """Índice inmutable respaldado por un buffer (bytes o mmap del archivo compartido)."""
+
+    def __init__(self, buffer):
+        magic, self.built_at, count, k, users, width, *table = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("El buffer no es un índice de recomendaciones")
+        self._buffer = buffer
+        self._sections = {name: (table[2 * i], table[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+        self.neighbors = self._array("neighbors", np.int32).reshape(count, k)  # -1 = sin vecino
+        self.scores = self._array("scores", np.float32).reshape(count, k)
+        self.popular = self._array("popular", np.int32)  # productos por popularidad
+        self.user_ids = self._array("user_ids", f"S{width}")  # uid ordenados, posición = fila
+        self.indptr = self._array("indptr", np.int64)
+        self.indices = self._array("indices", np.int32)  # productos pedidos por cada fila
+        start, length = self._sections["products"]
+        self.products = orjson.loads(memoryview(buffer)[start:start + length])  # posición = índice
+
+    def _array(self, name, dtype):
+        start, length = self._sections[name]
+        return np.frombuffer(self._buffer, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=start)
+
+    @property
+    def nbytes(self):
+        return len(self._buffer)
+
+    def user_items(self, user_id):
+        """int32[] de productos pedidos por el usuario, o None si no tiene historial."""
+        key = user_id.encode()
+        if len(key) > self.user_ids.dtype.itemsize:
+            return None
+        row = int(np.searchsorted(self.user_ids, key))
+        if row == len(self.user_ids) or self.user_ids[row] != key:
+            return None
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def recommend(self, user_id, n=10):
+        """[(producto, puntaje)] para el usuario y la fuente usada ("similar" o "popular")."""
+        owned = self.user_items(user_id)
+        top = []
+        if owned is not None and len(owned):
+            candidates = self.neighbors[owned].ravel()
+            weights = self.scores[owned].ravel()
+            valid = candidates >= 0
+            totals = np.bincount(candidates[valid], weights=weights[valid], minlength=len(self.products))
+            totals[owned] = 0
+            top = [(int(i), round(float(totals[i]), 4)) for i in np.argsort(-totals)[:n] if totals[i] > 0]
+        # "popular" si ningún producto salió de la similitud, aunque el usuario tenga historial
+        source = "similar" if top else "popular"
+
+        # Completar con los productos más populares que el usuario no haya pedido
+        seen = {i for i, _ in top}
+        if owned is not None:
+            seen.update(owned.tolist())
+        for i in self.popular.tolist():
+            if len(top) >= n:
+                break
+            if i not in seen:
+                top.append((i, 0.0))
+        return [(self.products[i], score) for i, score in top], source
+
+
+def load_orders(db):
+    """{uid: [nombres de producto]} desde ``orders`` y {producto: pedidos} desde ``orders_product``."""
+    user_orders = {}
+    for doc in db.collection("orders").stream():
+        orders = doc.to_dict().get("orders", [])
+        names = [order.get("product_name") for order in orders if order.get("state") != "cancelled"]
+        user_orders[doc.id] = [name for name in names if name]
+
+    popularity = {}
+    for doc in db.collection("orders_product").stream():
+        for product_name, count in doc.to_dict().items():
+            try:
+                popularity[product_name] = popularity.get(product_name, 0) + int(count)
+            except (TypeError, ValueError):
+                continue
+    return user_orders, popularity
+
+
+def _top_k(similarity, k):
+    """Los ``k`` vecinos de mayor similitud por fila de una matriz CSR (sin la diagonal)."""
+    n = similarity.shape[0]
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    indptr, indices, data = similarity.indptr, similarity.indices, similarity.data
+    for row in range(n):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        cols = indices[start:end]
+        values = data[start:end]
+        if len(values) > k:
+            best = np.argpartition(-values, k - 1)[:k]
+            cols, values = cols[best], values[best]
+        order = np.argsort(-values)
+        neighbors[row, :len(order)] = cols[order]
+        scores[row, :len(order)] = values[order]
+    return neighbors, scores
+
+
+def build_index(user_orders, popularity=None, k=DEFAULT_TOP_K):
+    """Buffer del índice a partir de {uid: [productos]} y {producto: pedidos}."""
+    popularity = popularity or {}
+    product_ids = {}
+    rows, cols = [], []
+    user_ids = []
+    for uid, names in user_orders.items():
+        if not names:
+            continue
+        row = len(user_ids)
+        user_ids.append(uid)
+        for name in names:
+            rows.append(row)
+            cols.append(product_ids.setdefault(name, len(product_ids)))
+    for name in popularity:
+        product_ids.setdefault(name, len(product_ids))
+
+    products = list(product_ids)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(user_ids), len(products)),
+    )
+    matrix.data[:] = 1.0  # pedidos repetidos del mismo producto cuentan una vez
+
+    # Similitud coseno item-item: columnas normalizadas, X^T X disperso
+    if matrix.nnz:
+        items = normalize(matrix.T.tocsr(), norm="l2", axis=1)
+        similarity = (items @ items.T).tocsr()
+        similarity.setdiag(0)
+        similarity.eliminate_zeros()
+    else:
+        similarity = sparse.csr_matrix((len(products), len(products)), dtype=np.float32)
+    neighbors, scores = _top_k(similarity, k)
+
+    counts = np.zeros(len(products), dtype=np.float64)
+    for name, count in popularity.items():
+        counts[product_ids[name]] = count
+    counts += np.asarray(matrix.sum(axis=0)).ravel()
+    popular = np.argsort(-counts, kind="stable").astype(np.int32)[:max(k * 5, 100)]
+
+    # Filas del historial en el orden de los uid, para ubicarlas con búsqueda binaria
+    keys = [uid.encode() for uid in user_ids]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    history = matrix[order].tocsr() if order else matrix.tocsr()
+    history.sort_indices()
+    return build_buffer(products, neighbors, scores, popular, [keys[i] for i in order],
+                        history.indptr, history.indices)
+
+
+class Recommender:
+    """
+    Mantiene el índice vigente; ``rebuild`` lo reemplaza de forma atómica. Con
+    ``RECOMMENDATIONS_SHARED_PATH`` solo lo construye el proceso con el lock del
+    archivo y el resto sirve lo publicado, también después de reiniciarse.
+    """
+
+    def __init__(self, db, k=DEFAULT_TOP_K, shared_path=None):
+        self._db = db
+        self._k = k
+        self.shared_path = shared_path or os.getenv("RECOMMENDATIONS_SHARED_PATH") or None
+        self._reader = SharedSnapshotReader(self.shared_path, RecommendationIndex, check_interval=1.0) \
+            if self.shared_path else None
+        self._publisher = PublisherLock(self.shared_path) if self.shared_path else None
+        self._lock = threading.Lock()
+        self._index = None
+
+    @property
+    def index(self):
+        if self._reader is not None:
+            return self._reader.get()
+        return self._index
+
+    def rebuild(self):
+        """Construye el índice; con archivo compartido, solo si este proceso es el publicador."""
+        if self._publisher is not None and not self._publisher.held():
+            return None
+        user_orders, popularity = load_orders(self._db)
+        buffer = build_index(user_orders, popularity, self._k)
+        if self._publisher is not None:
+            publish(self.shared_path, buffer)
+            self._reader.recheck()
+            return self._reader.get()
+        index = RecommendationIndex(buffer)
+        with self._lock:
+            self._index = index
+        return index
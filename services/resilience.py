@@ -0,0 +1,372 @@
+"""
+Deadlines, circuit breaker por colección y respuestas de respaldo cuando Firestore falla.
+
+Cada llamada del cliente instrumentado (``firestore_metrics``) pasa por
+``FirestoreCall``:
+
+* Deadline: las llamadas puntuales llevan ``timeout=FIRESTORE_CALL_TIMEOUT`` y
+  las consultas ``FIRESTORE_STREAM_TIMEOUT``; dentro de un request todas quedan
+  acotadas además por lo que le resta (``FIRESTORE_REQUEST_DEADLINE`` desde que
+  llegó, hasta que se empieza a enviar la respuesta, para no cortar las
+  exportaciones en streaming). Los reintentos del cliente respetan ese tiempo.
+  Fuera de un request (jobs) las consultas no tienen deadline.
+* Circuit breaker por colección: ``FIRESTORE_BREAKER_FAILURES`` fallas seguidas
+  (timeouts, ``Unavailable``, errores internos) abren el circuito y las llamadas
+  a esa colección fallan de inmediato durante ``FIRESTORE_BREAKER_RESET``
+  segundos; después pasa una sola llamada de prueba y, si responde, se cierra.
+
+Las fallas se lanzan como ``FirestoreUnavailable`` y quedan anotadas en el
+request. ``ResilienceMiddleware`` guarda la última respuesta 200 de cada GET y,
+si el request termina en error por una falla de Firestore, la devuelve con
+``X-Cache-Status: stale`` y ``Age``; si no hay respaldo (o no es un GET)
+responde 503 con ``Retry-After`` en lugar del mensaje crudo de la excepción.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from fastapi.responses import JSONResponse
+from google.api_core import exceptions as gexc
+from google.api_core.retry import Retry, if_exception_type
+
+# FIRESTORE_GUARD=0 deja las llamadas a Firestore sin deadline ni circuit breaker
+ENABLED = os.getenv("FIRESTORE_GUARD", "1") != "0"
+CALL_TIMEOUT = float(os.getenv("FIRESTORE_CALL_TIMEOUT", "5"))
+STREAM_TIMEOUT = float(os.getenv("FIRESTORE_STREAM_TIMEOUT", "20"))
+REQUEST_DEADLINE = float(os.getenv("FIRESTORE_REQUEST_DEADLINE", "30"))
+BREAKER_FAILURES = int(os.getenv("FIRESTORE_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("FIRESTORE_BREAKER_RESET", "10"))
+STALE_MAX_ENTRY_BYTES = int(os.getenv("STALE_CACHE_MAX_ENTRY_BYTES", str(1 << 20)))
+STALE_MAX_BYTES = int(os.getenv("STALE_CACHE_MAX_BYTES", str(64 << 20)))
+STALE_MAX_AGE = float(os.getenv("STALE_CACHE_MAX_AGE", "86400"))
+
+# Rutas de larga duración que no se guardan ni se reemplazan
+EXEMPT_PATHS = {"/metrics", "/restaurants/stream"}
+# GET que escriben (descontar stock, cancelar pedidos): nunca se responden con un respaldo
+WRITE_GET_PREFIXES = ("/order/",)
+WRITE_GET_MARKERS = ("/cancel/",)
+
+# Errores que indican que Firestore no está respondiendo (no los de datos o permisos)
+TRANSIENT_ERRORS = (
+    gexc.DeadlineExceeded, gexc.ServiceUnavailable, gexc.InternalServerError,
+    gexc.ResourceExhausted, gexc.Unknown, TimeoutError, ConnectionError,
+)
+# Los mismos códigos que reintenta por defecto el cliente de Firestore
+READ_RETRY = if_exception_type(gexc.DeadlineExceeded, gexc.InternalServerError,
+                               gexc.ResourceExhausted, gexc.ServiceUnavailable)
+WRITE_RETRY = if_exception_type(gexc.ResourceExhausted, gexc.ServiceUnavailable)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class FirestoreUnavailable(Exception):
+    def __init__(self, collection, reason, retry_after=1):
+        super().__init__(f"Firestore no disponible para '{collection}' ({reason})")
+        self.collection = collection
+        self.reason = reason  # "circuit_open", "deadline" o "error"
+        self.retry_after = retry_after
+
+
+class RequestState:
+    def __init__(self, deadline):
+        self.deadline = deadline  # time.monotonic() límite para las llamadas del request, o None
+        self.failure = None  # primera FirestoreUnavailable del request
+        self.stale_age = None  # segundos, si la respuesta sale de un respaldo
+
+
+_request_state = ContextVar("firestore_request_state", default=None)
+
+
+def _note_failure(error):
+    state = _request_state.get()
+    if state is not None and state.failure is None:
+        state.failure = error
+    return error
+
+
+def mark_stale(age):
+    """Anota que el request responde con datos de un respaldo de ``age`` segundos."""
+    state = _request_state.get()
+    if state is not None:
+        state.stale_age = max(state.stale_age or 0.0, age)
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or BREAKER_FAILURES
+        self.reset_timeout = reset_timeout or BREAKER_RESET
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.stats = {"failures": 0, "rejected": 0, "opened": 0}
+
+    def retry_after(self):
+        return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+
+    def before_call(self):
+        """Lanza ``FirestoreUnavailable`` si el circuito no deja pasar la llamada."""
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probe_started = None
+            # Una sola llamada de prueba a la vez; si nunca terminó, se permite otra
+            if self.state == HALF_OPEN and (self.probe_started is None
+                                            or now - self.probe_started >= self.reset_timeout):
+                self.probe_started = now
+                return
+            self.stats["rejected"] += 1
+        raise _note_failure(FirestoreUnavailable(self.name, "circuit_open", self.retry_after()))
+
+    def on_success(self):
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_started = None
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.stats["failures"] += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probe_started = None
+                self.stats["opened"] += 1
+
+
+_breakers_lock = threading.Lock()
+_breakers = {}  # {colección: CircuitBreaker}
+
+
+def breaker_for(collection):
+    breaker = _breakers.get(collection)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(collection, CircuitBreaker(collection))
+    return breaker
+
+
+class FirestoreCall:
+    """
+    Contexto de una llamada (o de un ``stream``) a ``collection``: convierte las fallas
+    de Firestore en ``FirestoreUnavailable`` y las cuenta en el breaker. Puede usarse
+    varias veces, una por documento del stream.
+    """
+
+    def __init__(self, collection, kwargs, write=False, stream=False):
+        self.collection = collection
+        self.deadline = None
+        if not ENABLED:
+            self.breaker = None
+            return
+        self.breaker = breaker_for(collection)
+
+        state = _request_state.get()
+        remaining = state.deadline - time.monotonic() if state is not None and state.deadline else None
+        if remaining is not None and remaining <= 0:
+            raise _note_failure(FirestoreUnavailable(collection, "deadline"))
+        # Un stream completo es un solo RPC; los de los jobs pueden recorrer colecciones enteras
+        timeout = STREAM_TIMEOUT if stream else CALL_TIMEOUT
+        if stream and state is None:
+            timeout = None
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        self.breaker.before_call()
+
+        if timeout is not None:
+            self.deadline = time.monotonic() + timeout
+            kwargs.setdefault("timeout", timeout)
+            kwargs.setdefault("retry", Retry(predicate=WRITE_RETRY if write else READ_RETRY,
+                                             initial=0.1, maximum=1.0, timeout=timeout))
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise FirestoreUnavailable(self.collection, "deadline")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.breaker is None:
+            return False
+        if exc_type is None or issubclass(exc_type, StopIteration):
+            self.breaker.on_success()
+            return False
+        if not issubclass(exc_type, Exception):
+            # Stream abandonado (GeneratorExit) o interrupción: no dice nada de Firestore
+            return False
+        if isinstance(exc, FirestoreUnavailable):
+            self.breaker.on_failure()
+            _note_failure(exc)
+            return False
+        if isinstance(exc, TRANSIENT_ERRORS):
+            self.breaker.on_failure()
+            reason = "deadline" if isinstance(exc, (gexc.DeadlineExceeded, TimeoutError)) else "error"
+            raise _note_failure(FirestoreUnavailable(self.collection, reason)) from exc
+        # Firestore respondió (documento inexistente, índice faltante...): no es una caída
+        self.breaker.on_success()
+        return False
+
+
+class StaleCache:
+    """Últimas respuestas 200 de los GET, acotadas por tamaño (LRU)."""
+
+    def __init__(self, max_bytes=None, max_entry_bytes=None, max_age=None):
+        self.max_bytes = max_bytes or STALE_MAX_BYTES
+        self.max_entry_bytes = max_entry_bytes or STALE_MAX_ENTRY_BYTES
+        self.max_age = max_age or STALE_MAX_AGE
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {clave: (guardado, headers, body)}
+        self.nbytes = 0
+        self.stats = {"stale": 0, "unavailable": 0}  # respuestas de respaldo entregadas
+
+    def put(self, key, headers, body):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= len(previous[2])
+            self._entries[key] = (time.time(), headers, body)
+            self.nbytes += len(body)
+            while self.nbytes > self.max_bytes and self._entries:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _is_write(scope):
+    path = scope["path"]
+    return (scope["method"] != "GET" or path.startswith(WRITE_GET_PREFIXES)
+            or any(marker in path for marker in WRITE_GET_MARKERS))
+
+
+def _cache_key(scope):
+    headers = dict(scope.get("headers") or [])
+    # Las respuestas que dependen del usuario autenticado no se comparten entre usuarios
+    return scope["path"], scope.get("query_string", b""), headers.get(b"authorization")
+
+
+class ResilienceMiddleware:
+    """
+    Middleware ASGI: fija el deadline de cada request, guarda las respuestas buenas de los
+    GET y reemplaza las respuestas de error causadas por Firestore con el último respaldo
+    (o con un 503 limpio).
+    """
+
+    def __init__(self, app, cache=None):
+        self.app = app
+        self.cache = cache if cache is not None else StaleCache()
+
+    async def _fallback(self, scope, receive, send, key, failure):
+        entry = self.cache.get(key) if key is not None else None
+        if entry is not None:
+            saved_at, headers, body = entry
+            self.cache.stats["stale"] += 1
+            await send({"type": "http.response.start", "status": 200, "headers": headers + [
+                (b"x-cache-status", b"stale"),
+                (b"age", str(int(time.time() - saved_at)).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        self.cache.stats["unavailable"] += 1
+        response = JSONResponse(
+            {"detail": "El servicio de datos no está disponible, intenta más tarde",
+             "reason": failure.reason, "collection": failure.collection},
+            status_code=503,
+            headers={"Retry-After": str(failure.retry_after)},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        state = RequestState(time.monotonic() + REQUEST_DEADLINE)
+        token = _request_state.set(state)
+        key = None if _is_write(scope) else _cache_key(scope)
+        progress = {"started": False, "replaced": False}
+        captured = {"headers": None, "parts": [], "size": 0}
+
+        async def guarded_send(message):
+            if message["type"] == "http.response.start":
+                if message["status"] >= 500 and state.failure is not None:
+                    progress["replaced"] = True
+                    await self._fallback(scope, receive, send, key, state.failure)
+                    return
+                progress["started"] = True
+                # El cuerpo en streaming (exportaciones) solo queda acotado por llamada
+                state.deadline = None
+                if state.stale_age is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-cache-status", b"stale"), (b"age", str(int(state.stale_age)).encode())]
+                elif key is not None and message["status"] == 200:
+                    captured["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                if progress["replaced"]:
+                    return
+                if captured["headers"] is not None:
+                    body = message.get("body", b"")
+                    captured["size"] += len(body)
+                    if captured["size"] > self.cache.max_entry_bytes:
+                        # Respuestas grandes (catálogo completo, exportaciones) no se copian
+                        captured["headers"] = None
+                        captured["parts"] = []
+                    else:
+                        captured["parts"].append(bytes(body))
+                        if not message.get("more_body", False):
+                            self.cache.put(key, captured["headers"], b"".join(captured["parts"]))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, guarded_send)
+        except Exception:
+            if state.failure is None or progress["started"] or progress["replaced"]:
+                raise
+            await self._fallback(scope, receive, send, key, state.failure)
+        finally:
+            _request_state.reset(token)
+
+
+def render_metrics(cache):
+    """Estado de los circuit breakers y respuestas de respaldo de ``cache`` en formato Prometheus."""
+    with _breakers_lock:
+        breakers = sorted(_breakers.items())
+    lines = ["# HELP backend_firestore_breaker_open Circuit breaker abierto (1) o no (0) por colección",
+             "# TYPE backend_firestore_breaker_open gauge"]
+    lines += [f'backend_firestore_breaker_open{{collection="{name}"}} {int(b.state != CLOSED)}'
+              for name, b in breakers]
+    counters = [
+        ("backend_firestore_breaker_failures_total", "failures", "Fallas de Firestore contadas por el breaker"),
+        ("backend_firestore_breaker_rejected_total", "rejected", "Llamadas rechazadas con el circuito abierto"),
+        ("backend_firestore_breaker_opened_total", "opened", "Veces que se abrió el circuito"),
+    ]
+    for name, field, help_text in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{collection="{collection}"}} {b.stats[field]}' for collection, b in breakers]
+    lines += ["# HELP backend_fallback_responses_total Respuestas de respaldo por fallas de Firestore",
+              "# TYPE backend_fallback_responses_total counter"]
+    lines += [f'backend_fallback_responses_total{{kind="{kind}"}} {value}' for kind, value in cache.stats.items()]
+    lines += ["# HELP backend_stale_cache_bytes Bytes guardados como respaldo",
+              "# TYPE backend_stale_cache_bytes gauge",
+              f"backend_stale_cache_bytes {cache.nbytes}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,182 @@
+"""
+Snapshots mensuales de analíticas por restaurante.
+
+``refresh_snapshots`` materializa en ``restaurant_analytics/{restaurante}_{YYYY-MM}``
+las visitas (``restaurant_visits``), pedidos (``orders_product``) y
+cancelaciones (``users/*/orders``) de cada restaurante, con el detalle por día.
+Solo recalcula los días desde la última corrida (guardada en
+``analytics_jobs/restaurant_snapshots``); los días anteriores se conservan tal
+como están en el snapshot.
+
+``cancelledAt`` puede estar guardado como texto ISO o como Timestamp, y un
+filtro de rango de Firestore solo encuentra valores del mismo tipo que su
+límite: la corrida incremental consulta cada tipo con su propio límite. Todas
+las cancelaciones se cuentan en el día local (``ANALYTICS_TIMEZONE``).
+"""
+import itertools
+from collections import defaultdict
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from services.date_ranges import DateRange, day_bucket
+from services.heatmap import DEFAULT_TIMEZONE
+
+SNAPSHOTS_COLLECTION = "restaurant_analytics"
+STATE_COLLECTION = "analytics_jobs"
+STATE_DOCUMENT = "restaurant_snapshots"
+BATCH_SIZE = 500
+FIGURES = ("visits", "orders", "cancellations")
+
+
+def restaurant_key(name):
+    # Misma normalización que usa la ruta de decrease-stock; "/" no vale en un id de documento
+    return name.replace(" ", "").lower().replace("/", "_")
+
+
+def snapshot_id(name, month):
+    return f"{restaurant_key(name)}_{month}"
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _day(value, zone=None):
+    """Día local 'YYYY-MM-DD' de un ``cancelledAt`` guardado como texto ISO o como Timestamp de Firestore."""
+    zone = zone or ZoneInfo(DEFAULT_TIMEZONE)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    # El texto sin zona ya está en hora local, como lo guarda la app
+    return (value.astimezone(zone) if value.tzinfo else value).strftime("%Y-%m-%d")
+
+
+def _cancellations(db, since):
+    """Cancelaciones con ``cancelledAt`` desde el día local ``since`` (todas si es None)."""
+    cancelled = db.collection_group("orders").where("status", "==", "cancelled")
+    if not since:
+        return cancelled.stream()
+    start = date.fromisoformat(since)
+    # Timestamps: límite en la medianoche local. Texto: con un día de margen, porque "...Z" o
+    # "+hh:mm" puede caer en otro día local que su fecha escrita; el día exacto se filtra al contar
+    period = DateRange(start=start)
+    timestamps = period.filter_timestamp_field(cancelled, "cancelledAt")
+    texts = period.filter_local_iso_field(cancelled, "cancelledAt")
+    return itertools.chain(timestamps.stream(), texts.stream())
+
+
+def _daily_documents(db, collection, since):
+    start = date.fromisoformat(since) if since else None
+    return DateRange(start=start).daily_documents(db.collection(collection)).stream()
+
+
+def _catalog(db):
+    """{restaurant_key: nombre} y {nombre de producto: restaurant_key}."""
+    restaurants = {}
+    product_owner = {}
+    for doc in db.collection("retaurants").stream():
+        data = doc.to_dict()
+        name = data.get("name")
+        if not name:
+            continue
+        key = restaurant_key(name)
+        restaurants[key] = name
+        for product in data.get("products", []):
+            if product.get("productName"):
+                product_owner[product["productName"]] = key
+    return restaurants, product_owner
+
+
+def _empty_day():
+    return {figure: 0 for figure in FIGURES}
+
+
+def compute_daily_figures(db, since=None):
+    """{restaurant_key: {día: {visits, orders, cancellations}}} para los días >= ``since``."""
+    restaurants, product_owner = _catalog(db)
+    daily = defaultdict(lambda: defaultdict(_empty_day))
+
+    for doc in _daily_documents(db, "restaurant_visits", since):
+        bucket = day_bucket(doc.id)
+        if bucket is None:
+            continue
+        for name, visits in doc.to_dict().items():
+            if name == "last_visited_by":
+                continue
+            daily[restaurant_key(name)][bucket[0]]["visits"] += _to_int(visits)
+
+    for doc in _daily_documents(db, "orders_product", since):
+        bucket = day_bucket(doc.id)
+        if bucket is None:
+            continue
+        for product_name, count in doc.to_dict().items():
+            key = product_owner.get(product_name)
+            if key:
+                daily[key][bucket[0]]["orders"] += _to_int(count)
+
+    zone = ZoneInfo(DEFAULT_TIMEZONE)
+    for doc in _cancellations(db, since):
+        data = doc.to_dict()
+        key = product_owner.get(data.get("productName"))
+        day = _day(data.get("cancelledAt"), zone)
+        # Los días anteriores a `since` se conservan del snapshot: no se cuentan a medias
+        if key and day and (not since or day >= since):
+            daily[key][day]["cancellations"] += 1
+
+    return restaurants, daily
+
+
+def refresh_snapshots(db, now=None):
+    """Recalcula los snapshots afectados por los días que cambiaron desde la última corrida."""
+    now = now or datetime.now()
+    state_ref = db.collection(STATE_COLLECTION).document(STATE_DOCUMENT)
+    state = state_ref.get()
+    since = state.to_dict().get("last_run_day") if state.exists else None
+
+    restaurants, daily = compute_daily_figures(db, since)
+
+    # Agrupar los días recalculados por snapshot (restaurante, mes)
+    updates = defaultdict(dict)
+    for key, days in daily.items():
+        for day, figures in days.items():
+            updates[(key, day[:7])][day] = figures
+
+    snapshots = db.collection(SNAPSHOTS_COLLECTION)
+    refs = {target: snapshots.document(f"{target[0]}_{target[1]}") for target in updates}
+    existing = {snap.id: snap.to_dict() for snap in db.get_all(list(refs.values())) if snap.exists}
+
+    batch = db.batch()
+    pending = 0
+    for (key, month), days in updates.items():
+        ref = refs[(key, month)]
+        previous = existing.get(ref.id, {}).get("daily", {})
+        merged = {day: figures for day, figures in previous.items() if not since or day < since}
+        merged.update(days)
+
+        totals = {figure: sum(day[figure] for day in merged.values()) for figure in FIGURES}
+        batch.set(ref, {
+            "restaurant": restaurants.get(key, key),
+            "month": month,
+            **totals,
+            "cancellation_rate": round(totals["cancellations"] / totals["orders"] * 100, 2)
+            if totals["orders"] else 0,
+            "daily": merged,
+            "updated_at": now,
+        })
+        pending += 1
+        if pending == BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    # El día de hoy sigue cambiando: la próxima corrida vuelve a empezar desde él
+    batch.set(state_ref, {"last_run_day": now.strftime("%Y-%m-%d"), "updated_at": now})
+    batch.commit()
+    return len(updates)
@@ -0,0 +1,66 @@
+"""
+Tareas periódicas dentro del proceso.
+
+Cada router declara sus ``PeriodicJob`` y los arranca con
+``APIRouter(lifespan=lifespan_for(jobs))``; así solo corren los jobs de los
+routers que efectivamente se montan. Con varios workers se puede dejar un solo
+proceso a cargo con ``ENABLE_SCHEDULED_JOBS=0`` en el resto; los jobs con
+``every_worker=True`` (vaciar buffers que viven en memoria de cada proceso)
+corren igual en todos los workers.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+class PeriodicJob:
+    def __init__(self, name, interval, func, on_shutdown=None, every_worker=False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.on_shutdown = on_shutdown
+        self.every_worker = every_worker
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+    def run_once(self):
+        start = time.perf_counter()
+        try:
+            self.func()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠ Error en el job {self.name}: {str(e)}")
+        finally:
+            self.last_run = time.time()
+            self.last_duration = time.perf_counter() - start
+
+    async def loop(self):
+        while True:
+            await asyncio.to_thread(self.run_once)
+            await asyncio.sleep(self.interval)
+
+
+def jobs_enabled():
+    return os.getenv("ENABLE_SCHEDULED_JOBS", "1") not in ("0", "false", "False")
+
+
+def lifespan_for(jobs):
+    """Lifespan que corre ``jobs`` en segundo plano mientras la app está arriba."""
+
+    @asynccontextmanager
+    async def lifespan(app):
+        enabled = jobs_enabled()
+        tasks = [asyncio.create_task(job.loop()) for job in jobs if enabled or job.every_worker]
+        try:
+            yield
+        finally:
+            for task in tasks:
+                task.cancel()
+            for job in jobs:
+                if job.on_shutdown is not None:
+                    await asyncio.to_thread(job.on_shutdown)
+
+    return lifespan
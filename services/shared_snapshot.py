@@ -0,0 +1,77 @@
+"""
+Snapshots inmutables compartidos entre workers a través de un archivo.
+
+Un solo proceso, el que obtiene el lock exclusivo de ``{path}.lock``, escribe
+cada generación en un archivo temporal y lo reemplaza con ``os.replace``. Los
+demás mapean el archivo con ``mmap`` y pasan a la generación nueva cuando cambia
+el inodo; las páginas son compartidas, así que la memoria no crece con la
+cantidad de workers. Lo usan el catálogo (``catalog_cache``) y el índice de
+recomendaciones (``recommendations``).
+"""
+import fcntl
+import mmap
+import os
+import threading
+import time
+
+
+class SharedSnapshotReader:
+    """Mapea el archivo publicado y cambia de generación cuando se reemplaza."""
+
+    def __init__(self, path, factory, check_interval=0.2):
+        self._path = path
+        self._factory = factory  # buffer -> snapshot
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._identity = None
+        self._checked_at = 0.0
+
+    def get(self):
+        """Snapshot mapeado vigente, o None si todavía no se publicó ninguno."""
+        if time.monotonic() - self._checked_at < self._check_interval:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self._path)
+            except FileNotFoundError:
+                return self._snapshot
+            identity = (stat.st_ino, stat.st_mtime_ns)
+            if identity != self._identity:
+                with open(self._path, "rb") as file:
+                    mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                # La generación anterior sigue mapeada mientras algún request la use
+                self._snapshot = self._factory(mapped)
+                self._identity = identity
+        return self._snapshot
+
+    def recheck(self):
+        self._checked_at = 0.0
+
+
+class PublisherLock:
+    """Lock exclusivo de ``{path}.lock``; el proceso que lo obtiene lo conserva mientras viva."""
+
+    def __init__(self, path):
+        self._path = path + ".lock"
+        self._file = None
+
+    def held(self):
+        if self._file is None:
+            lock_file = open(self._path, "ab")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            self._file = lock_file
+        return True
+
+
+def publish(path, buffer):
+    """Reemplaza el archivo de forma atómica: los lectores ven la generación anterior o la nueva."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(buffer)
+    os.replace(temporary, path)
@@ -0,0 +1,167 @@
+"""
+Difusión por Server-Sent Events de los cambios de stock del catálogo.
+
+Los cambios salen del catálogo (``source``, p. ej. ``CatalogCache.get``), no de
+las rutas: en cada intervalo el broadcaster compara la generación vigente con la
+última que vio (``CatalogSnapshot.stock_changes``) y publica los productos cuyo
+stock o disponibilidad cambió. Así cada worker difunde también las escrituras
+hechas en otros workers, siempre que todos lean la misma generación: con varios
+workers hay que configurar ``CATALOG_SHARED_PATH``; sin él cada worker ve los
+cambios de los demás recién cuando vence su ``CATALOG_CACHE_TTL``. Solo producen
+cambios las escrituras sobre la colección del catálogo.
+
+Los cambios se combinan por producto (solo se envía el último valor de cada uno)
+y cada ``STOCK_STREAM_INTERVAL`` segundos se codifica un único frame SSE con
+todos los cambios pendientes, que se entrega a todos los clientes conectados:
+el costo por cliente es encolar los mismos bytes. Un cliente que no alcanza a
+leer (cola llena) recibe ``event: resync`` y se desconecta; debe volver a pedir
+``/restaurants`` y reconectarse.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+import orjson
+
+HEARTBEAT = b": ping\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+class _Subscriber:
+    __slots__ = ("queue", "lagging")
+
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.lagging = False
+
+
+class StockBroadcaster:
+    def __init__(self, source=None, interval=None, queue_size=None, heartbeat=15.0):
+        self._source = source  # () -> generación vigente del catálogo
+        self._seen = None
+        self._interval = interval if interval is not None else float(os.getenv("STOCK_STREAM_INTERVAL", "0.25"))
+        self._queue_size = queue_size or int(os.getenv("STOCK_STREAM_QUEUE_SIZE", "64"))
+        self._heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._pending = {}  # {productId: último cambio}
+        self._subscribers = set()
+        self._task = None
+        self._sequence = 0
+        self.stats = {"published": 0, "frames": 0, "deltas_sent": 0, "resyncs": 0}
+
+    @property
+    def clients(self):
+        return len(self._subscribers)
+
+    def publish(self, restaurant_id, product):
+        """Registra el nuevo stock de un producto; se puede llamar desde cualquier hilo."""
+        if not self._subscribers:
+            return
+        delta = {
+            "productId": product.get("productId"),
+            "restaurantId": restaurant_id,
+            "amount": product.get("amount"),
+            "available": product.get("available"),
+        }
+        with self._lock:
+            self._pending[delta["productId"]] = delta
+            self.stats["published"] += 1
+
+    def _poll(self):
+        """Publica los cambios de stock entre la última generación vista y la vigente."""
+        try:
+            snapshot = self._source()
+        except Exception as e:
+            print(f"⚠ No se pudo leer el catálogo para el stream de stock: {str(e)}")
+            return
+        previous, self._seen = self._seen, snapshot
+        if previous is None or snapshot is previous:
+            return
+        for restaurant_id, product in snapshot.stock_changes(previous):
+            self.publish(restaurant_id, product)
+
+    def _take_frame(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return None
+        self._sequence += 1
+        self.stats["frames"] += 1
+        self.stats["deltas_sent"] += len(pending)
+        return b"id: %d\nevent: stock\ndata: %s\n\n" % (self._sequence, orjson.dumps(list(pending.values())))
+
+    def _broadcast(self, frame):
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                subscriber.lagging = True
+                self._subscribers.discard(subscriber)
+                self.stats["resyncs"] += 1
+
+    async def _run(self):
+        last_sent = time.monotonic()
+        try:
+            if self._source is not None:
+                # Generación de referencia: los clientes ya tienen este estado por /restaurants
+                await asyncio.to_thread(self._poll)
+            while self._subscribers:
+                await asyncio.sleep(self._interval)
+                if self._source is not None:
+                    # Puede recargar el catálogo desde Firestore: fuera del event loop
+                    await asyncio.to_thread(self._poll)
+                frame = self._take_frame()
+                if frame is None and time.monotonic() - last_sent >= self._heartbeat:
+                    frame = HEARTBEAT
+                if frame is not None:
+                    self._broadcast(frame)
+                    last_sent = time.monotonic()
+        finally:
+            self._task = None
+            self._seen = None
+            with self._lock:
+                self._pending = {}
+
+    def subscribe(self):
+        subscriber = _Subscriber(self._queue_size)
+        self._subscribers.add(subscriber)
+        if self._task is None:
+            # Contexto propio: el task sobrevive al request que lo creó y no debe heredar su
+            # plazo de Firestore ni sumar sus lecturas al costo de ese request
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def stream(self):
+        """Generador de bytes SSE para un cliente; se desuscribe al desconectarse."""
+        subscriber = self.subscribe()
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                frame = await subscriber.queue.get()
+                if subscriber.lagging:
+                    yield RESYNC
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def render_metrics(self):
+        """Métricas del stream en formato de texto de Prometheus."""
+        lines = [
+            "# HELP backend_stock_stream_clients Clientes conectados a /restaurants/stream",
+            "# TYPE backend_stock_stream_clients gauge",
+            f"backend_stock_stream_clients {self.clients}",
+        ]
+        for name, field, help_text in (
+            ("backend_stock_stream_published_total", "published", "Cambios de stock publicados"),
+            ("backend_stock_stream_frames_total", "frames", "Frames SSE enviados"),
+            ("backend_stock_stream_deltas_sent_total", "deltas_sent", "Cambios enviados tras combinar por producto"),
+            ("backend_stock_stream_resyncs_total", "resyncs", "Clientes desconectados por no alcanzar a leer"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {self.stats[field]:g}"]
+        return "\n".join(lines) + "\n"